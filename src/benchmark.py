@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the preprocessing pipeline.
+
+Each benchmark times the current implementation against the row-wise
+version it replaced, on synthetic data, and reports seconds per million rows.
+`notebook_02` runs the notebook 02 feature engineers against their
+feature_engineering.py ports.
+`--online N` instead reports per-record latency percentiles of the online
+transformer against preprocess_data on one-row frames, over N records of
+the sample extract.
+
+Usage:
+    python benchmark.py [--rows N] [--repeat R] [--only NAME ...] [--online N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import CONFIG, SEASON_BY_MONTH, HealthcarePreprocessor
+from utils.logger import configure_logging
+
+# Registered benchmarks: name -> function(rows) -> {label: callable}
+BENCHMARKS: Dict[str, Callable[[int], Dict[str, Callable[[], object]]]] = {}
+
+
+def benchmark(name: str):
+    """Register a benchmark under `name`."""
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Best-of-`repeat` wall time of `fn` in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# ---------------------------------------------------------------------------
+# Legacy row-wise implementations kept for comparison
+# ---------------------------------------------------------------------------
+
+def legacy_group_rare(series: pd.Series, top_n: int = 10) -> pd.Series:
+    """Per-row `apply` version of HealthcarePreprocessor._group_rare."""
+    top_values = series.value_counts().nlargest(top_n).index
+    return series.apply(lambda x: x if x in top_values else 'Other')
+
+
+def legacy_get_season(m):
+    """Per-row branch version of HealthcarePreprocessor._get_season."""
+    if pd.isna(m):
+        return 'unknown'
+    if m in [5, 6, 7, 8, 9]:
+        return 'hot'
+    elif m in [10, 11, 3, 4]:
+        return 'warm'
+    else:
+        return 'mild'
+
+
+class NotebookFeatures:
+    """The notebook 02 feature engineers (without their printouts) that feature_engineering.py replaced."""
+
+    HIGH_RISK_DEPARTMENTS = [
+        'OBSTETRICS and GYNAECOLOGY', 'DERMATOLOGY', 'PAEDIATRICS',
+        'ORTHOPAEDIC', 'E.N.T', 'CARDIOLOGY'
+    ]
+
+    @staticmethod
+    def temporal(df: pd.DataFrame, hour_col: str = 'book_hour') -> pd.DataFrame:
+        df = df.copy()
+        if hour_col in df.columns:
+            df['odd_hour_flag'] = ((df[hour_col] < 8) | (df[hour_col] > 20)).astype(int)
+
+            def get_part_of_day(hour):
+                if pd.isna(hour):
+                    return 'unknown'
+                elif 6 <= hour < 12:
+                    return 'morning'
+                elif 12 <= hour < 17:
+                    return 'afternoon'
+                elif 17 <= hour < 21:
+                    return 'evening'
+                else:
+                    return 'night'
+
+            df['part_of_day'] = df[hour_col].apply(get_part_of_day)
+        df = df.copy()
+
+        def bin_lead_days(days):
+            if pd.isna(days):
+                return 'unknown'
+            elif days == 0:
+                return 'Same Day'
+            elif days == 1:
+                return '1 Day'
+            elif 2 <= days <= 3:
+                return '2-3 Days'
+            elif 4 <= days <= 7:
+                return '4-7 Days'
+            elif 8 <= days <= 30:
+                return '8-30 Days'
+            elif 31 <= days <= 90:
+                return '31-90 Days'
+            else:
+                return '90+ Days'
+
+        def bin_lead_hours(hours):
+            if pd.isna(hours):
+                return 'unknown'
+            elif hours < 1:
+                return '<1hr'
+            elif 1 <= hours < 6:
+                return '1-6hr'
+            elif 6 <= hours < 12:
+                return '6-12hr'
+            elif 12 <= hours < 24:
+                return '12-24hr'
+            elif 24 <= hours < 72:
+                return '1-3d'
+            elif 72 <= hours < 168:
+                return '3-7d'
+            else:
+                return '7d+'
+
+        if 'lead_days' in df.columns:
+            df['lead_days_bin'] = df['lead_days'].apply(bin_lead_days)
+        if 'lead_hours' in df.columns:
+            df['lead_hours_bin'] = df['lead_hours'].apply(bin_lead_hours)
+        return df
+
+    @staticmethod
+    def location(df: pd.DataFrame, location_col: str = 'Location_cleaned', top_n: int = 20,
+                 distance_col: str = 'distance_to_branch') -> pd.DataFrame:
+        df = df.copy()
+        if location_col in df.columns:
+            top_locations = df[location_col].value_counts().head(top_n).index.tolist()
+            df[f'Location_top{top_n}'] = df[location_col].apply(
+                lambda x: x if x in top_locations else 'Other'
+            )
+        df = df.copy()
+        if distance_col in df.columns:
+            distance_quantiles = df[distance_col].quantile([0.25, 0.5, 0.75])
+
+            def bin_distance(distance):
+                if pd.isna(distance):
+                    return 'unknown'
+                elif distance <= distance_quantiles[0.25]:
+                    return 'Near'
+                elif distance <= distance_quantiles[0.5]:
+                    return 'Mid'
+                elif distance <= distance_quantiles[0.75]:
+                    return 'Far'
+                else:
+                    return 'Very Far'
+
+            df['distance_bin'] = df[distance_col].apply(bin_distance)
+            df['is_local'] = (df[distance_col] <= distance_quantiles[0.25]).astype(int)
+            df['is_remote'] = (df[distance_col] > distance_quantiles[0.75]).astype(int)
+        return df
+
+    @staticmethod
+    def department(df: pd.DataFrame, dept_col: str = 'Department', threshold: int = 3000) -> pd.DataFrame:
+        df = df.copy()
+        if dept_col in df.columns:
+            dept_counts = df[dept_col].value_counts()
+            small_departments = dept_counts[dept_counts < threshold].index
+            df['Department_grouped'] = df[dept_col].apply(
+                lambda x: 'OTHERS' if x in small_departments else x
+            )
+            df['Department_risk'] = df['Department_grouped'].apply(
+                lambda x: 'High Risk' if x in NotebookFeatures.HIGH_RISK_DEPARTMENTS else 'Routine'
+            )
+
+            def categorize_department(dept):
+                if pd.isna(dept) or dept == 'OTHERS':
+                    return 'Other'
+                elif dept in ['OBSTETRICS and GYNAECOLOGY', 'PAEDIATRICS']:
+                    return 'Family Care'
+                elif dept in ['CARDIOLOGY', 'ORTHOPAEDIC']:
+                    return 'Specialty Care'
+                elif dept in ['DERMATOLOGY', 'E.N.T']:
+                    return 'Outpatient Specialty'
+                else:
+                    return 'General'
+
+            df['Department_category'] = df['Department_grouped'].apply(categorize_department)
+        return df
+
+    @staticmethod
+    def demographic(df: pd.DataFrame, nationality_col: str = 'Nationality_grouped',
+                    visa_col: str = 'VisaCategory') -> pd.DataFrame:
+        df = df.copy()
+        if nationality_col in df.columns:
+            def group_nationality_by_region(nationality):
+                if pd.isna(nationality):
+                    return 'Other'
+                nationality = str(nationality).upper()
+                if any(keyword in nationality for keyword in ['UAE', 'EMIRATI', 'UNITED ARAB']):
+                    return 'UAE'
+                elif any(keyword in nationality for keyword in
+                         ['INDIA', 'PAKISTAN', 'BANGLADESH', 'SRI LANKA', 'NEPAL', 'BHUTAN']):
+                    return 'South Asia'
+                elif any(keyword in nationality for keyword in
+                         ['EGYPT', 'JORDAN', 'SYRIA', 'LEBANON', 'IRAQ', 'SAUDI', 'KUWAIT',
+                          'OMAN', 'QATAR', 'BAHRAIN', 'YEMEN']):
+                    return 'Arab'
+                elif any(keyword in nationality for keyword in
+                         ['USA', 'UK', 'CANADA', 'AUSTRALIA', 'GERMANY', 'FRANCE', 'ITALY',
+                          'SPAIN', 'NETHERLANDS', 'SWEDEN', 'NORWAY', 'DENMARK', 'BRITISH']):
+                    return 'Western'
+                elif any(keyword in nationality for keyword in
+                         ['NIGERIA', 'ETHIOPIA', 'SUDAN', 'MOROCCO', 'TUNISIA', 'ALGERIA']):
+                    return 'African'
+                else:
+                    return 'Other'
+
+            df['Nationality_region'] = df[nationality_col].apply(group_nationality_by_region)
+
+            def cultural_distance(region):
+                if region in ['UAE', 'Arab']:
+                    return 'Local'
+                elif region in ['South Asia', 'African']:
+                    return 'Familiar'
+                else:
+                    return 'International'
+
+            df['Cultural_proximity'] = df['Nationality_region'].apply(cultural_distance)
+        df = df.copy()
+        if visa_col in df.columns:
+            def group_visa_category(visa):
+                if pd.isna(visa):
+                    return 'Expat/Other'
+                visa_str = str(visa).upper()
+                if any(keyword in visa_str for keyword in ['UAE', 'CITIZEN', 'NATIONAL']):
+                    return 'UAE Citizen'
+                elif 'GCC' in visa_str:
+                    return 'GCC'
+                else:
+                    return 'Expat/Other'
+
+            df['VisaCategory_grouped'] = df[visa_col].apply(group_visa_category)
+            df['Residency_stability'] = df['VisaCategory_grouped'].apply(
+                lambda x: 'High' if x == 'UAE Citizen' else 'Medium' if x == 'GCC' else 'Variable'
+            )
+        df = df.copy()
+        if 'Patient_State' in df.columns:
+            df['Patient_State_missing'] = df['Patient_State'].isna().astype(int)
+        if 'Gender' in df.columns:
+            df['Gender_encoded'] = df['Gender'].map({'Male': 0, 'Female': 1}).fillna(-1)
+        return df
+
+    @staticmethod
+    def booking(df: pd.DataFrame, booked_by_col: str = 'Booked_By', top_n: int = 10) -> pd.DataFrame:
+        df = df.copy()
+        if booked_by_col in df.columns:
+            top_channels = df[booked_by_col].value_counts().head(top_n).index.tolist()
+            df[f'Booked_By_top{top_n}'] = df[booked_by_col].apply(
+                lambda x: x if x in top_channels else 'Other'
+            )
+
+            def categorize_booking_channel(channel):
+                if pd.isna(channel):
+                    return 'Unknown'
+                channel_str = str(channel).upper()
+                if any(keyword in channel_str for keyword in ['ONLINE', 'WEB', 'APP', 'MOBILE']):
+                    return 'Digital'
+                elif any(keyword in channel_str for keyword in ['CALL', 'PHONE', 'CENTER']):
+                    return 'Phone'
+                elif any(keyword in channel_str for keyword in ['WALK', 'COUNTER', 'FRONT']):
+                    return 'Walk-in'
+                elif any(keyword in channel_str for keyword in ['DOCTOR', 'PHYSICIAN', 'STAFF']):
+                    return 'Medical Staff'
+                else:
+                    return 'Other'
+
+            df['Booking_channel_type'] = df[booked_by_col].apply(categorize_booking_channel)
+
+            def channel_efficiency_score(channel_type):
+                efficiency_map = {
+                    'Digital': 'High', 'Medical Staff': 'High', 'Phone': 'Medium',
+                    'Walk-in': 'Low', 'Other': 'Medium', 'Unknown': 'Low'
+                }
+                return efficiency_map.get(channel_type, 'Medium')
+
+            df['Channel_efficiency'] = df['Booking_channel_type'].apply(channel_efficiency_score)
+        return df
+
+    @staticmethod
+    def statistical(df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()
+        if 'DoctorName' in df.columns:
+            doctor_freq = df['DoctorName'].value_counts()
+            df['DoctorName_frequency'] = df['DoctorName'].map(doctor_freq)
+            doctor_freq_quantiles = df['DoctorName_frequency'].quantile([0.33, 0.67])
+
+            def doctor_tier(freq):
+                if pd.isna(freq):
+                    return 'Unknown'
+                elif freq <= doctor_freq_quantiles[0.33]:
+                    return 'Low Volume'
+                elif freq <= doctor_freq_quantiles[0.67]:
+                    return 'Medium Volume'
+                else:
+                    return 'High Volume'
+
+            df['Doctor_volume_tier'] = df['DoctorName_frequency'].apply(doctor_tier)
+        if 'Location_cleaned' in df.columns:
+            location_freq = df['Location_cleaned'].value_counts()
+            df['Location_frequency'] = df['Location_cleaned'].map(location_freq)
+        if 'BranchCode' in df.columns:
+            branch_freq = df['BranchCode'].value_counts()
+            df['Branch_frequency'] = df['BranchCode'].map(branch_freq)
+            branch_freq_quantiles = df['Branch_frequency'].quantile([0.5])
+            df['Branch_size'] = df['Branch_frequency'].apply(
+                lambda x: 'Large' if x > branch_freq_quantiles[0.5] else 'Small'
+            )
+        df = df.copy()
+        if 'Department_risk' in df.columns and 'distance_bin' in df.columns:
+            df['Dept_Distance_risk'] = df['Department_risk'] + '_' + df['distance_bin']
+        if 'Nationality_region' in df.columns and 'VisaCategory_grouped' in df.columns:
+            df['Nationality_Visa_combo'] = df['Nationality_region'] + '_' + df['VisaCategory_grouped']
+        if 'lead_days_bin' in df.columns and 'Booking_channel_type' in df.columns:
+            df['Leadtime_Channel_combo'] = df['lead_days_bin'] + '_' + df['Booking_channel_type']
+        df = df.copy()
+        if 'has_prev_appointment' in df.columns:
+            df['prev_visit_count'] = df['has_prev_appointment']
+            df['is_returning_patient'] = (df['has_prev_appointment'] > 0).astype(int)
+        if 'LastAppointmentStatus' in df.columns:
+            df['had_previous_noshow'] = (
+                df['LastAppointmentStatus'].str.contains('No Show|Missed', na=False)
+            ).astype(int)
+        return df
+
+    @classmethod
+    def all(cls, df: pd.DataFrame) -> pd.DataFrame:
+        for step in (cls.temporal, cls.location, cls.department, cls.demographic, cls.booking, cls.statistical):
+            df = step(df)
+        return df
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+@benchmark('group_rare')
+def bench_group_rare(rows: int) -> Dict[str, Callable[[], object]]:
+    rng = np.random.default_rng(0)
+    values = np.array([f'location_{i}' for i in range(500)], dtype=object)
+    weights = 1.0 / np.arange(1, len(values) + 1)
+    series = pd.Series(rng.choice(values, rows, p=weights / weights.sum()))
+    preprocessor = HealthcarePreprocessor()
+
+    return {
+        'legacy': lambda: legacy_group_rare(series, top_n=15),
+        'current': lambda: preprocessor._group_rare(series, top_n=15),
+    }
+
+
+@benchmark('season')
+def bench_season(rows: int) -> Dict[str, Callable[[], object]]:
+    rng = np.random.default_rng(0)
+    months = pd.Series(rng.integers(1, 13, rows)).astype('Int64')
+    months[rng.random(rows) < 0.01] = pd.NA
+
+    return {
+        'legacy': lambda: months.apply(legacy_get_season).astype('category'),
+        'current': lambda: pd.Series(pd.Categorical(
+            SEASON_BY_MONTH[months.fillna(0).to_numpy(dtype=np.int64)]
+        )),
+    }
+
+
+@benchmark('parse_dates')
+def bench_parse_dates(rows: int) -> Dict[str, Callable[[], object]]:
+    # Birth years where dateutil's two-digit-year pivot agrees with %y
+    rng = np.random.default_rng(0)
+    births = pd.Timestamp('1976-01-01') + pd.to_timedelta(rng.integers(0, 365 * 48, 20_000), unit='D')
+    dob_values = np.array([f'{d.month}/{d.day}/{d.year % 100:02d}' for d in births], dtype=object)
+    dob = pd.Series(rng.choice(dob_values, rows))
+    fmt = CONFIG['DATE_FORMATS']['DOB']
+
+    return {
+        'legacy': lambda: pd.to_datetime(dob, errors='coerce'),
+        'format': lambda: pd.to_datetime(dob, format=fmt, errors='coerce'),
+        'current': lambda: HealthcarePreprocessor._parse_date_column(dob, fmt)[0],
+    }
+
+
+@benchmark('read_csv')
+def bench_read_csv(rows: int) -> Dict[str, Callable[[], object]]:
+    # Replicate the bundled sample extract to `rows` rows in a temporary file
+    sample = pd.read_csv(os.path.join(os.path.dirname(__file__), '..', 'data', 'synthetic_data.csv'))
+    path = os.path.join(tempfile.mkdtemp(), 'appointments.csv')
+    sample.sample(rows, replace=True, random_state=0).to_csv(path, index=False)
+
+    def load(engine: str) -> pd.DataFrame:
+        # pyarrow infers ISO timestamps itself, so compare after date parsing
+        preprocessor = HealthcarePreprocessor(dict(CONFIG, CSV_ENGINE=engine))
+        return preprocessor.parse_dates(preprocessor.load_data_from_csv(path))
+
+    return {
+        'legacy': lambda: load('c'),
+        'pyarrow': lambda: load('pyarrow'),
+    }
+
+
+def notebook_02_frame(rows: int) -> pd.DataFrame:
+    """Synthetic input with every column the notebook 02 engineers read."""
+    rng = np.random.default_rng(0)
+
+    def zipf(values, size: int = rows) -> np.ndarray:
+        values = np.asarray(values, dtype=object)
+        weights = 1.0 / np.arange(1, len(values) + 1)
+        return rng.choice(values, size, p=weights / weights.sum())
+
+    def with_missing(values: np.ndarray, share: float = 0.01) -> np.ndarray:
+        values = values.astype(object) if values.dtype.kind not in 'fc' else values
+        values[rng.random(len(values)) < share] = np.nan
+        return values
+
+    departments = NotebookFeatures.HIGH_RISK_DEPARTMENTS + ['GENERAL SURGERY', 'DENTAL', 'NEUROLOGY', 'OTHERS']
+    return pd.DataFrame({
+        'book_hour': with_missing(rng.integers(0, 24, rows).astype(float)),
+        'lead_days': with_missing(rng.integers(0, 200, rows).astype(float)),
+        'lead_hours': with_missing(rng.exponential(400, rows)),
+        'Location_cleaned': with_missing(zipf([f'loc{i}' for i in range(60)])),
+        'distance_to_branch': with_missing(rng.gamma(2.0, 5.0, rows)),
+        'Department': with_missing(zipf(departments)),
+        'Nationality_grouped': with_missing(zipf(['UAE', 'India', 'Egypt', 'UK', 'Nigeria', 'Brazil', 'Other'])),
+        'VisaCategory': with_missing(zipf(['Expatriates/ National', 'GCC Resident', 'Visit-Visa/Non-Resident'])),
+        'Patient_State': with_missing(zipf(['Dubai', 'Sharjah', 'Ajman']), 0.2),
+        'Gender': with_missing(zipf(['Female', 'Male'])),
+        'Booked_By': with_missing(zipf(['Contact_Center', 'MOBILEAPP', 'WEB', 'Front Desk', 'Doctor',
+                                        'CHATBOT', 'Walk-in', 'Call', 'Online', 'Staff', 'Kiosk', 'Email'])),
+        'DoctorName': zipf([f'doctor {i}' for i in range(300)]),
+        'BranchCode': zipf([f'B{i}' for i in range(13)]),
+        'has_prev_appointment': rng.integers(0, 4, rows),
+        'LastAppointmentStatus': with_missing(zipf(['Invoiced', 'No Show', 'Canceled', 'Missed'])),
+    })
+
+
+def notebook_02_values(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Feature columns as plain values: categoricals as text and numbers as float, NaN for missing."""
+    values = {}
+    for col in columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+            values[col] = series.astype(object).where(series.notna(), np.nan)
+        else:
+            values[col] = series.to_numpy(dtype=float, na_value=np.nan)
+    return pd.DataFrame(values, index=df.index)
+
+
+@benchmark('notebook_02')
+def bench_notebook_02(rows: int) -> Dict[str, Callable[[], object]]:
+    from feature_engineering import FEATURE_CONFIG, FeaturePipeline
+
+    df = notebook_02_frame(rows)
+    columns = [col for col in NotebookFeatures.all(df.head(1000)).columns if col not in df.columns]
+    # The notebook encoded only the spelled-out genders
+    config = dict(FEATURE_CONFIG, GENDER_CODES={'Male': 0, 'Female': 1})
+
+    def current() -> pd.DataFrame:
+        features = FeaturePipeline(config=config)
+        output = features.fit_transform(df.copy(deep=False))
+        # Interactions are integer codes; compare their labels
+        interactions = features.engineers[-1].interactions
+        for name in config['INTERACTIONS']:
+            output[name] = interactions.decode(name, output[name])
+        return notebook_02_values(output, columns)
+
+    return {
+        'legacy': lambda: notebook_02_values(NotebookFeatures.all(df), columns),
+        'current': current,
+    }
+
+
+def online_latency(records: int) -> List[Tuple[str, float, float, float]]:
+    """(implementation, p50, p99, max) per-record latency in microseconds."""
+    from online import OnlineTransformer, encode_frame
+
+    sample_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'synthetic_data.csv')
+    preprocessor = HealthcarePreprocessor()
+    raw = preprocessor.load_data_from_csv(sample_path)
+    preprocessor.fit(raw)
+    transformer = OnlineTransformer(preprocessor)
+    text = pd.read_csv(sample_path, dtype=str).head(records)
+
+    batch_times, online_times = [], []
+    for i, record in enumerate(text.to_dict('records')):
+        start = time.perf_counter()
+        frame = preprocessor.transform(raw.iloc[[i]].copy())
+        expected = encode_frame(frame, transformer.columns)
+        batch_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vector = transformer.transform_record(record)
+        online_times.append(time.perf_counter() - start)
+        # The online vector must match the batch output exactly
+        if (vector is None) != (len(expected) == 0) or (
+                vector is not None and not np.array_equal(vector, expected[0], equal_nan=True)):
+            raise AssertionError(f"online: record {i} differs from the batch output")
+
+    return [
+        (label, *(np.percentile(times, q) * 1e6 for q in (50, 99)), max(times) * 1e6)
+        for label, times in (('batch', batch_times), ('online', online_times))
+    ]
+
+
+def print_latency(results: List[Tuple[str, float, float, float]]) -> None:
+    """Print a per-record latency table."""
+    print(f"{'impl':<12} {'p50 us':>10} {'p99 us':>10} {'max us':>10}")
+    for label, p50, p99, worst in results:
+        print(f"{label:<12} {p50:>10.1f} {p99:>10.1f} {worst:>10.1f}")
+
+
+def run(names: List[str], rows: int, repeat: int) -> List[Tuple[str, str, float]]:
+    """Run the selected benchmarks and return (name, label, sec/1M rows) rows."""
+    results = []
+    for name in names:
+        cases = BENCHMARKS[name](rows)
+        expected = None
+        for label, fn in cases.items():
+            # Every implementation must reproduce the legacy output exactly
+            output = fn()
+            if expected is None:
+                expected = output
+            elif not _same_output(expected, output):
+                raise AssertionError(f"{name}: '{label}' output differs from the legacy output")
+            seconds = time_call(fn, repeat)
+            results.append((name, label, seconds * 1_000_000 / rows))
+    return results
+
+
+def _same_output(a, b) -> bool:
+    """Compare benchmark outputs of pandas or NumPy type."""
+    if isinstance(a, (pd.Series, pd.DataFrame)):
+        return a.equals(b)
+    return np.array_equal(np.asarray(a), np.asarray(b))
+
+
+def print_results(results: List[Tuple[str, str, float]]) -> None:
+    """Print a results table with the speedup of each case over 'legacy'."""
+    legacy = {name: sec for name, label, sec in results if label == 'legacy'}
+    print(f"{'benchmark':<20} {'impl':<12} {'sec / 1M rows':>14} {'speedup':>9}")
+    for name, label, sec in results:
+        speedup = legacy.get(name, sec) / sec if sec else float('nan')
+        print(f"{name:<20} {label:<12} {sec:>14.4f} {speedup:>8.1f}x")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Preprocessing micro-benchmarks")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument('--online', type=int, default=None, metavar='N',
+                        help="Report online per-record latency over N sample records")
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Minimum level of pipeline log messages")
+    args = parser.parse_args(argv)
+    # Every mode logs through the pipeline handler, as the CLI does
+    configure_logging(args.log_level)
+
+    if args.online:
+        print_latency(online_latency(args.online))
+        return
+
+    # The legacy date parser warns on every call when it falls back to dateutil
+    warnings.filterwarnings('ignore', message='Could not infer format')
+    print_results(run(args.only or list(BENCHMARKS), args.rows, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
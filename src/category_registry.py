@@ -0,0 +1,189 @@
+"""
+Stable integer codes for categorical columns across runs.
+
+final_cleanup converts text columns to `category`, and a fit learns the
+levels from that batch, so a refit on new data can renumber every value.
+A CategoryRegistry keeps one append-only list of levels per column: a
+value's code is its position in the list, new values only ever go to the
+end, and a saved registry refuses to be overwritten by one that would
+renumber it. Codes stay valid for every model trained on earlier codes.
+
+A batch is encoded with one hash-index probe per distinct value, broadcast
+through the column's codes, into the smallest signed integer dtype that
+holds the levels (int8 up to 127, then int16). Missing values, and values
+not in the registry unless the batch is added first, get -1.
+
+sync(preprocessor) appends a fitted preprocessor's levels and pins its
+levels to the registry's, so its categorical output (and encode_frame and
+OnlineTransformer vectors built from it) carries the registry codes.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from interactions import code_dtype
+from utils.logger import get_logger
+
+logger = get_logger('category_registry')
+
+# Version of the state written by CategoryRegistry.get_state and save
+STATE_VERSION = 1
+
+
+def _uniques(series: pd.Series):
+    """Codes (-1 for missing) and distinct values of a column."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series)
+    return codes, pd.Index(uniques)
+
+
+class CategoryRegistry:
+    """Append-only levels per column; a value's code is its position."""
+
+    def __init__(self, columns: Optional[Iterable[str]] = None):
+        # None registers every categorical and text column of the first batch
+        self.columns = None if columns is None else list(columns)
+        self.levels: Dict[str, List] = {}
+        # Hash index over each column's levels, rebuilt after an update
+        self._index: Dict[str, pd.Index] = {}
+
+    def __len__(self) -> int:
+        return sum(len(levels) for levels in self.levels.values())
+
+    def _columns(self, df: pd.DataFrame) -> List[str]:
+        if self.columns is None:
+            self.columns = df.select_dtypes(include=['category', 'object', 'string']).columns.tolist()
+        return [col for col in self.columns if col in df.columns]
+
+    def _positions(self, col: str, values) -> np.ndarray:
+        index = self._index.get(col)
+        if index is None:
+            index = self._index[col] = pd.Index(self.levels.get(col, []))
+        return index.get_indexer(values)
+
+    def dtype(self, col: str) -> np.dtype:
+        """Integer dtype of a column's codes."""
+        return code_dtype(max(len(self.levels.get(col, [])), 1))
+
+    def update(self, df: pd.DataFrame) -> 'CategoryRegistry':
+        """
+        Append the values of a batch not registered yet: a categorical's in
+        the order of its categories (so ordered levels keep their order),
+        other columns' sorted as text.
+        """
+        added = {}
+        for col in self._columns(df):
+            series = df[col]
+            values = _uniques(series)[1]
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                values = sorted(values.dropna().tolist(), key=str)
+            added[col] = self.extend(col, values)
+        logger.debug("Category registry updated: %s new levels", added)
+        return self
+
+    def extend(self, col: str, values) -> int:
+        """
+        Append the given values of a column not registered yet, in the order
+        given; registered levels never move. Returns how many were added.
+        """
+        values = pd.Index(values).dropna().unique()
+        new = values[self._positions(col, values) < 0]
+        if len(new):
+            self.levels[col] = self.levels.get(col, []) + new.tolist()
+            self._index.pop(col, None)
+        return len(new)
+
+    def codes(self, series: pd.Series, col: Optional[str] = None) -> np.ndarray:
+        """Registry code of each value (-1 for missing or unregistered ones)."""
+        col = series.name if col is None else col
+        codes, uniques = _uniques(series)
+        table = self._positions(col, uniques)
+        return np.append(table, -1)[codes].astype(self.dtype(col))
+
+    def encode(self, df: pd.DataFrame, update: bool = False) -> pd.DataFrame:
+        """
+        Replace the registered columns of `df` in place with their codes and
+        return it. With `update` the batch's new values are registered first.
+        """
+        if update:
+            self.update(df)
+        unseen = {}
+        for col in self._columns(df):
+            codes = self.codes(df[col], col)
+            n_unseen = int(df[col].notna().sum() - (codes >= 0).sum())
+            if n_unseen:
+                unseen[col] = n_unseen
+            df[col] = codes
+        if unseen:
+            logger.warning("Values not in the category registry (coded -1): %s", unseen,
+                           extra={'rate_key': 'registry.unseen'})
+        return df
+
+    def decode(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Turn code columns of `df` back into categoricals of the registry levels, in place."""
+        for col in self._columns(df):
+            levels = self.levels.get(col, [])
+            df[col] = pd.Categorical.from_codes(df[col].to_numpy(dtype=np.int64), categories=levels)
+        return df
+
+    def sync(self, preprocessor) -> 'CategoryRegistry':
+        """
+        Register a fitted HealthcarePreprocessor's category levels and pin
+        them to the registry order, so its categorical output has registry
+        codes. A column registered here for the first time keeps its fitted
+        order, so ordered levels (age_band, leadtime_bucket) still compare
+        as before. Call after fitting and before save_state.
+        """
+        if not preprocessor.is_fitted:
+            raise ValueError("Preprocessor is not fitted; call fit() or load_state() first")
+        if self.columns is None:
+            self.columns = list(preprocessor.category_levels)
+        for col, levels in preprocessor.category_levels.items():
+            if col in self.columns:
+                self.extend(col, levels)
+                preprocessor.category_levels[col] = list(self.levels.get(col, []))
+        return self
+
+    def get_state(self) -> Dict:
+        """The levels as a JSON-serializable dict."""
+        return {'version': STATE_VERSION, 'columns': self.columns, 'levels': self.levels}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'CategoryRegistry':
+        """Rebuild a registry from get_state output."""
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(
+                f"Unsupported state version {state.get('version')} (expected {STATE_VERSION})"
+            )
+        registry = cls(state['columns'])
+        registry.levels = {col: list(levels) for col, levels in state['levels'].items()}
+        return registry
+
+    def save(self, path: str) -> None:
+        """
+        Write the levels as JSON, atomically. An existing registry at `path`
+        must be a prefix of this one, so saved codes are never renumbered.
+        """
+        if os.path.exists(path):
+            saved = self.load(path)
+            for col, levels in saved.levels.items():
+                if self.levels.get(col, [])[:len(levels)] != levels:
+                    raise ValueError(f"Registry at {path} has other codes for {col}; "
+                                     "load and update it instead of replacing it")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.get_state(), f, separators=(',', ':'), default=str)
+        os.replace(path + '.tmp', path)
+        logger.info("Category registry saved: %s (%d levels)", path, len(self))
+
+    @classmethod
+    def load(cls, path: str) -> 'CategoryRegistry':
+        """Read a registry written by save."""
+        with open(path) as f:
+            registry = cls.from_state(json.load(f))
+        logger.info("Category registry loaded: %s (%d levels)", path, len(registry))
+        return registry
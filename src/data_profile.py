@@ -0,0 +1,333 @@
+"""
+Single-pass data-quality profiles built from mergeable sketches.
+
+A DataProfile summarizes every column of a stream of frames: row and
+missing counts for all columns, an estimated distinct count (HyperLogLog),
+min/max/mean/std and quantiles (KLL) for numeric and date columns, and the
+most frequent values (Misra-Gries) for text and categorical columns. Each
+frame is folded in with a few vectorized passes, and profiles of chunks or
+partitions merge into the profile of the whole input, so chunked and
+parallel runs profile their data without a second read.
+
+A DataProfiler attached to HealthcarePreprocessor (`data_profiler`) profiles
+the input and output of every preprocess_data call, and is saved as one
+JSON artifact per run (`--data-profile DIR` on the CLI).
+
+Usage:
+    python data_profile.py PROFILE.json [PROFILE.json ...] [-o MERGED.json]
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import current_run_id, get_logger
+from utils.sketches import FrequentItems, HyperLogLog, KLLSketch, hash_values
+
+logger = get_logger('data_profile')
+
+# Quantiles reported for numeric and date columns
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# Frequent values reported per text column
+TOP_VALUES = 10
+
+PROFILE_VERSION = 1
+
+
+class ColumnProfile:
+    """
+    Sketches of one column. `kind` is 'numeric', 'datetime' or 'text', or
+    None while the column has shown only missing values (which can come
+    with any dtype).
+    """
+
+    def __init__(self, kind: Optional[str] = None):
+        self.kind = None
+        self.count = 0
+        self.missing = 0
+        if kind is not None:
+            self._start(kind)
+
+    def _start(self, kind: str) -> None:
+        self.kind = kind
+        self.distinct = HyperLogLog()
+        if kind == 'text':
+            self.frequent = FrequentItems()
+            return
+        self.quantiles = KLLSketch()
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        if kind == 'numeric':
+            self.sum = 0.0
+            self.sum_sq = 0.0
+            self.zeros = 0
+
+    @staticmethod
+    def kind_of(series: pd.Series) -> str:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return 'datetime'
+        if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+            return 'numeric'
+        return 'text'
+
+    def update(self, series: pd.Series) -> None:
+        missing = series.isna().to_numpy()
+        n_missing = int(missing.sum())
+        self.count += len(series)
+        self.missing += n_missing
+        if n_missing == len(series):
+            return
+        kind = self.kind_of(series)
+        if self.kind is None:
+            self._start(kind)
+        elif kind != self.kind:
+            # A diagnostic must not abort the run: keep the first kind's
+            # sketches and count the rows only
+            logger.warning("Column %r is %s here but %s before; its values are left out of the profile",
+                           series.name, kind, self.kind, extra={'rate_key': 'profile.kind'})
+            return
+
+        if self.kind == 'text':
+            # Hash and count each distinct value once
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+            else:
+                codes, uniques = pd.factorize(series)
+            freqs = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self.distinct.update(hash_values(uniques[freqs > 0]))
+            self.frequent.update(np.asarray(uniques, dtype=object), freqs)
+            return
+        self.distinct.update(hash_values(series))
+
+        values = series[~missing]
+        if self.kind == 'datetime':
+            numbers = values.to_numpy(dtype='datetime64[ns]').view(np.int64).astype(float)
+        else:
+            numbers = values.to_numpy(dtype=float)
+            self.sum += float(numbers.sum())
+            self.sum_sq += float(np.square(numbers).sum())
+            self.zeros += int(np.count_nonzero(numbers == 0))
+        self.quantiles.update(numbers)
+        self._bounds(float(numbers.min()), float(numbers.max()))
+
+    def _bounds(self, low: Optional[float], high: Optional[float]) -> None:
+        if low is not None:
+            self.min = low if self.min is None else min(self.min, low)
+        if high is not None:
+            self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other: 'ColumnProfile') -> 'ColumnProfile':
+        self.count += other.count
+        self.missing += other.missing
+        if other.kind is None:
+            return self
+        if self.kind is None:
+            self._start(other.kind)
+        elif other.kind != self.kind:
+            logger.warning("Cannot merge a %s column profile into a %s one; its sketches are left out",
+                           other.kind, self.kind, extra={'rate_key': 'profile.kind'})
+            return self
+        self.distinct.merge(other.distinct)
+        if self.kind == 'text':
+            self.frequent.merge(other.frequent)
+            return self
+        self.quantiles.merge(other.quantiles)
+        self._bounds(other.min, other.max)
+        if self.kind == 'numeric':
+            self.sum += other.sum
+            self.sum_sq += other.sum_sq
+            self.zeros += other.zeros
+        return self
+
+    def summary(self) -> Dict:
+        """Readable statistics of the column."""
+        present = self.count - self.missing
+        summary = {
+            'kind': self.kind,
+            'count': self.count,
+            'missing': self.missing,
+            'missing_pct': round(100 * self.missing / self.count, 3) if self.count else 0.0,
+        }
+        if self.kind is None:
+            return summary
+        summary['distinct_est'] = int(round(min(self.distinct.estimate(), present)))
+        if self.kind == 'text':
+            summary['top'] = self.frequent.top(TOP_VALUES)
+            summary['top_error'] = self.frequent.error
+            return summary
+
+        quantiles = self.quantiles.quantiles(QUANTILES)
+        if self.kind == 'datetime':
+            summary['min'], summary['max'] = _timestamp(self.min), _timestamp(self.max)
+            summary['quantiles'] = {str(q): _timestamp(v) for q, v in zip(QUANTILES, quantiles)}
+            return summary
+
+        mean = self.sum / present
+        summary.update({
+            'min': self.min,
+            'max': self.max,
+            'mean': mean,
+            'std': float(np.sqrt(max(self.sum_sq / present - mean * mean, 0.0))),
+            'zeros': self.zeros,
+            'quantiles': {str(q): v for q, v in zip(QUANTILES, quantiles)},
+        })
+        return summary
+
+    def to_dict(self) -> Dict:
+        data = {'kind': self.kind, 'count': self.count, 'missing': self.missing}
+        if self.kind is None:
+            return data
+        data['distinct'] = self.distinct.to_dict()
+        if self.kind == 'text':
+            data['frequent'] = self.frequent.to_dict()
+            return data
+        data.update({'min': self.min, 'max': self.max, 'quantiles': self.quantiles.to_dict()})
+        if self.kind == 'numeric':
+            data.update({'sum': self.sum, 'sum_sq': self.sum_sq, 'zeros': self.zeros})
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ColumnProfile':
+        profile = cls(data['kind'])
+        profile.count, profile.missing = data['count'], data['missing']
+        if profile.kind is None:
+            return profile
+        profile.distinct = HyperLogLog.from_dict(data['distinct'])
+        if profile.kind == 'text':
+            profile.frequent = FrequentItems.from_dict(data['frequent'])
+            return profile
+        profile.min, profile.max = data['min'], data['max']
+        profile.quantiles = KLLSketch.from_dict(data['quantiles'])
+        if profile.kind == 'numeric':
+            profile.sum, profile.sum_sq, profile.zeros = data['sum'], data['sum_sq'], data['zeros']
+        return profile
+
+
+class DataProfile:
+    """Column profiles of a stream of frames."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, ColumnProfile] = {}
+
+    def update(self, df: pd.DataFrame) -> 'DataProfile':
+        self.rows += len(df)
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile()
+            self.columns[col].update(df[col])
+        return self
+
+    def merge(self, other: 'DataProfile') -> 'DataProfile':
+        self.rows += other.rows
+        for col, profile in other.columns.items():
+            self.columns.setdefault(col, ColumnProfile()).merge(profile)
+        return self
+
+    def summary(self) -> Dict:
+        return {'rows': self.rows, 'columns': {col: profile.summary() for col, profile in self.columns.items()}}
+
+    def to_dict(self) -> Dict:
+        return {'rows': self.rows, 'columns': {col: profile.to_dict() for col, profile in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DataProfile':
+        profile = cls()
+        profile.rows = data['rows']
+        profile.columns = {col: ColumnProfile.from_dict(column) for col, column in data['columns'].items()}
+        return profile
+
+
+class DataProfiler:
+    """Input and output profiles of the preprocess_data calls of one run."""
+
+    def __init__(self):
+        self.input = DataProfile()
+        self.output = DataProfile()
+        self.seconds = 0.0
+
+    def observe(self, side: str, df: pd.DataFrame) -> None:
+        """Fold a frame into the 'input' or 'output' profile."""
+        start = time.perf_counter()
+        getattr(self, side).update(df)
+        self.seconds += time.perf_counter() - start
+
+    def merge(self, other: 'DataProfiler') -> 'DataProfiler':
+        self.input.merge(other.input)
+        self.output.merge(other.output)
+        self.seconds += other.seconds
+        return self
+
+    def to_dict(self) -> Dict:
+        """Artifact form: readable summaries plus the sketches they were read from."""
+        return {
+            'version': PROFILE_VERSION,
+            'run_id': current_run_id(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'profile_seconds': round(self.seconds, 3),
+            'summary': {'input': self.input.summary(), 'output': self.output.summary()},
+            'sketches': {'input': self.input.to_dict(), 'output': self.output.to_dict()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DataProfiler':
+        if data.get('version') != PROFILE_VERSION:
+            raise ValueError(f"Unsupported data profile version: {data.get('version')}")
+        profiler = cls()
+        profiler.input = DataProfile.from_dict(data['sketches']['input'])
+        profiler.output = DataProfile.from_dict(data['sketches']['output'])
+        profiler.seconds = data.get('profile_seconds', 0.0)
+        return profiler
+
+    def save(self, path: str) -> str:
+        """
+        Write the artifact to `path`; a directory gets one file per run,
+        named after the run ID. Returns the file written.
+        """
+        if os.path.isdir(path) or not path.endswith('.json'):
+            os.makedirs(path, exist_ok=True)
+            path = os.path.join(path, f"profile_{current_run_id() or time.strftime('%Y%m%d%H%M%S')}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        logger.info("Data profile written to %s (%d input rows, %d output rows, %.2fs profiling)",
+                    path, self.input.rows, self.output.rows, self.seconds)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'DataProfiler':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def merge_profiles(paths: List[str]) -> DataProfiler:
+    """Merge saved profiles, e.g. of the partitions or daily runs of one dataset."""
+    merged = DataProfiler()
+    for path in paths:
+        merged.merge(DataProfiler.load(path))
+    return merged
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return None if value is None else str(pd.Timestamp(int(value)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Merge and summarize data profile artifacts")
+    parser.add_argument('profiles', nargs='+', help="Profile JSON files")
+    parser.add_argument('-o', '--output', default=None, help="Write the merged profile to this file")
+    args = parser.parse_args(argv)
+
+    merged = merge_profiles(args.profiles)
+    if args.output:
+        merged.save(args.output)
+    print(json.dumps(merged.to_dict()['summary'], indent=1))
+
+
+if __name__ == '__main__':
+    main()
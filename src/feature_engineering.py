@@ -0,0 +1,577 @@
+"""
+Fitted, vectorized versions of the notebook 02 feature engineers.
+
+TemporalFeatureEngineer, LocationFeatureEngineer, DepartmentFeatureEngineer,
+DemographicFeatureEngineer, BookingChannelEngineer and
+StatisticalFeatureEngineer add the columns of their notebook namesakes.
+What the notebook recomputed from every frame (top locations and channels,
+department sizes, distance quartiles, frequency tables and their tiers) is
+learned once by fit() and reused by transform(), so a scoring batch gets the
+training-time features.
+
+The notebook's per-row helpers (get_part_of_day, bin_lead_days,
+group_nationality_by_region, categorize_booking_channel, doctor_tier, ...)
+become `pd.cut` bins and label arrays indexed by category codes: a label is
+worked out once per distinct value, keyword rules included, and broadcast
+through the codes. The new columns are categoricals with fixed levels and
+nullable integers, and transform() adds them to the frame it is given
+instead of a copy.
+
+FeaturePipeline runs the six in notebook order after HealthcarePreprocessor:
+
+    features = FeaturePipeline()
+    df = features.fit_transform(preprocessor.fit_transform(raw))
+"""
+
+import json
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from frequency import FrequencyEncoder
+from interactions import InteractionBuilder
+from preprocessing import HealthcarePreprocessor
+from utils.logger import get_logger
+
+logger = get_logger('feature_engineering')
+
+FEATURE_CONFIG = {
+    # Booking hours before the first or after the second are off-hours
+    'ODD_HOURS': (8, 20),
+    # Left-closed bins; a label may cover several bins
+    'PART_OF_DAY_BINS': [-np.inf, 6, 12, 17, 21, np.inf],
+    'PART_OF_DAY_LABELS': ['night', 'morning', 'afternoon', 'evening', 'night'],
+    'LEAD_DAYS_BINS': [0, 1, 2, 4, 8, 31, 91, np.inf],
+    'LEAD_DAYS_LABELS': ['Same Day', '1 Day', '2-3 Days', '4-7 Days', '8-30 Days', '31-90 Days', '90+ Days'],
+    'LEAD_HOURS_BINS': [-np.inf, 1, 6, 12, 24, 72, 168, np.inf],
+    'LEAD_HOURS_LABELS': ['<1hr', '1-6hr', '6-12hr', '12-24hr', '1-3d', '3-7d', '7d+'],
+    # Domain knowledge: departments with high no-show rates
+    'HIGH_RISK_DEPARTMENTS': [
+        'OBSTETRICS and GYNAECOLOGY', 'DERMATOLOGY', 'PAEDIATRICS',
+        'ORTHOPAEDIC', 'E.N.T', 'CARDIOLOGY',
+    ],
+    'DEPARTMENT_CATEGORIES': {
+        'OBSTETRICS and GYNAECOLOGY': 'Family Care',
+        'PAEDIATRICS': 'Family Care',
+        'CARDIOLOGY': 'Specialty Care',
+        'ORTHOPAEDIC': 'Specialty Care',
+        'DERMATOLOGY': 'Outpatient Specialty',
+        'E.N.T': 'Outpatient Specialty',
+    },
+    # Keyword rules, matched in order against the upper-cased value
+    'NATIONALITY_REGIONS': [
+        ('UAE', ['UAE', 'EMIRATI', 'UNITED ARAB']),
+        ('South Asia', ['INDIA', 'PAKISTAN', 'BANGLADESH', 'SRI LANKA', 'NEPAL', 'BHUTAN']),
+        ('Arab', ['EGYPT', 'JORDAN', 'SYRIA', 'LEBANON', 'IRAQ', 'SAUDI', 'KUWAIT',
+                  'OMAN', 'QATAR', 'BAHRAIN', 'YEMEN']),
+        ('Western', ['USA', 'UK', 'CANADA', 'AUSTRALIA', 'GERMANY', 'FRANCE', 'ITALY',
+                     'SPAIN', 'NETHERLANDS', 'SWEDEN', 'NORWAY', 'DENMARK', 'BRITISH']),
+        ('African', ['NIGERIA', 'ETHIOPIA', 'SUDAN', 'MOROCCO', 'TUNISIA', 'ALGERIA']),
+    ],
+    'CULTURAL_PROXIMITY': {'UAE': 'Local', 'Arab': 'Local', 'South Asia': 'Familiar', 'African': 'Familiar'},
+    'VISA_GROUPS': [
+        ('UAE Citizen', ['UAE', 'CITIZEN', 'NATIONAL']),
+        ('GCC', ['GCC']),
+    ],
+    'RESIDENCY_STABILITY': {'UAE Citizen': 'High', 'GCC': 'Medium'},
+    # Notebook 02 mapped the spelled-out values; the extract has F/M
+    'GENDER_CODES': {'Male': 0, 'Female': 1, 'M': 0, 'F': 1},
+    'BOOKING_CHANNELS': [
+        ('Digital', ['ONLINE', 'WEB', 'APP', 'MOBILE']),
+        ('Phone', ['CALL', 'PHONE', 'CENTER']),
+        ('Walk-in', ['WALK', 'COUNTER', 'FRONT']),
+        ('Medical Staff', ['DOCTOR', 'PHYSICIAN', 'STAFF']),
+    ],
+    'CHANNEL_EFFICIENCY': {
+        'Digital': 'High', 'Medical Staff': 'High', 'Phone': 'Medium',
+        'Walk-in': 'Low', 'Other': 'Medium', 'Unknown': 'Low',
+    },
+    # Frequency-encoded columns: source column -> output column
+    'FREQUENCY_COLUMNS': {
+        'DoctorName': 'DoctorName_frequency',
+        'Location_cleaned': 'Location_frequency',
+        'BranchCode': 'Branch_frequency',
+    },
+    # Count of values fit() did not see; half-life in days of time-decayed
+    # counts (None counts every row once), dated by the latest FREQUENCY_DATE_COLUMN
+    'FREQUENCY_FALLBACK': 0,
+    'FREQUENCY_HALF_LIFE_DAYS': None,
+    'FREQUENCY_DATE_COLUMN': 'AppointmentDate',
+    # Interaction columns: output column -> the columns combined (two or
+    # more). Interactions listed in INTERACTION_BUCKETS are hashed into that
+    # many buckets instead of coded on fitted levels (see interactions.py).
+    'INTERACTIONS': {
+        'Dept_Distance_risk': ('Department_risk', 'distance_bin'),
+        'Nationality_Visa_combo': ('Nationality_region', 'VisaCategory_grouped'),
+        'Leadtime_Channel_combo': ('lead_days_bin', 'Booking_channel_type'),
+    },
+    'INTERACTION_BUCKETS': {},
+    'NO_SHOW_PATTERN': 'No Show|Missed',
+}
+
+# Version of the serialized state written by FeaturePipeline.save_state
+STATE_VERSION = 1
+
+
+def _codes(series: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """Codes (-1 for missing) and distinct values of a column; a categorical's own levels."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series)
+    return codes, pd.Index(uniques)
+
+
+def _relabel(codes: np.ndarray, positions: np.ndarray, levels: Sequence[str],
+             missing: int = -1) -> pd.Categorical:
+    """Categorical with the level `positions[code]` per row, and `missing` where the code is -1."""
+    table = np.append(np.asarray(positions, dtype=np.int64), missing)
+    return pd.Categorical.from_codes(table[codes], categories=levels)
+
+
+def _lookup(values: pd.Index, mapping: Dict, levels: Sequence[str], default: str) -> np.ndarray:
+    """Level position of each value's label in `mapping` (`default` for unmapped values)."""
+    labels = pd.Series(values, dtype=object).map(mapping).fillna(default)
+    return pd.Index(levels).get_indexer(labels)
+
+
+def _match_keywords(values: pd.Index, groups: Sequence[Tuple[str, List[str]]]) -> np.ndarray:
+    """
+    Position of the first group with a keyword contained in each upper-cased
+    value, or len(groups) where none matches.
+    """
+    text = pd.Series(values, dtype=object).astype(str).str.upper()
+    matches = [text.str.contains('|'.join(map(re.escape, keywords))).to_numpy(dtype=bool)
+               for _, keywords in groups]
+    return np.select(matches, np.arange(len(groups)), len(groups)) if len(text) else np.empty(0, dtype=np.int64)
+
+
+def _numbers(series: pd.Series) -> np.ndarray:
+    """Float values of a numeric column, NaN for missing."""
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+def _cut(values: np.ndarray, bins: Sequence[float], labels: Sequence[str],
+         missing: str = 'unknown') -> pd.Categorical:
+    """
+    `pd.cut` into left-closed `bins`. Labels may repeat; values outside
+    every bin, and missing values, get the level `missing`.
+    """
+    levels = list(dict.fromkeys(labels)) + [missing]
+    bins_of_values = pd.cut(values, bins, labels=False, right=False)
+    codes = np.where(np.isnan(bins_of_values), len(labels), bins_of_values).astype(np.int64)
+    positions = [levels.index(label) for label in labels] + [len(levels) - 1]
+    return _relabel(codes, positions, levels)
+
+
+def _flag(mask: np.ndarray) -> pd.arrays.IntegerArray:
+    """0/1 Int8 column of a boolean mask."""
+    return pd.array(mask, dtype='Int8')
+
+
+def _group(series: pd.Series, kept: List, other: str, keep_missing: bool = False) -> pd.Categorical:
+    """Values in `kept` unchanged and the rest as `other`; missing values too unless `keep_missing`."""
+    levels = list(dict.fromkeys([*kept, other]))
+    codes, uniques = _codes(series)
+    positions = pd.Index(levels).get_indexer(uniques)
+    positions[~uniques.isin(kept)] = levels.index(other)
+    return _relabel(codes, positions, levels, -1 if keep_missing else levels.index(other))
+
+
+def _top_values(series: pd.Series, top_n: int) -> List:
+    """The top_n most frequent values, as the preprocessor's rare-category grouping picks them."""
+    return HealthcarePreprocessor._top_values(HealthcarePreprocessor._value_counts(series), top_n)
+
+
+class FeatureTransformer:
+    """
+    Base of the engineers: fit() learns from a frame and transform() adds
+    the engineer's columns to a frame. Columns whose inputs are missing are
+    skipped, as in the notebook.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or FEATURE_CONFIG
+        # Learned state, JSON-serializable (None until fitted)
+        self.state: Optional[Dict] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.state is not None
+
+    def fit(self, df: pd.DataFrame) -> 'FeatureTransformer':
+        """Learn the statistics the features are computed with."""
+        self.state = self._fit(df)
+        return self
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add the features to `df` in place and return it."""
+        if not self.is_fitted:
+            raise ValueError(f"{type(self).__name__} is not fitted; call fit() or set_state() first")
+        return self._transform(df)
+
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.fit(df).transform(df)
+
+    def get_state(self) -> Dict:
+        return self.state
+
+    def set_state(self, state: Dict) -> 'FeatureTransformer':
+        self.state = state
+        return self
+
+    def _fit(self, df: pd.DataFrame) -> Dict:
+        return {}
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class TemporalFeatureEngineer(FeatureTransformer):
+    """
+    Booking-hour and lead-time features: odd_hour_flag, part_of_day,
+    lead_days_bin and lead_hours_bin.
+
+    Lead times come from `lead_days` / `lead_hours` columns, or else from
+    AppointmentDate minus Booked_Date_Time (the preprocessor's output).
+    Negative lead days are 'unknown'; the notebook put them in '90+ Days'.
+    """
+
+    def __init__(self, hour_col: str = 'book_hour', config: Optional[Dict] = None):
+        super().__init__(config)
+        self.hour_col = hour_col
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.hour_col in df.columns:
+            hours = _numbers(df[self.hour_col])
+            first, last = self.config['ODD_HOURS']
+            df['odd_hour_flag'] = _flag((hours < first) | (hours > last))
+            df['part_of_day'] = _cut(hours, self.config['PART_OF_DAY_BINS'], self.config['PART_OF_DAY_LABELS'])
+
+        lead_days, lead_hours = self._lead_times(df)
+        if lead_days is not None:
+            df['lead_days_bin'] = _cut(lead_days, self.config['LEAD_DAYS_BINS'], self.config['LEAD_DAYS_LABELS'])
+        if lead_hours is not None:
+            df['lead_hours_bin'] = _cut(lead_hours, self.config['LEAD_HOURS_BINS'], self.config['LEAD_HOURS_LABELS'])
+        return df
+
+    @staticmethod
+    def _lead_times(df: pd.DataFrame) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Lead time in whole days and in hours (None where it cannot be computed)."""
+        lead_hours = _numbers(df['lead_hours']) if 'lead_hours' in df.columns else None
+        if lead_hours is None and {'AppointmentDate', 'Booked_Date_Time'}.issubset(df.columns) \
+                and all(pd.api.types.is_datetime64_any_dtype(df[col])
+                        for col in ('AppointmentDate', 'Booked_Date_Time')):
+            lead_hours = _numbers((df['AppointmentDate'] - df['Booked_Date_Time']) / pd.Timedelta(hours=1))
+        if 'lead_days' in df.columns:
+            lead_days = _numbers(df['lead_days'])
+        else:
+            lead_days = None if lead_hours is None else np.floor(lead_hours / 24)
+        return lead_days, lead_hours
+
+
+class LocationFeatureEngineer(FeatureTransformer):
+    """
+    Location_top{top_n} (the fitted top locations, the rest 'Other') and
+    distance features on the fitted quartiles: distance_bin, is_local and
+    is_remote.
+    """
+
+    def __init__(self, location_col: str = 'Location_cleaned', top_n: int = 20,
+                 distance_col: str = 'distance_to_branch', config: Optional[Dict] = None):
+        super().__init__(config)
+        self.location_col = location_col
+        self.top_n = top_n
+        self.distance_col = distance_col
+
+    def _fit(self, df: pd.DataFrame) -> Dict:
+        state = {}
+        if self.location_col in df.columns:
+            state['top_locations'] = _top_values(df[self.location_col], self.top_n)
+        if self.distance_col in df.columns:
+            state['distance_quartiles'] = df[self.distance_col].astype(float).quantile([0.25, 0.5, 0.75]).tolist()
+        return state
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.location_col in df.columns and 'top_locations' in self.state:
+            df[f'Location_top{self.top_n}'] = _group(df[self.location_col], self.state['top_locations'], 'Other')
+
+        if self.distance_col in df.columns and 'distance_quartiles' in self.state:
+            quartiles = np.asarray(self.state['distance_quartiles'])
+            distance = _numbers(df[self.distance_col])
+            missing = np.isnan(distance)
+            # Index of the first quartile the distance does not exceed
+            codes = np.where(missing, 4, np.searchsorted(quartiles, distance, side='left'))
+            df['distance_bin'] = pd.Categorical.from_codes(
+                codes, categories=['Near', 'Mid', 'Far', 'Very Far', 'unknown'])
+            df['is_local'] = _flag(distance <= quartiles[0])
+            df['is_remote'] = _flag(distance > quartiles[2])
+        return df
+
+
+class DepartmentFeatureEngineer(FeatureTransformer):
+    """
+    Department_grouped (departments with fewer than `threshold` fitted rows
+    as 'OTHERS'; unseen ones too), Department_risk and Department_category.
+    """
+
+    def __init__(self, dept_col: str = 'Department', threshold: int = 3000,
+                 config: Optional[Dict] = None):
+        super().__init__(config)
+        self.dept_col = dept_col
+        self.threshold = threshold
+
+    def _fit(self, df: pd.DataFrame) -> Dict:
+        if self.dept_col not in df.columns:
+            return {}
+        counts = HealthcarePreprocessor._value_counts(df[self.dept_col])
+        return {'departments': counts.index[counts >= self.threshold].tolist()}
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.dept_col not in df.columns or 'departments' not in self.state:
+            return df
+        grouped = _group(df[self.dept_col], self.state['departments'], 'OTHERS', keep_missing=True)
+        df['Department_grouped'] = grouped
+
+        levels = pd.Index(grouped.categories)
+        risk = np.where(levels.isin(self.config['HIGH_RISK_DEPARTMENTS']), 0, 1)
+        df['Department_risk'] = _relabel(grouped.codes, risk, ['High Risk', 'Routine'], 1)
+
+        categories = ['Family Care', 'Specialty Care', 'Outpatient Specialty', 'General', 'Other']
+        mapping = dict(self.config['DEPARTMENT_CATEGORIES'], OTHERS='Other')
+        df['Department_category'] = _relabel(grouped.codes, _lookup(levels, mapping, categories, 'General'),
+                                             categories, categories.index('Other'))
+        return df
+
+
+class DemographicFeatureEngineer(FeatureTransformer):
+    """
+    Nationality_region, Cultural_proximity, VisaCategory_grouped,
+    Residency_stability, Patient_State_missing and Gender_encoded.
+    """
+
+    def __init__(self, nationality_col: str = 'Nationality_grouped', visa_col: str = 'VisaCategory',
+                 config: Optional[Dict] = None):
+        super().__init__(config)
+        self.nationality_col = nationality_col
+        self.visa_col = visa_col
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.nationality_col in df.columns:
+            groups = self.config['NATIONALITY_REGIONS']
+            regions = [label for label, _ in groups] + ['Other']
+            codes, uniques = _codes(df[self.nationality_col])
+            region = _relabel(codes, _match_keywords(uniques, groups), regions, len(groups))
+            df['Nationality_region'] = region
+            proximity = ['Local', 'Familiar', 'International']
+            df['Cultural_proximity'] = _relabel(
+                region.codes, _lookup(pd.Index(regions), self.config['CULTURAL_PROXIMITY'], proximity,
+                                      'International'), proximity)
+
+        if self.visa_col in df.columns:
+            groups = self.config['VISA_GROUPS']
+            visas = [label for label, _ in groups] + ['Expat/Other']
+            codes, uniques = _codes(df[self.visa_col])
+            visa = _relabel(codes, _match_keywords(uniques, groups), visas, len(groups))
+            df['VisaCategory_grouped'] = visa
+            stability = ['High', 'Medium', 'Variable']
+            df['Residency_stability'] = _relabel(
+                visa.codes, _lookup(pd.Index(visas), self.config['RESIDENCY_STABILITY'], stability,
+                                    'Variable'), stability)
+
+        if 'Patient_State' in df.columns:
+            df['Patient_State_missing'] = _flag(df['Patient_State'].isna().to_numpy())
+
+        if 'Gender' in df.columns:
+            codes, uniques = _codes(df['Gender'])
+            gender = pd.Series(uniques, dtype=object).map(self.config['GENDER_CODES']).fillna(-1)
+            df['Gender_encoded'] = pd.array(np.append(gender.to_numpy(dtype=np.int8), -1)[codes], dtype='Int8')
+        return df
+
+
+class BookingChannelEngineer(FeatureTransformer):
+    """
+    Booked_By_top{top_n} (the fitted top channels, the rest 'Other'),
+    Booking_channel_type and Channel_efficiency.
+    """
+
+    def __init__(self, booked_by_col: str = 'Booked_By', top_n: int = 10,
+                 config: Optional[Dict] = None):
+        super().__init__(config)
+        self.booked_by_col = booked_by_col
+        self.top_n = top_n
+
+    def _fit(self, df: pd.DataFrame) -> Dict:
+        if self.booked_by_col not in df.columns:
+            return {}
+        return {'top_channels': _top_values(df[self.booked_by_col], self.top_n)}
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.booked_by_col not in df.columns:
+            return df
+        if 'top_channels' in self.state:
+            df[f'Booked_By_top{self.top_n}'] = _group(df[self.booked_by_col], self.state['top_channels'], 'Other')
+
+        groups = self.config['BOOKING_CHANNELS']
+        types = [label for label, _ in groups] + ['Other', 'Unknown']
+        codes, uniques = _codes(df[self.booked_by_col])
+        channel = _relabel(codes, _match_keywords(uniques, groups), types, types.index('Unknown'))
+        df['Booking_channel_type'] = channel
+        efficiency = ['High', 'Medium', 'Low']
+        df['Channel_efficiency'] = _relabel(
+            channel.codes, _lookup(pd.Index(types), self.config['CHANNEL_EFFICIENCY'], efficiency, 'Medium'),
+            efficiency)
+        return df
+
+
+class StatisticalFeatureEngineer(FeatureTransformer):
+    """
+    Frequency encodings looked up in a FrequencyEncoder (see frequency.py)
+    with Doctor_volume_tier and Branch_size, integer-coded interactions of
+    the other engineers' columns (see interactions.py), and the
+    previous-visit flags.
+
+    fit() counts the frame's values, unless a `frequencies` encoder is
+    given (e.g. one loaded and updated with each day's batch); the tier cut
+    points are learned from the counts either way.
+    """
+
+    def __init__(self, frequencies: Optional[FrequencyEncoder] = None, config: Optional[Dict] = None):
+        super().__init__(config)
+        self.frequencies = frequencies
+        self._count_on_fit = frequencies is None
+        self.interactions = InteractionBuilder(self.config['INTERACTIONS'], self.config['INTERACTION_BUCKETS'])
+
+    def _fit(self, df: pd.DataFrame) -> Dict:
+        if self._count_on_fit:
+            columns = [col for col in self.config['FREQUENCY_COLUMNS'] if col in df.columns]
+            half_life = self.config['FREQUENCY_HALF_LIFE_DAYS']
+            date_col = self.config['FREQUENCY_DATE_COLUMN']
+            self.frequencies = FrequencyEncoder(columns, half_life, self.config['FREQUENCY_FALLBACK']) \
+                .update(df, date_col=date_col if half_life is not None else None)
+
+        # Tier cut points are quantiles over rows, as in the notebook
+        state = {'interactions': self.interactions.fit(df).get_state()}
+        if 'DoctorName' in df.columns and 'DoctorName' in self.frequencies.columns:
+            doctors = pd.Series(self.frequencies.counts(df['DoctorName']))
+            state['doctor_tiers'] = doctors.quantile([0.33, 0.67]).tolist()
+        if 'BranchCode' in df.columns and 'BranchCode' in self.frequencies.columns:
+            branches = pd.Series(self.frequencies.counts(df['BranchCode']))
+            state['branch_median'] = float(branches.quantile(0.5))
+        return state
+
+    def get_state(self) -> Dict:
+        return dict(self.state, frequencies=self.frequencies.get_state())
+
+    def set_state(self, state: Dict) -> 'StatisticalFeatureEngineer':
+        self.frequencies = FrequencyEncoder.from_state(state['frequencies'])
+        self.state = {key: value for key, value in state.items() if key != 'frequencies'}
+        self.interactions.set_state(state['interactions'])
+        return self
+
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        for col, out_col in self.config['FREQUENCY_COLUMNS'].items():
+            if col in df.columns and col in self.frequencies.columns:
+                df[out_col] = self.frequencies.transform(df[col])
+
+        if 'DoctorName_frequency' in df.columns and 'doctor_tiers' in self.state:
+            doctors = _numbers(df['DoctorName_frequency'])
+            codes = np.where(np.isnan(doctors), 3, np.searchsorted(self.state['doctor_tiers'], doctors, side='left'))
+            df['Doctor_volume_tier'] = pd.Categorical.from_codes(
+                codes, categories=['Low Volume', 'Medium Volume', 'High Volume', 'Unknown'])
+        if 'Branch_frequency' in df.columns and 'branch_median' in self.state:
+            large = _numbers(df['Branch_frequency']) > self.state['branch_median']
+            df['Branch_size'] = pd.Categorical.from_codes(large.astype(np.int8), categories=['Small', 'Large'])
+
+        self.interactions.transform(df)
+
+        if 'has_prev_appointment' in df.columns:
+            df['prev_visit_count'] = df['has_prev_appointment']
+            df['is_returning_patient'] = _flag((_numbers(df['has_prev_appointment']) > 0))
+        if 'LastAppointmentStatus' in df.columns:
+            codes, uniques = _codes(df['LastAppointmentStatus'])
+            matches = pd.Series(uniques, dtype=object).astype(str).str.contains(self.config['NO_SHOW_PATTERN'])
+            df['had_previous_noshow'] = _flag(np.append(matches.to_numpy(dtype=bool), False)[codes])
+        return df
+
+
+def default_engineers(config: Optional[Dict] = None) -> List[FeatureTransformer]:
+    """The notebook 02 engineers with their notebook parameters, in notebook order."""
+    return [
+        TemporalFeatureEngineer(config=config),
+        LocationFeatureEngineer(config=config),
+        DepartmentFeatureEngineer(config=config),
+        DemographicFeatureEngineer(config=config),
+        BookingChannelEngineer(config=config),
+        StatisticalFeatureEngineer(config=config),
+    ]
+
+
+class FeaturePipeline:
+    """Engineers fitted and applied in order, e.g. on HealthcarePreprocessor output."""
+
+    def __init__(self, engineers: Optional[List[FeatureTransformer]] = None,
+                 config: Optional[Dict] = None):
+        self.engineers = engineers if engineers is not None else default_engineers(config)
+
+    @property
+    def is_fitted(self) -> bool:
+        return all(engineer.is_fitted for engineer in self.engineers)
+
+    def fit(self, df: pd.DataFrame) -> 'FeaturePipeline':
+        """Fit every engineer on `df`, leaving `df` as it is."""
+        # Later engineers learn from earlier ones' features, added to a shallow copy
+        self.fit_transform(df.copy(deep=False))
+        return self
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add every engineer's features to `df` in place and return it."""
+        columns = len(df.columns)
+        for engineer in self.engineers:
+            logger.debug("Running %s", type(engineer).__name__)
+            df = engineer.transform(df)
+        logger.debug("Added %d feature columns", len(df.columns) - columns)
+        return df
+
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Fit every engineer on `df` with the features of the ones before it, adding its own."""
+        for engineer in self.engineers:
+            df = engineer.fit_transform(df)
+        logger.info("Fitted %d feature engineers on %d rows", len(self.engineers), len(df))
+        return df
+
+    def get_state(self) -> Dict:
+        """The learned state of every engineer as a JSON-serializable dict."""
+        return {
+            'version': STATE_VERSION,
+            'engineers': [[type(engineer).__name__, engineer.get_state()] for engineer in self.engineers],
+        }
+
+    def set_state(self, state: Dict) -> 'FeaturePipeline':
+        """Restore a state returned by get_state onto the same engineers."""
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(
+                f"Unsupported state version {state.get('version')} (expected {STATE_VERSION})"
+            )
+        names = [name for name, _ in state['engineers']]
+        if names != [type(engineer).__name__ for engineer in self.engineers]:
+            raise ValueError(f"State is for engineers {names}")
+        for engineer, (_, engineer_state) in zip(self.engineers, state['engineers']):
+            engineer.set_state(engineer_state)
+        return self
+
+    def save_state(self, path: str) -> None:
+        """Serialize the fitted state to a JSON artifact."""
+        if not self.is_fitted:
+            raise ValueError("Feature pipeline is not fitted; nothing to save")
+        with open(path, 'w') as f:
+            json.dump(self.get_state(), f, separators=(',', ':'), default=str)
+        logger.info("Feature state saved: %s", path)
+
+    def load_state(self, path: str) -> 'FeaturePipeline':
+        """Load a fitted state written by save_state."""
+        with open(path) as f:
+            self.set_state(json.load(f))
+        logger.info("Feature state loaded: %s", path)
+        return self
@@ -0,0 +1,214 @@
+"""
+Persisted frequency (count) encoding of categorical columns.
+
+A FrequencyEncoder keeps one table per column: the sorted 64-bit hashes of
+the values seen, next to their counts. A batch is encoded with one probe
+of a hash index per distinct value, O(1) each, broadcast through the
+column's codes; unseen values get the `fallback` count and missing values
+stay missing. A single value (online scoring) is a single probe, so a
+lone appointment gets its doctor's fitted count instead of 1.
+
+update() folds in one batch, e.g. each day's: the batch's distinct values
+are counted and merged into the table, so history is never rescanned.
+With `half_life_days` the stored counts are first decayed by the time since
+the previous update, and rows count as decayed from their own date, so
+recent activity weighs more than old.
+"""
+
+import io
+import json
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+logger = get_logger('frequency')
+
+# Version of the state written by FrequencyEncoder.get_state and save
+STATE_VERSION = 1
+
+# Hashes of single looked-up values kept before the cache is reset
+KEY_CACHE_SIZE = 100_000
+
+
+def value_keys(series: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes (-1 for missing) and 64-bit hashes of the distinct values as text."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    # Hashes of the text, unlike codes, are the same in every batch and for raw record values
+    return codes, pd.util.hash_array(np.asarray(uniques, dtype=object).astype(str).astype(object))
+
+
+class FrequencyEncoder:
+    """Per-column value counts, optionally time-decayed, with O(1) lookups."""
+
+    def __init__(self, columns: Iterable[str], half_life_days: Optional[float] = None,
+                 fallback: float = 0):
+        self.columns = list(columns)
+        self.half_life_days = half_life_days
+        # Count of values not in the table
+        self.fallback = fallback
+        self._keys: Dict[str, np.ndarray] = {col: np.empty(0, dtype=np.uint64) for col in self.columns}
+        self._counts: Dict[str, np.ndarray] = {col: np.empty(0) for col in self.columns}
+        # Hash index over the keys for batches and a dict for single values,
+        # built on first lookup after an update
+        self._index: Dict[str, pd.Index] = {}
+        self._positions_by_key: Dict[str, Dict[int, int]] = {}
+        # Hash of recently looked-up single values
+        self._key_cache: Dict[str, int] = {}
+        # Date of the last update; counts are decayed to it
+        self.as_of: Optional[pd.Timestamp] = None
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return sum(len(keys) for keys in self._keys.values())
+
+    def update(self, df: pd.DataFrame, as_of=None, date_col: Optional[str] = None) -> 'FrequencyEncoder':
+        """
+        Add the value counts of a batch.
+
+        With `half_life_days` the batch needs a date: `as_of`, or the latest
+        `date_col` value. Stored counts are decayed from the previous update
+        to it, and with `date_col` each row counts as decayed from its own
+        date, so one update over a history equals daily updates over it.
+        """
+        weights = None
+        if self.half_life_days is not None and date_col is not None:
+            dates = df[date_col]
+            if as_of is None:
+                as_of = dates.max()
+            age = ((pd.Timestamp(as_of) - dates) / pd.Timedelta(days=1)).to_numpy(dtype=float, na_value=0)
+            # Later rows count in full; rows without a date as of the batch date
+            weights = 0.5 ** (np.maximum(age, 0) / self.half_life_days)
+        as_of = None if as_of is None or pd.isna(as_of) else pd.Timestamp(as_of)
+        if self.half_life_days is not None:
+            if as_of is None:
+                raise ValueError("as_of or date_col is required to update decayed counts")
+            if self.as_of is not None:
+                elapsed = (as_of - self.as_of) / pd.Timedelta(days=1)
+                if elapsed < 0:
+                    raise ValueError(f"as_of {as_of} is before the last update {self.as_of}")
+                factor = 0.5 ** (elapsed / self.half_life_days)
+                for col in self.columns:
+                    self._counts[col] = self._counts[col] * factor
+
+        for col in self.columns:
+            if col not in df.columns:
+                continue
+            codes, keys = value_keys(df[col])
+            present = codes >= 0
+            counts = np.bincount(codes[present], None if weights is None else weights[present], minlength=len(keys))
+            # Merge on the keys; distinct values with the same text share one key
+            keys = np.concatenate([self._keys[col], keys[counts > 0]])
+            merged, inverse = np.unique(keys, return_inverse=True)
+            self._counts[col] = np.bincount(
+                inverse, weights=np.concatenate([self._counts[col], counts[counts > 0]]), minlength=len(merged))
+            self._keys[col] = merged
+            self._index.pop(col, None)
+            self._positions_by_key.pop(col, None)
+
+        self.rows += len(df)
+        if as_of is not None:
+            self.as_of = as_of if self.as_of is None else max(self.as_of, as_of)
+        logger.debug("Frequency tables updated with %d rows: %d keys", len(df), len(self))
+        return self
+
+    def _positions(self, col: str, keys: np.ndarray) -> np.ndarray:
+        """Table position of each key, -1 where unseen."""
+        index = self._index.get(col)
+        if index is None:
+            index = self._index[col] = pd.Index(self._keys[col])
+        return index.get_indexer(keys)
+
+    def counts(self, series: pd.Series, col: Optional[str] = None) -> np.ndarray:
+        """Count of each value of `series` (float; `fallback` if unseen, NaN if missing)."""
+        col = series.name if col is None else col
+        codes, keys = value_keys(series)
+        positions = self._positions(col, keys)
+        table = np.where(positions >= 0, np.append(self._counts[col], 0)[positions], self.fallback)
+        return np.append(table, np.nan)[codes]
+
+    def transform(self, series: pd.Series, col: Optional[str] = None):
+        """
+        Counts of `series` as a column: Int64 without decay, float64 (counts
+        are fractional) with it.
+        """
+        counts = self.counts(series, col)
+        if self.half_life_days is not None:
+            return counts
+        missing = np.isnan(counts)
+        return pd.arrays.IntegerArray(np.where(missing, 0, counts).astype(np.int64), missing)
+
+    def lookup(self, col: str, value) -> Optional[float]:
+        """Count of one value (None if missing): a cached hash and one dict probe."""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return None
+        text = str(value)
+        key = self._key_cache.get(text)
+        if key is None:
+            if len(self._key_cache) >= KEY_CACHE_SIZE:
+                self._key_cache.clear()
+            key = self._key_cache[text] = int(
+                pd.util.hash_array(np.array([text], dtype=object), categorize=False)[0])
+        positions = self._positions_by_key.get(col)
+        if positions is None:
+            positions = self._positions_by_key[col] = dict(zip(self._keys[col].tolist(), range(len(self._keys[col]))))
+        position = positions.get(key)
+        return float(self.fallback) if position is None else float(self._counts[col][position])
+
+    def get_state(self) -> Dict:
+        """The tables as a JSON-serializable dict."""
+        return {
+            'version': STATE_VERSION,
+            'columns': self.columns,
+            'half_life_days': self.half_life_days,
+            'fallback': self.fallback,
+            'as_of': None if self.as_of is None else self.as_of.isoformat(),
+            'rows': self.rows,
+            'tables': {col: [self._keys[col].tolist(), self._counts[col].tolist()] for col in self.columns},
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'FrequencyEncoder':
+        """Rebuild an encoder from get_state output."""
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(
+                f"Unsupported state version {state.get('version')} (expected {STATE_VERSION})"
+            )
+        encoder = cls(state['columns'], state['half_life_days'], state['fallback'])
+        encoder.as_of = None if state['as_of'] is None else pd.Timestamp(state['as_of'])
+        encoder.rows = state['rows']
+        for col, (keys, counts) in state['tables'].items():
+            encoder._keys[col] = np.asarray(keys, dtype=np.uint64)
+            encoder._counts[col] = np.asarray(counts, dtype=float)
+        return encoder
+
+    def save(self, path: str) -> None:
+        """Write the tables as a compressed NumPy archive: key and count arrays per column."""
+        meta = {key: value for key, value in self.get_state().items() if key != 'tables'}
+        arrays = {'meta': np.array(json.dumps(meta))}
+        for i, col in enumerate(self.columns):
+            arrays[f'keys_{i}'] = self._keys[col]
+            # Undecayed counts are whole numbers
+            counts = self._counts[col]
+            arrays[f'counts_{i}'] = counts if self.half_life_days is not None else counts.astype(np.int64)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        logger.info("Frequency tables saved: %s (%d keys)", path, len(self))
+
+    @classmethod
+    def load(cls, path: str) -> 'FrequencyEncoder':
+        """Read tables written by save."""
+        with open(path, 'rb') as f:
+            archive = np.load(io.BytesIO(f.read()), allow_pickle=False)
+        state = json.loads(str(archive['meta']))
+        state['tables'] = {
+            col: [archive[f'keys_{i}'], archive[f'counts_{i}']] for i, col in enumerate(state['columns'])
+        }
+        encoder = cls.from_state(state)
+        logger.info("Frequency tables loaded: %s (%d keys)", path, len(encoder))
+        return encoder
@@ -0,0 +1,169 @@
+"""
+Per-patient appointment history features, free of target leakage.
+
+For each appointment only the same customer's appointments on earlier days
+count: the number of them (`prior_appointments`), how many had a No Show
+status (`prior_no_shows`, `prior_no_show_rate`), the days since the latest
+one (`days_since_last_visit`) and how many fell in the 30, 90 and 365 days
+before (`visits_last_30d`, ...). Appointments on the same day never count
+for each other.
+
+A PatientHistory sorts the (customer, day, no-show) triples of a dataset
+once into a single int64 key, customer code * width + day, next to a
+running no-show count. The features of any set of appointments are then a
+few binary searches into that key: the rows of a customer before a day are
+the rows between the customer's first key and the key of that day, and the
+no-shows among them a difference of the running count. No Python code runs
+per patient, and one table serves a whole batch, each chunk of a stream
+(built from a pass over the file) and single records.
+"""
+
+import hashlib
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.calendar_table import MISSING_DAY
+
+# Windows, in days, of the recent visit counts
+HISTORY_WINDOWS = (30, 90, 365)
+
+# Output columns, in the order they are added
+HISTORY_FEATURES = (
+    'prior_appointments', 'prior_no_shows', 'prior_no_show_rate', 'days_since_last_visit',
+    *(f'visits_last_{window}d' for window in HISTORY_WINDOWS),
+)
+
+# Input columns the history is built from
+HISTORY_COLUMNS = ('CustomerNumber', 'AppointmentDate', 'Status')
+
+
+def customer_keys(series: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """64-bit hashes of customer numbers as text, and a mask of the non-missing ones."""
+    codes, uniques = pd.factorize(series)
+    # Hash each distinct value once; hashes, unlike codes, are comparable across frames
+    hashes = pd.util.hash_array(np.asarray(uniques, dtype=object).astype(str).astype(object))
+    return np.append(hashes, np.uint64(0))[codes], codes >= 0
+
+
+class PatientHistory:
+    """Sorted appointment days of every customer, with a running no-show count."""
+
+    def __init__(self, customers: np.ndarray, days: np.ndarray, no_show: np.ndarray):
+        """
+        `customers` are customer_keys hashes, `days` day numbers and
+        `no_show` a mask of No Show statuses; rows with a MISSING_DAY are
+        left out.
+        """
+        present = days != MISSING_DAY
+        customers, days, no_show = customers[present], days[present], no_show[present]
+        self.rows = len(days)
+        self._customers, codes = np.unique(customers, return_inverse=True)
+        self._first_day = int(days.min()) if self.rows else 0
+        # One slot past the last day, so a clipped later day counts every row
+        self._width = (int(days.max()) - self._first_day + 2) if self.rows else 1
+        keys = codes.astype(np.int64) * self._width + (days - self._first_day)
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._no_shows = np.concatenate([[0], np.cumsum(no_show[order], dtype=np.int64)])
+        self._digest = hashlib.sha256(self._keys.tobytes() + self._no_shows.tobytes()).hexdigest()[:16]
+
+    def __repr__(self) -> str:
+        # Stable across runs: the stage cache keys on it
+        return f"PatientHistory(rows={self.rows}, customers={len(self._customers)}, digest={self._digest})"
+
+    def features(self, customers: np.ndarray, days: np.ndarray,
+                 present: Optional[np.ndarray] = None,
+                 columns: Iterable[str] = HISTORY_FEATURES) -> Dict[str, np.ndarray]:
+        """
+        History `columns` of appointments by customer hash and day number:
+        Int64 arrays and a float rate, missing where the customer or day is
+        missing (`present` False or MISSING_DAY), and the no-show rate and
+        days since the last visit also where there is no earlier appointment.
+        """
+        present = days != MISSING_DAY if present is None else present & (days != MISSING_DAY)
+        # Search in customer order: nearby needles hit nearby keys instead of
+        # jumping across the whole table
+        order = np.argsort(customers)
+        customers, days, present = customers[order], days[order], present[order]
+        position = np.minimum(np.searchsorted(self._customers, customers), max(len(self._customers) - 1, 0))
+        known = present & (self._customers[position] == customers) if len(self._customers) \
+            else np.zeros(len(days), dtype=bool)
+        base = position.astype(np.int64) * self._width
+        relative = np.where(present, days, self._first_day) - self._first_day
+
+        def rows_before(day: np.ndarray) -> np.ndarray:
+            # Row position of the customer's first appointment on or after `day`
+            return np.searchsorted(self._keys, base + np.clip(day, 0, self._width - 1), side='left')
+
+        start = rows_before(np.zeros_like(relative))
+        end = rows_before(relative)
+        prior = np.where(known, end - start, 0)
+        has_prior = prior > 0
+
+        values = {'prior_appointments': prior}
+        columns = list(columns)
+        if 'prior_no_shows' in columns or 'prior_no_show_rate' in columns:
+            no_shows = np.where(known, self._no_shows[end] - self._no_shows[start], 0)
+            values['prior_no_shows'] = no_shows
+            values['prior_no_show_rate'] = np.divide(no_shows, prior, out=np.zeros(len(prior)), where=has_prior)
+        if 'days_since_last_visit' in columns:
+            last = self._keys[np.maximum(end - 1, 0)] - base if len(self._keys) else np.zeros_like(relative)
+            values['days_since_last_visit'] = relative - last
+        for window in HISTORY_WINDOWS:
+            col = f'visits_last_{window}d'
+            if col in columns:
+                values[col] = np.where(known, end - rows_before(relative - window), 0)
+
+        missing = ~present
+        undefined = missing | ~has_prior
+        # Back to the input order
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        output = {}
+        for col in columns:
+            if col == 'prior_no_show_rate':
+                output[col] = np.where(undefined, np.nan, values[col])[inverse]
+            else:
+                mask = undefined if col == 'days_since_last_visit' else missing
+                output[col] = pd.arrays.IntegerArray(values[col].astype(np.int64)[inverse], mask[inverse])
+        return output
+
+    def record_features(self, customer, day: Optional[int],
+                        columns: Sequence[str] = HISTORY_FEATURES) -> Dict[str, Optional[float]]:
+        """
+        History `columns` of one appointment (None where missing): the
+        features() lookups with scalar searches, for online scoring.
+        """
+        if customer is None or day is None or day == MISSING_DAY:
+            return dict.fromkeys(columns)
+        # Factorizing a single value first (categorize) costs more than the hash
+        key = pd.util.hash_array(np.array([str(customer)], dtype=object), categorize=False)[0]
+        position = int(np.searchsorted(self._customers, key))
+        known = position < len(self._customers) and self._customers[position] == key
+        base = position * self._width
+        relative = day - self._first_day
+
+        def rows_before(day: int) -> int:
+            return int(np.searchsorted(self._keys, base + min(max(day, 0), self._width - 1)))
+
+        start = end = 0
+        if known:
+            start, end = rows_before(0), rows_before(relative)
+        prior = end - start
+        no_shows = int(self._no_shows[end] - self._no_shows[start])
+        values = {
+            'prior_appointments': prior,
+            'prior_no_shows': no_shows,
+            'prior_no_show_rate': no_shows / prior if prior else None,
+            'days_since_last_visit': relative - (int(self._keys[end - 1]) - base) if prior else None,
+        }
+        output = {}
+        for col in columns:
+            if col.startswith('visits_last_'):
+                window = int(col[len('visits_last_'):-1])
+                output[col] = end - rows_before(relative - window) if known else 0
+            else:
+                output[col] = values[col]
+        return output
@@ -0,0 +1,349 @@
+"""
+Incremental preprocessing into a partitioned Parquet store.
+
+Instead of reprocessing the full history every night, an IncrementalStore
+keeps the processed output partitioned by appointment month and, for each
+run, processes only the AppointmentIds that are new or whose raw row changed
+since they were stored:
+
+- Watermarks on AppointmentDate and Booked_Date_Time (the latest values seen)
+  select the candidate rows. Rows booked or scheduled after the watermarks are
+  new. Rows with an appointment within CONFIG['INCREMENTAL_LOOKBACK_DAYS'] of
+  the booking watermark, or later, may still get a status update. Older rows
+  are treated as final and skipped.
+- A row hash per AppointmentId tells new and changed candidates from ones
+  already stored unchanged.
+- Changed rows are processed with the store's fitted state (fitted on the
+  first run) and replace their previous version. Their history features
+  are looked up in the whole extract (or in the preprocessor's `history`,
+  when set). Stored rows of the same patients on later days are
+  reprocessed too, as their history now counts the changed rows. Each affected month
+  partition is rewritten atomically. Rows a late update filters out, e.g. a
+  status that no longer passes the Status filter, are removed.
+
+Store layout:
+    <root>/_manifest.json            watermarks, partitions and the last run summary
+    <root>/_state.json               fitted preprocessor state
+    <root>/_index.parquet            AppointmentId -> row hash, partition, customer and day
+    <root>/appt_month=YYYY-MM/part.parquet
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import HealthcarePreprocessor
+from history import customer_keys
+from ingestion import check_rows
+from utils.calendar_table import MISSING_DAY, day_numbers
+from utils.logger import get_logger, run_context
+
+logger = get_logger('incremental')
+
+STORE_VERSION = 1
+MANIFEST_FILE = '_manifest.json'
+STATE_FILE = '_state.json'
+INDEX_FILE = '_index.parquet'
+WATERMARK_COLUMNS = ('AppointmentDate', 'Booked_Date_Time')
+
+
+class IncrementalStore:
+    """Append-only, month-partitioned output store updated from daily extracts."""
+
+    def __init__(self, root: str, preprocessor: Optional[HealthcarePreprocessor] = None):
+        self.root = root
+        self.preprocessor = preprocessor or HealthcarePreprocessor()
+        os.makedirs(root, exist_ok=True)
+        self.manifest = self._load_manifest()
+        state_path = os.path.join(root, STATE_FILE)
+        if os.path.exists(state_path) and not self.preprocessor.is_fitted:
+            self.preprocessor.load_state(state_path)
+
+    @property
+    def watermarks(self) -> Dict[str, Optional[pd.Timestamp]]:
+        """Latest AppointmentDate and Booked_Date_Time seen so far (None before the first run)."""
+        return {
+            col: pd.Timestamp(value) if value else None
+            for col, value in self.manifest['watermarks'].items()
+        }
+
+    def update(self, df: pd.DataFrame) -> Dict[str, int]:
+        """
+        Apply a raw extract (as loaded by HealthcarePreprocessor.load_data) to the store.
+
+        Returns run counts: rows read, candidates, new and changed IDs, rows
+        reprocessed for their history features, rows written and partitions
+        rewritten.
+        """
+        if 'AppointmentId' not in df.columns:
+            raise ValueError("Incremental processing needs an AppointmentId column")
+
+        with run_context():
+            rows_in = len(df)
+            # The last well-formed row of an ID in the extract is its latest
+            # version, as ingestion decides it
+            ingestion = check_rows(df, 'AppointmentId', self.preprocessor.config['STATUS_MAPPING'])
+            if ingestion.malformed.invalid_rows:
+                logger.warning("Skipping %d malformed rows", ingestion.malformed.invalid_rows)
+            df = df[ingestion.keep]
+
+            dates = self._parse_watermark_columns(df)
+            candidate_mask = self._candidate_mask(dates, len(df))
+            candidates = df[candidate_mask]
+            hashes = row_hash(candidates)
+
+            index = self._load_index()
+            positions = index.index.get_indexer(candidates['AppointmentId'].to_numpy())
+            is_new = positions < 0
+            is_changed = np.zeros(len(candidates), dtype=bool)
+            if len(index):
+                stored = index['row_hash'].to_numpy()[np.where(is_new, 0, positions)]
+                is_changed = ~is_new & (stored != hashes)
+            update_mask = np.zeros(len(df), dtype=bool)
+            update_mask[np.flatnonzero(candidate_mask)[is_new | is_changed]] = True
+            # Later appointments of the same patients count these rows in their history
+            customers, days = self._history_keys(df, dates)
+            dependents = self._history_dependents(df, customers, days, update_mask, index)
+            reprocess = update_mask | dependents
+            changed = df[reprocess]
+            changed_ids = changed['AppointmentId'].to_numpy()
+            changed_row_hashes = row_hash(changed) if dependents.any() else hashes[is_new | is_changed]
+
+            summary = {
+                'rows_in': rows_in,
+                'candidates': len(candidates),
+                'new': int(is_new.sum()),
+                'changed': int(is_changed.sum()),
+                'history_updates': int(dependents.sum()),
+                'rows_written': 0,
+                'partitions_rewritten': 0,
+            }
+            if len(changed):
+                # History features of the changed rows count the extract's other appointments too
+                history = self.preprocessor.history
+                if history is None:
+                    self.preprocessor.history = self.preprocessor.patient_history(df)
+                try:
+                    # The changed rows are processed in place; use changed_ids from here on
+                    written, rewritten, partition_of_id = self._apply_changes(changed, changed_ids, index)
+                finally:
+                    self.preprocessor.history = history
+                summary.update(rows_written=written, partitions_rewritten=rewritten)
+                changed_hashes = pd.DataFrame({
+                    'row_hash': changed_row_hashes,
+                    'partition': partition_of_id.reindex(changed_ids).fillna('').to_numpy(),
+                    'customer_key': customers[reprocess],
+                    'appointment_day': days[reprocess],
+                }, index=pd.Index(changed_ids, name='AppointmentId'))
+                index = pd.concat([index.drop(changed_hashes.index, errors='ignore'), changed_hashes])
+                self._save_index(index)
+
+            self._advance_watermarks(dates)
+            self.manifest['last_run'] = summary
+            self._save_manifest()
+            logger.info("Incremental run: %d rows, %d candidates, %d new, %d changed, "
+                        "%d history updates, %d rows written to %d partitions",
+                        rows_in, summary['candidates'], summary['new'], summary['changed'],
+                        summary['history_updates'], summary['rows_written'],
+                        summary['partitions_rewritten'], extra=summary)
+        return summary
+
+    def read(self, partitions: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read the stored output, optionally only the given 'YYYY-MM' partitions."""
+        keys = sorted(self.manifest['partitions']) if partitions is None else partitions
+        frames = [pd.read_parquet(self._partition_path(key)) for key in keys
+                  if key in self.manifest['partitions']]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    # ------------------------------------------------------------------
+    # Change detection
+    # ------------------------------------------------------------------
+
+    def _parse_watermark_columns(self, df: pd.DataFrame) -> Dict[str, pd.Series]:
+        """Parsed watermark columns of the raw extract."""
+        formats = self.preprocessor.config['DATE_FORMATS']
+        dates = {}
+        for col in WATERMARK_COLUMNS:
+            if col not in df.columns:
+                continue
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                dates[col] = df[col]
+            else:
+                dates[col], _ = self.preprocessor._parse_date_column(df[col], formats.get(col))
+        return dates
+
+    def _candidate_mask(self, dates: Dict[str, pd.Series], n_rows: int) -> np.ndarray:
+        """Rows that may be new or changed since the last run."""
+        watermarks = self.watermarks
+        if not dates or any(watermarks.get(col) is None for col in dates):
+            return np.ones(n_rows, dtype=bool)
+
+        mask = np.zeros(n_rows, dtype=bool)
+        for col, values in dates.items():
+            # Missing dates cannot be compared; check those rows by hash
+            mask |= (values > watermarks[col]).to_numpy() | values.isna().to_numpy()
+
+        # Appointments that are recent or upcoming may still change status
+        now = watermarks.get('Booked_Date_Time') or watermarks['AppointmentDate']
+        lookback = pd.Timedelta(days=self.preprocessor.config['INCREMENTAL_LOOKBACK_DAYS'])
+        if 'AppointmentDate' in dates:
+            mask |= (dates['AppointmentDate'] >= now - lookback).to_numpy()
+        return mask
+
+    @staticmethod
+    def _history_keys(df: pd.DataFrame, dates: Dict[str, pd.Series]):
+        """Customer hash and appointment day number of each row (MISSING_DAY if either is missing)."""
+        if 'CustomerNumber' not in df.columns or 'AppointmentDate' not in dates:
+            return np.zeros(len(df), dtype=np.uint64), np.full(len(df), MISSING_DAY, dtype=np.int64)
+        customers, present = customer_keys(df['CustomerNumber'])
+        return customers, np.where(present, day_numbers(dates['AppointmentDate']), MISSING_DAY)
+
+    @staticmethod
+    def _history_dependents(df: pd.DataFrame, customers: np.ndarray, days: np.ndarray,
+                            update_mask: np.ndarray, index: pd.DataFrame) -> np.ndarray:
+        """
+        Rows outside `update_mask` whose history features an updated row
+        enters or leaves: appointments of the same customer on a later day
+        than the row's new or stored appointment.
+        """
+        update_customers, update_days = [customers[update_mask]], [days[update_mask]]
+        if 'appointment_day' in index.columns:
+            positions = index.index.get_indexer(df['AppointmentId'].to_numpy()[update_mask])
+            positions = positions[positions >= 0]
+            update_customers.append(index['customer_key'].to_numpy()[positions])
+            update_days.append(index['appointment_day'].to_numpy()[positions])
+        update_customers, update_days = np.concatenate(update_customers), np.concatenate(update_days)
+        known = update_days != MISSING_DAY
+        if not known.any():
+            return np.zeros(len(df), dtype=bool)
+        # Earliest updated day per customer
+        first = pd.Series(update_days[known]).groupby(update_customers[known]).min()
+        position = first.index.get_indexer(customers)
+        first_day = np.where(position >= 0, first.to_numpy()[position], np.iinfo(np.int64).max)
+        return ~update_mask & (days != MISSING_DAY) & (days > first_day)
+
+    def _advance_watermarks(self, dates: Dict[str, pd.Series]) -> None:
+        """Move each watermark to the latest value seen, never backwards."""
+        for col, values in dates.items():
+            latest = values.max()
+            current = self.watermarks.get(col)
+            if pd.notna(latest) and (current is None or latest > current):
+                self.manifest['watermarks'][col] = latest.isoformat()
+
+    # ------------------------------------------------------------------
+    # Partition maintenance
+    # ------------------------------------------------------------------
+
+    def _apply_changes(self, changed: pd.DataFrame, changed_ids: np.ndarray, index: pd.DataFrame):
+        """
+        Process changed rows and rewrite the partitions they leave or enter.
+
+        Returns rows written, partitions rewritten and the new partition of
+        each AppointmentId that passed the pipeline's filters.
+        """
+        if self.preprocessor.is_fitted:
+            processed = self.preprocessor.transform(changed, inplace=True)
+        else:
+            processed = self.preprocessor.fit_transform(changed, inplace=True)
+            self.preprocessor.save_state(os.path.join(self.root, STATE_FILE))
+
+        keys = partition_keys(processed)
+        old_keys = index['partition'].reindex(changed_ids).dropna()
+        affected = sorted(set(old_keys[old_keys != '']) | set(keys))
+
+        written = 0
+        for key in affected:
+            new_rows = processed[keys == key]
+            self._rewrite_partition(key, changed_ids, new_rows)
+            written += len(new_rows)
+
+        partition_of_id = pd.Series(keys, index=processed['AppointmentId'].to_numpy())
+        return written, len(affected), partition_of_id
+
+    def _rewrite_partition(self, key: str, replaced_ids: np.ndarray, new_rows: pd.DataFrame) -> None:
+        """Replace the rows of `replaced_ids` in partition `key` with `new_rows`."""
+        path = self._partition_path(key)
+        frames = []
+        if key in self.manifest['partitions']:
+            existing = pd.read_parquet(path)
+            frames.append(existing[~existing['AppointmentId'].isin(replaced_ids).to_numpy()])
+        frames.append(new_rows)
+        df = pd.concat(frames, ignore_index=True)
+
+        if df.empty:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+            del self.manifest['partitions'][key]
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        self.preprocessor.save_data(df, tmp_path, 'parquet')
+        os.replace(tmp_path, path)
+        self.manifest['partitions'][key] = {'rows': len(df)}
+
+    def _partition_path(self, key: str) -> str:
+        return os.path.join(self.root, f'appt_month={key}', 'part.parquet')
+
+    # ------------------------------------------------------------------
+    # Metadata files
+    # ------------------------------------------------------------------
+
+    def _load_manifest(self) -> Dict:
+        path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {
+                'version': STORE_VERSION,
+                'watermarks': {col: None for col in WATERMARK_COLUMNS},
+                'partitions': {},
+                'last_run': None,
+            }
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(
+                f"Unsupported store version {manifest.get('version')} (expected {STORE_VERSION})"
+            )
+        return manifest
+
+    def _save_manifest(self) -> None:
+        # Written last and atomically: a failed run leaves the previous
+        # watermarks, so its rows are picked up again by the next run
+        path = os.path.join(self.root, MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=1, default=str)
+        os.replace(path + '.tmp', path)
+
+    def _load_index(self) -> pd.DataFrame:
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return pd.DataFrame(
+                {'row_hash': pd.Series(dtype='uint64'), 'partition': pd.Series(dtype=object),
+                 'customer_key': pd.Series(dtype='uint64'), 'appointment_day': pd.Series(dtype='int64')},
+                index=pd.Index([], dtype=object, name='AppointmentId'),
+            )
+        return pd.read_parquet(path)
+
+    def _save_index(self, index: pd.DataFrame) -> None:
+        path = os.path.join(self.root, INDEX_FILE)
+        index.to_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+
+def row_hash(df: pd.DataFrame) -> np.ndarray:
+    """
+    64-bit hash of each raw row, independent of column order and dtypes
+    (a categorical hashes like the strings it holds).
+    """
+    columns = sorted(df.columns)
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def partition_keys(df: pd.DataFrame) -> np.ndarray:
+    """'YYYY-MM' partition key of each processed row, from its appointment month."""
+    return df['AppointmentDate'].dt.strftime('%Y-%m').to_numpy(dtype=object)
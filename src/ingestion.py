@@ -0,0 +1,156 @@
+"""
+Ingestion-time removal of malformed rows and duplicate appointments.
+
+A row is malformed when its AppointmentId is missing or not numeric, or its
+Status is missing or not a known status (the column-shifted rows notebook 01
+removed by listing their stray Status and BranchCode values). Among the
+well-formed rows of one AppointmentId only the last is kept: later rows of
+an extract carry the appointment's latest status.
+
+Everything is decided in one hash pass over the ID column: the IDs are
+factorized once, the numeric check runs on the distinct IDs and is
+broadcast through the codes, and the last row of each ID is a scatter-max
+of row positions over the codes.
+
+Chunked runs cannot see later chunks, so a LatestRows table is built first
+from a pass over the ID and Status columns. It keeps a hash of every
+well-formed ID with its global row number and resolves which rows later
+rows supersede, so each chunk drops exactly the rows a batch run would.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from validation import ValidationResult
+
+# AppointmentIds are digits only
+ID_PATTERN = r'\d+'
+
+# Quarantine labels of malformed rows
+MALFORMED_ID = 'malformed_appointment_id'
+UNKNOWN_STATUS = 'unknown_status'
+# Quarantine label of well-formed rows a later row of the same ID supersedes
+SUPERSEDED = 'superseded_duplicate'
+
+
+class IngestionResult:
+    """Rows of one frame to keep, with the reasons others are dropped."""
+
+    def __init__(self, keep: np.ndarray, malformed: ValidationResult, duplicates: int):
+        self.keep = keep
+        # Per-reason masks of malformed rows, in the form QuarantineWriter takes
+        self.malformed = malformed
+        self.duplicates = duplicates
+
+    @property
+    def superseded(self) -> np.ndarray:
+        """Mask of well-formed rows dropped for a later row of the same ID."""
+        return ~self.keep & ~self.malformed.invalid
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable report."""
+        return {
+            'rows': self.malformed.rows,
+            'kept': int(self.keep.sum()),
+            'malformed': self.malformed.invalid_rows,
+            'malformed_by_reason': self.malformed.violations,
+            'duplicates': self.duplicates,
+        }
+
+
+def check_rows(df: pd.DataFrame, id_column: str, statuses: Iterable[str],
+               superseded: Optional[np.ndarray] = None) -> IngestionResult:
+    """
+    Malformed rows and superseded duplicates of `df`, in one pass over
+    `id_column`. `superseded` marks rows that rows outside `df` supersede,
+    e.g. in later chunks of the same file (see LatestRows.mask).
+    """
+    codes, _, valid, masks = _well_formed(df, id_column, statuses)
+    # Last well-formed row of each ID
+    last = np.full(codes.max(initial=-1) + 1, -1, dtype=np.int64)
+    np.maximum.at(last, codes[valid], np.flatnonzero(valid))
+    keep = np.zeros(len(df), dtype=bool)
+    keep[last[last >= 0]] = True
+    if superseded is not None:
+        keep &= ~superseded
+    duplicates = int(valid.sum() - keep.sum())
+    return IngestionResult(keep, ValidationResult(len(df), masks, []), duplicates)
+
+
+class LatestRows:
+    """
+    Rows superseded by a later row of the same AppointmentId, over a stream
+    of chunks. add() the chunks in order, then finish(); select() then
+    drops the superseded rows from each chunk of the same stream.
+    """
+
+    def __init__(self, id_column: str, statuses: Iterable[str]):
+        self.id_column = id_column
+        self.statuses = list(statuses)
+        self.rows = 0
+        self._keys: List[np.ndarray] = []
+        self._positions: List[np.ndarray] = []
+        self.superseded: Optional[np.ndarray] = None
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        """Record the well-formed IDs of the next chunk."""
+        codes, uniques, valid, _ = _well_formed(chunk, self.id_column, self.statuses)
+        # Hash each distinct ID once; hashes, unlike codes, are comparable across chunks
+        hashes = pd.util.hash_array(uniques.astype(object))
+        self._keys.append(hashes[codes[valid]])
+        self._positions.append(self.rows + np.flatnonzero(valid))
+        self.rows += len(chunk)
+
+    def finish(self) -> 'LatestRows':
+        """Resolve the global rows that a later row of the same ID supersedes."""
+        keys = np.concatenate(self._keys) if self._keys else np.empty(0, dtype=np.uint64)
+        positions = np.concatenate(self._positions) if self._positions else np.empty(0, dtype=np.int64)
+        self._keys, self._positions = [], []
+        duplicated = pd.Series(keys).duplicated(keep='last').to_numpy()
+        self.superseded = positions[duplicated]
+        return self
+
+    def mask(self, offset: int, rows: int) -> np.ndarray:
+        """Mask of the superseded rows among `rows` rows starting at global row `offset`."""
+        start, stop = np.searchsorted(self.superseded, [offset, offset + rows])
+        mask = np.zeros(rows, dtype=bool)
+        mask[self.superseded[start:stop] - offset] = True
+        return mask
+
+    def select(self, chunk: pd.DataFrame, offset: int) -> pd.DataFrame:
+        """The rows of a chunk starting at global row `offset` that are not superseded."""
+        mask = self.mask(offset, len(chunk))
+        return chunk[~mask] if mask.any() else chunk
+
+
+def merge_ingestion_reports(reports: List[Dict]) -> Dict:
+    """Combine the reports of the chunks of one input."""
+    merged = {'rows': 0, 'kept': 0, 'malformed': 0, 'malformed_by_reason': {}, 'duplicates': 0}
+    for report in reports:
+        if not report:
+            continue
+        for key in ('rows', 'kept', 'malformed', 'duplicates'):
+            merged[key] += report[key]
+        for reason, count in report['malformed_by_reason'].items():
+            merged['malformed_by_reason'][reason] = merged['malformed_by_reason'].get(reason, 0) + count
+    return merged
+
+
+def _well_formed(df: pd.DataFrame, id_column: str, statuses: Iterable[str]):
+    """
+    ID codes (-1 for missing) and distinct IDs, a mask of well-formed rows,
+    and per-reason masks of malformed rows.
+    """
+    codes, uniques = pd.factorize(df[id_column])
+    # IDs read without the input schema may be integers; match their text
+    uniques = np.asarray(uniques, dtype=object).astype(str)
+    numeric = pd.Series(uniques, dtype=object).str.fullmatch(ID_PATTERN).to_numpy(dtype=bool, na_value=False)
+    valid = np.append(numeric, False)[codes]
+    masks = {MALFORMED_ID: ~valid}
+    if 'Status' in df.columns:
+        known = df['Status'].isin(list(statuses)).to_numpy()
+        masks[UNKNOWN_STATUS] = ~known
+        valid = valid & known
+    return codes, uniques, valid, masks
@@ -0,0 +1,156 @@
+"""
+Interaction features of two or more categorical columns as integer codes.
+
+An interaction of columns a, b, c gets the mixed-radix code
+(code_a * card_b + code_b) * card_c + code_c, where each column's codes
+index the levels learned by fit() and card is the number of levels plus
+one slot for missing and unseen values. The code space is the product of
+the cardinalities, so the column has the smallest integer dtype that holds
+it (int8 for the notebook's pairs) instead of one Python string per row.
+
+Interactions given a bucket count are hashed instead: each value's 64-bit
+hash (see frequency.value_keys) is mixed into the row's hash, column by
+column, and the result is taken modulo the buckets. That needs no fitted
+levels and keeps the width fixed for columns of any cardinality, at the
+price of collisions.
+
+Either way the work is one code or hash lookup per distinct value and a few
+integer operations per row and column, for pairs and triples alike.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from frequency import value_keys
+
+# Multiplier and finalizer constants of the row hash (splitmix64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_FINAL = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+
+def code_dtype(size: int) -> np.dtype:
+    """Smallest signed integer dtype holding codes 0 .. size - 1."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size - 1 <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _levels(series: pd.Series) -> List:
+    """Levels of a column: a categorical's own, else its distinct values sorted as text."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.categories.tolist()
+    return sorted(pd.unique(series.dropna()).tolist(), key=str)
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads every input bit over the output."""
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * _FINAL[0]
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * _FINAL[1]
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+class InteractionBuilder:
+    """Integer interaction columns: name -> the columns combined."""
+
+    def __init__(self, interactions: Dict[str, Sequence[str]], buckets: Optional[Dict[str, int]] = None):
+        for name, columns in interactions.items():
+            if len(columns) < 2:
+                raise ValueError(f"Interaction {name!r} needs at least two columns, got {list(columns)}")
+        self.interactions = {name: list(columns) for name, columns in interactions.items()}
+        # Hashed interactions and their bucket counts
+        self.buckets = dict(buckets or {})
+        # Fitted levels per input column of the coded interactions
+        self.levels: Dict[str, List] = {}
+
+    def fit(self, df: pd.DataFrame) -> 'InteractionBuilder':
+        """Learn the levels of the columns the coded interactions combine."""
+        self.levels = {}
+        for name, columns in self.interactions.items():
+            if name not in self.buckets:
+                for col in columns:
+                    if col in df.columns and col not in self.levels:
+                        self.levels[col] = _levels(df[col])
+        return self
+
+    def cardinality(self, name: str) -> int:
+        """Number of codes of an interaction."""
+        if name in self.buckets:
+            return self.buckets[name]
+        return int(np.prod([len(self.levels[col]) + 1 for col in self.interactions[name]]))
+
+    def available(self, name: str, columns) -> bool:
+        """Whether an interaction's inputs are present (and fitted, unless hashed)."""
+        return all(col in columns and (name in self.buckets or col in self.levels)
+                   for col in self.interactions[name])
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add every interaction whose inputs are present to `df` in place and return it."""
+        for name in self.interactions:
+            if self.available(name, df.columns):
+                df[name] = self.codes(df, name)
+        return df
+
+    def codes(self, df: pd.DataFrame, name: str) -> np.ndarray:
+        """Integer codes of one interaction for the rows of `df`."""
+        if name in self.buckets:
+            return self._hashed(df, name)
+        combined = np.zeros(len(df), dtype=np.int64)
+        for col in self.interactions[name]:
+            size = len(self.levels[col]) + 1
+            combined = combined * size + self._column_codes(df[col], col)
+        return combined.astype(code_dtype(self.cardinality(name)))
+
+    def _column_codes(self, series: pd.Series, col: str) -> np.ndarray:
+        """Position of each value in the fitted levels; the last slot for missing or unseen ones."""
+        levels = self.levels[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series)
+        positions = pd.Index(levels).get_indexer(uniques)
+        positions[positions < 0] = len(levels)
+        return np.append(positions, len(levels))[codes]
+
+    def _hashed(self, df: pd.DataFrame, name: str) -> np.ndarray:
+        combined = np.zeros(len(df), dtype=np.uint64)
+        for col in self.interactions[name]:
+            codes, keys = value_keys(df[col])
+            # Missing values hash to 0
+            combined = _mix(combined * _MIX + np.append(keys, np.uint64(0))[codes])
+        buckets = self.buckets[name]
+        return (combined % np.uint64(buckets)).astype(code_dtype(buckets))
+
+    def decode(self, name: str, codes) -> pd.Series:
+        """
+        'a_b' labels of a coded interaction's codes, as the notebook's string
+        concatenation built them (missing where a value was missing or unseen).
+        """
+        if name in self.buckets:
+            raise ValueError(f"Hashed interaction {name!r} cannot be decoded")
+        index = codes.index if isinstance(codes, pd.Series) else None
+        codes = np.asarray(codes, dtype=np.int64)
+        occurring, inverse = np.unique(codes, return_inverse=True)
+        known = np.ones(len(occurring), dtype=bool)
+        remainder = occurring.copy()
+        parts = []
+        for col in reversed(self.interactions[name]):
+            levels = self.levels[col]
+            digit = remainder % (len(levels) + 1)
+            remainder //= len(levels) + 1
+            known &= digit < len(levels)
+            parts.append(np.append(np.asarray(levels, dtype=object).astype(str), '')[digit].astype(object))
+        labels = parts[-1]
+        for part in reversed(parts[:-1]):
+            labels = labels + '_' + part
+        return pd.Series(np.where(known, labels, np.nan)[inverse], index=index)
+
+    def get_state(self) -> Dict:
+        """The fitted levels as a JSON-serializable dict."""
+        return {'levels': self.levels}
+
+    def set_state(self, state: Dict) -> 'InteractionBuilder':
+        self.levels = state['levels']
+        return self
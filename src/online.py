@@ -0,0 +1,305 @@
+"""
+Low-latency feature vectors for single records (online scoring).
+
+preprocess_data on a one-row frame pays the fixed cost of a pandas run:
+frame construction, dtype inference, `pd.cut`, categorical conversions.
+An OnlineTransformer compiles the state of a fitted HealthcarePreprocessor
+into plain Python lookup tables (category codes, rare-value sets, bin edges,
+a per-day calendar cache and a parsed-date cache) and maps a raw record, a
+dict of input values as they appear in the CSV, straight to a NumPy vector.
+
+The vector holds, for each feature column, the value encode_frame gives for
+the batch output: the code of a categorical in its fitted levels (-1 for
+missing or unseen values) or the number as float (NaN for missing). Records
+the batch pipeline would filter out (Status, malformed ID, invalid age)
+yield no vector. History features are looked up in a PatientHistory (see
+history.py) and are left out of the default columns without one.
+"""
+
+import math
+import re
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from history import HISTORY_FEATURES, PatientHistory
+from ingestion import ID_PATTERN
+from preprocessing import FEATURES, NO_SHOW_STATUSES, SEASON_BY_MONTH, HealthcarePreprocessor
+from utils.calendar_table import WEEKEND_DAYS
+
+# Parsed-date cache entries kept per date column before the cache is reset
+DATE_CACHE_SIZE = 100_000
+
+# Values that fill missing inputs in clean_initial_data
+FILL_VALUES = {
+    'LastAppointmentStatus': 'No Prior Visit',
+    'Previous_Payment_Mode': 'FirstTime',
+}
+
+# Well-formed AppointmentIds, as ingestion.check_rows accepts them
+_ID = re.compile(ID_PATTERN)
+
+# Ordinal of day number 0 (see utils.calendar_table.day_numbers)
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+# Range of datetime64[ns]; later or earlier dates do not parse in pandas
+_TIMESTAMP_MIN = pd.Timestamp.min.ceil('us').to_pydatetime()
+_TIMESTAMP_MAX = pd.Timestamp.max.floor('us').to_pydatetime()
+
+
+def feature_columns(preprocessor: HealthcarePreprocessor) -> List[str]:
+    """Fitted output columns that are model features: not identifiers, dates or the target."""
+    return [
+        col for col, dtype in preprocessor.output_dtypes.items()
+        if not dtype.startswith(('datetime64', 'string')) and col != 'Target'
+    ]
+
+
+def encode_frame(df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+    """
+    Feature matrix of a processed frame: category codes (-1 for missing)
+    and numbers as float (NaN for missing), one row per row of `df`.
+    """
+    matrix = np.empty((len(df), len(columns)))
+    for j, col in enumerate(columns):
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            matrix[:, j] = series.cat.codes.to_numpy()
+        else:
+            matrix[:, j] = series.to_numpy(dtype=float, na_value=np.nan)
+    return matrix
+
+
+class OnlineTransformer:
+    """Per-record feature vectors from a fitted HealthcarePreprocessor."""
+
+    def __init__(self, preprocessor: HealthcarePreprocessor,
+                 columns: Optional[Sequence[str]] = None,
+                 history: Optional[PatientHistory] = None):
+        """`history` defaults to the preprocessor's `history`."""
+        if not preprocessor.is_fitted:
+            raise ValueError("Preprocessor is not fitted; call fit() or load_state() first")
+        config = preprocessor.config
+        self._history = history if history is not None else preprocessor.history
+        if columns is not None:
+            self.columns = list(columns)
+        else:
+            self.columns = [col for col in feature_columns(preprocessor)
+                            if self._history is not None or col not in HISTORY_FEATURES]
+        unknown = [col for col in self.columns if col not in preprocessor.output_dtypes]
+        if unknown:
+            raise ValueError(f"Columns not in the fitted output: {unknown}")
+        self._history_columns = [col for col in self.columns if col in HISTORY_FEATURES]
+        if self._history_columns and self._history is None:
+            raise ValueError(f"History columns need a PatientHistory: {self._history_columns}")
+
+        self._id_column = config.get('DEDUPE_KEY')
+        self._date_formats = config['DATE_FORMATS']
+        self._date_cache: Dict[str, Dict] = {col: {} for col in self._date_formats}
+        self._calendar_cache: Dict[int, Tuple] = {}
+        self._holidays = {pd.Timestamp(day).toordinal() for day in config.get('CALENDAR_HOLIDAYS', [])}
+        self._ramadan = [(pd.Timestamp(start).toordinal(), pd.Timestamp(end).toordinal())
+                         for start, end in config.get('CALENDAR_RAMADAN', [])]
+        self._age_bins, self._age_labels = config['AGE_BINS'], config['AGE_LABELS']
+        self._recency_bins, self._recency_labels = config['RECENCY_BINS'], config['RECENCY_LABELS']
+        self._leadtime_bins, self._leadtime_labels = config['LEADTIME_BINS'], config['LEADTIME_LABELS']
+
+        self._top_values: Dict[str, frozenset] = {}
+        for out_col in config['RARE_GROUPING']:
+            if out_col in self.columns:
+                if out_col not in preprocessor.rare_vocab:
+                    raise ValueError(f"Fitted state has no rare-category vocabulary for {out_col}")
+                self._top_values[out_col] = frozenset(preprocessor.rare_vocab[out_col])
+
+        self._encoders: List[Tuple[str, Callable]] = [
+            (col, self._encoder(col, preprocessor.output_dtypes[col],
+                                preprocessor.category_levels.get(col, [])))
+            for col in self.columns
+        ]
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def transform_record(self, record: Mapping) -> Optional[np.ndarray]:
+        """Feature vector of one raw record, or None if the pipeline would drop it."""
+        values = self._derive(record)
+        if values is None:
+            return None
+        return np.array([encode(values.get(col)) for col, encode in self._encoders])
+
+    def transform_records(self, records: Sequence[Mapping]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Feature matrix of a micro-batch: one row per kept record, in order,
+        and a boolean mask of the records kept.
+        """
+        rows, kept = [], np.zeros(len(records), dtype=bool)
+        for i, record in enumerate(records):
+            values = self._derive(record)
+            if values is not None:
+                rows.append([encode(values.get(col)) for col, encode in self._encoders])
+                kept[i] = True
+        matrix = np.array(rows) if rows else np.empty((0, len(self.columns)))
+        return matrix, kept
+
+    # ------------------------------------------------------------------
+    # Feature derivation, mirroring the pipeline stages for one record
+    # ------------------------------------------------------------------
+
+    def _derive(self, record: Mapping) -> Optional[Dict]:
+        """Output values of one record by column name (None if filtered out)."""
+        if 'Status' in record and record['Status'] not in NO_SHOW_STATUSES:
+            return None
+        if self._id_column in record and not _ID.fullmatch(str(record[self._id_column])):
+            return None
+
+        dob = self._date('DOB', record.get('DOB'))
+        appt = self._date('AppointmentDate', record.get('AppointmentDate'))
+        if dob is None or appt is None:
+            return None
+        values = dict(record)
+        for col, fill in FILL_VALUES.items():
+            if col in values and _missing(values[col]):
+                values[col] = fill
+
+        age = (appt - dob).days // 365
+        values['age_at_visit'] = age
+        values['age_band'] = _bucket(age, self._age_bins, self._age_labels, right=False)
+
+        (values['birth_year'], values['birth_month'], values['birth_day'], _, _,
+         values['birth_dayofweek'], *_) = self._calendar(dob)
+        (values['appt_year'], values['appt_month'], values['appt_day'], values['appt_quarter'],
+         values['appt_weekofyear'], values['appt_dayofweek'], values['appt_weekofmonth'],
+         values['is_weekend'], values['season'], values['appt_is_holiday'],
+         values['appt_is_ramadan']) = self._calendar(appt)
+
+        if 'Previous_Bill_Date' in record:
+            bill = self._date('Previous_Bill_Date', record['Previous_Bill_Date'])
+            days = None if bill is None else (appt - bill).days
+            values['days_since_prev_bill'] = days
+            values['recency_bucket'] = _bucket(days, self._recency_bins, self._recency_labels)
+
+        if 'Booked_Date_Time' in record:
+            booked = self._date('Booked_Date_Time', record['Booked_Date_Time'])
+            lead_days = None
+            if booked is not None:
+                values['book_year'], values['book_month'], _, _, _, values['book_dayofweek'], *_ = \
+                    self._calendar(booked)
+                values['book_hour'] = booked.hour
+                lead_days = float(np.round((appt - booked).total_seconds() / 86400, 1))
+            values['leadtime_bucket'] = _bucket(lead_days, self._leadtime_bins, self._leadtime_labels)
+            values['same_day_booking'] = int(lead_days is not None and lead_days <= 0.0)
+
+        if 'Nationality_grouped' in self._top_values:
+            values['Nationality_grouped'] = self._group_rare('Nationality_grouped',
+                                                             record.get('Nationality'))
+        location = record.get('Location')
+        cleaned = None if _missing(location) or not isinstance(location, str) else location.lower().strip()
+        values['Location_cleaned'] = cleaned
+        if 'Location_grouped' in self._top_values:
+            values['Location_grouped'] = self._group_rare('Location_grouped', cleaned)
+        if self._history_columns:
+            customer = record.get('CustomerNumber')
+            values.update(self._history.record_features(
+                None if _missing(customer) else customer, appt.toordinal() - _EPOCH_ORDINAL,
+                self._history_columns))
+        values['Target'] = 'No Show'
+        return values
+
+    def _date(self, col: str, value) -> Optional[datetime]:
+        """Parse a raw date as parse_dates would; None for missing or unparseable values."""
+        if _missing(value):
+            return None
+        if isinstance(value, datetime):
+            return value
+        cache = self._date_cache.get(col)
+        if cache is None:
+            cache = self._date_cache[col] = {}
+        if value in cache:
+            return cache[value]
+        parsed = _parse_date(value, self._date_formats.get(col))
+        if len(cache) >= DATE_CACHE_SIZE:
+            cache.clear()
+        cache[value] = parsed
+        return parsed
+
+    def _calendar(self, day: datetime) -> Tuple:
+        """
+        (year, month, day, quarter, ISO week, day of week, week of month,
+        weekend, season, holiday, Ramadan) of a date, as the calendar table has them.
+        """
+        ordinal = day.toordinal()
+        row = self._calendar_cache.get(ordinal)
+        if row is None:
+            dayofweek = day.weekday()
+            row = (
+                day.year, day.month, day.day, (day.month - 1) // 3 + 1, day.isocalendar()[1],
+                dayofweek, (day.day - 1) // 7 + 1, int(dayofweek in WEEKEND_DAYS),
+                SEASON_BY_MONTH[day.month], int(ordinal in self._holidays),
+                int(any(start <= ordinal <= end for start, end in self._ramadan)),
+            )
+            self._calendar_cache[ordinal] = row
+        return row
+
+    def _group_rare(self, out_col: str, value) -> str:
+        return value if value in self._top_values[out_col] else 'Other'
+
+    # ------------------------------------------------------------------
+    # Output encoding
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _encoder(col: str, dtype: str, levels: List) -> Callable:
+        """Function mapping a column's value to its feature value."""
+        if dtype == 'category':
+            codes = {level: float(i) for i, level in enumerate(levels)}
+            # Input categoricals hold the CSV text of each value
+            to_text = col not in FEATURES
+
+            def encode(value) -> float:
+                if _missing(value):
+                    return -1.0
+                if to_text and not isinstance(value, str):
+                    value = str(value)
+                return codes.get(value, -1.0)
+            return encode
+
+        def encode_number(value) -> float:
+            return math.nan if _missing(value) else float(value)
+        return encode_number
+
+
+def _missing(value) -> bool:
+    """Whether a raw value counts as missing (None, NaN, NA, NaT or empty text)."""
+    return (value is None or value is pd.NA or value is pd.NaT or value == ''
+            or (isinstance(value, float) and value != value))
+
+
+def _parse_date(value, fmt: Optional[str]) -> Optional[datetime]:
+    """Parse one date string like pd.to_datetime(format=fmt, errors='coerce')."""
+    try:
+        if fmt == 'ISO8601':
+            parsed = datetime.fromisoformat(value)
+        elif fmt is not None:
+            parsed = datetime.strptime(value, fmt)
+        else:
+            parsed = None
+        if parsed is not None and parsed.tzinfo is None \
+                and _TIMESTAMP_MIN <= parsed <= _TIMESTAMP_MAX:
+            return parsed
+    except (TypeError, ValueError):
+        pass
+    # Formats and values the standard library reads differently from pandas
+    timestamp = pd.to_datetime(value, format=fmt, errors='coerce')
+    return None if pd.isna(timestamp) else timestamp.to_pydatetime()
+
+
+def _bucket(value, bins: Sequence[float], labels: Sequence[str], right: bool = True) -> Optional[str]:
+    """pd.cut of one value: the label of the bin holding `value`, or None."""
+    if value is None:
+        return None
+    i = (bisect_left(bins, value) if right else bisect_right(bins, value)) - 1
+    return labels[i] if 0 <= i < len(labels) else None
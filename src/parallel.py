@@ -0,0 +1,243 @@
+"""
+Multiprocess preprocessing over BranchCode or AppointmentDate-month partitions.
+
+Every stage of HealthcarePreprocessor is row-local except the rare-category
+grouping, whose top values are computed from the whole batch, and the
+patient history, which spans partitions. The driver learns the top values
+in a pre-pass over the columns they depend on and builds the history table
+once, which the workers load from the work directory. It then splits the rows
+into partitions of whole BranchCode (or month) groups, and runs the stages
+on each partition in a process pool. Partitions travel to and from the
+workers as Arrow IPC files that are memory-mapped on the other side
+(under /dev/shm when available).
+
+Merging restores the input row order and index and rebuilds each categorical
+column with the levels the serial run would infer, so the result is
+identical to HealthcarePreprocessor.preprocess_data on the whole frame.
+"""
+
+import heapq
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_profile import DataProfiler
+from history import HISTORY_FEATURES
+from ingestion import check_rows, merge_ingestion_reports
+from preprocessing import CONFIG, HealthcarePreprocessor
+from utils.ipc import read_ipc, write_ipc
+from utils.logger import get_logger, run_context
+from validation import merge_reports
+
+logger = get_logger('parallel')
+
+PARTITION_KEYS = ('BranchCode', 'month')
+
+# Partitions per worker; more than one evens out skewed group sizes
+PARTITIONS_PER_WORKER = 2
+
+
+def preprocess_parallel(preprocessor: HealthcarePreprocessor, df: pd.DataFrame,
+                        partition_by: str = 'BranchCode', workers: Optional[int] = None,
+                        fit: bool = False, tmp_dir: Optional[str] = None,
+                        columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Process `df` in a pool of `workers` processes (default: CPU count).
+
+    With a fitted `preprocessor` the result equals transform(df, columns=columns);
+    otherwise it equals preprocess_data(df, columns=columns), or fit_transform
+    with `fit=True`, in which case the learned state is kept on `preprocessor`.
+    Stage profiling and quarantined rows are not collected from the workers;
+    their validation reports and data profiles are merged.
+    """
+    if partition_by not in PARTITION_KEYS:
+        raise ValueError(f"partition_by must be one of {PARTITION_KEYS}, got {partition_by!r}")
+    workers = workers or os.cpu_count() or 1
+    if columns is not None:
+        # Fail before any worker starts
+        preprocessor.required_columns(columns, df.columns)
+
+    with run_context():
+        if fit:
+            preprocessor.rare_vocab, preprocessor.category_levels, preprocessor.output_dtypes = {}, {}, {}
+        # Global statistics the serial run would compute from the whole batch
+        vocab = preprocessor.rare_vocab
+        if not vocab:
+            vocab = preprocessor._vocab_from_counts(preprocessor.rare_category_counts(df))
+        state = dict(preprocessor.get_state(), rare_vocab=vocab)
+        history = preprocessor.history
+        if history is None and (columns is None or any(col in HISTORY_FEATURES for col in columns)):
+            history = preprocessor.patient_history(df)
+
+        partitions = partition_rows(df, partition_by, workers * PARTITIONS_PER_WORKER,
+                                    preprocessor.config)
+        # Rows of one appointment may fall in different partitions, so the
+        # rows a later duplicate supersedes are found on the whole batch and
+        # handed to the workers, whose validation drops and reports them
+        superseded = None
+        key = preprocessor.config.get('DEDUPE_KEY')
+        if key in df.columns:
+            ingestion = check_rows(df, key, preprocessor.config['STATUS_MAPPING'])
+            if ingestion.duplicates:
+                superseded = ingestion.superseded
+        logger.info("Processing %d rows in %d partitions by %s with %d workers",
+                    len(df), len(partitions), partition_by, workers)
+
+        if tmp_dir is None and os.path.isdir('/dev/shm'):
+            tmp_dir = '/dev/shm'
+        with tempfile.TemporaryDirectory(prefix='predictml-', dir=tmp_dir) as work_dir:
+            # Positions replace the index so the merge can restore row order
+            positional = df.set_axis(pd.RangeIndex(len(df)), axis=0, copy=False)
+            history_path = None
+            if history is not None:
+                history_path = os.path.join(work_dir, 'history.pkl')
+                with open(history_path, 'wb') as f:
+                    pickle.dump(history, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tasks = []
+            for i, positions in enumerate(partitions):
+                in_path = os.path.join(work_dir, f'in-{i}.arrow')
+                write_ipc(positional.take(positions), in_path)
+                tasks.append((preprocessor.config, state, in_path,
+                              os.path.join(work_dir, f'out-{i}.arrow'), columns,
+                              preprocessor.data_profiler is not None, history_path,
+                              None if superseded is None else superseded[positions]))
+
+            if workers == 1 or len(tasks) == 1:
+                results = [_process_partition(*task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                    results = list(pool.map(_process_partition, *zip(*tasks)))
+
+            parts = [read_ipc(result['out_path']) for result in results]
+            merged = merge_partitions(parts, df)
+
+        failures: Dict[str, int] = {}
+        for result in results:
+            for col, n in result['date_parse_failures'].items():
+                failures[col] = failures.get(col, 0) + n
+        preprocessor.date_parse_failures = failures
+        preprocessor.validation_report = merge_reports([result['validation_report'] for result in results])
+        preprocessor.ingestion_report = merge_ingestion_reports([result['ingestion_report'] for result in results])
+        if preprocessor.data_profiler is not None:
+            for result in results:
+                preprocessor.data_profiler.merge(DataProfiler.from_dict(result['data_profile']))
+
+        if fit:
+            preprocessor.rare_vocab = vocab
+            preprocessor._learn_output_schema(merged)
+        logger.info("Parallel pipeline completed: %d -> %d rows", len(df), len(merged))
+    return merged
+
+
+def partition_rows(df: pd.DataFrame, partition_by: str, n_partitions: int,
+                   config: Dict = CONFIG) -> List[np.ndarray]:
+    """
+    Split row positions into at most `n_partitions` groups of whole keys.
+
+    Keys are BranchCode values or AppointmentDate months; rows with a
+    missing key form a key of their own. Keys are assigned largest first to
+    the smallest partition.
+    """
+    codes = _partition_codes(df, partition_by, config)
+    sizes = np.bincount(codes + 1)
+    keys = np.flatnonzero(sizes)
+    n_partitions = max(1, min(n_partitions, len(keys)))
+
+    heap = [(0, i) for i in range(n_partitions)]
+    partition_of_key = np.zeros(len(sizes), dtype=np.int64)
+    for key in keys[np.argsort(-sizes[keys], kind='stable')]:
+        total, i = heapq.heappop(heap)
+        partition_of_key[key] = i
+        heapq.heappush(heap, (total + int(sizes[key]), i))
+
+    row_partition = partition_of_key[codes + 1]
+    order = np.argsort(row_partition, kind='stable')
+    bounds = np.searchsorted(row_partition[order], np.arange(1, n_partitions))
+    return [part for part in np.split(order, bounds) if len(part)]
+
+
+def _partition_codes(df: pd.DataFrame, partition_by: str, config: Dict) -> np.ndarray:
+    """Integer key per row (-1 for missing)."""
+    if partition_by == 'BranchCode':
+        codes, _ = pd.factorize(df['BranchCode'])
+        return codes
+
+    dates = df['AppointmentDate']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates, _ = HealthcarePreprocessor._parse_date_column(
+            dates, config['DATE_FORMATS'].get('AppointmentDate'))
+    months = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=float)
+    codes, _ = pd.factorize(months)
+    return codes
+
+
+def _process_partition(config: Dict, state: Dict, in_path: str, out_path: str,
+                       columns: Optional[List[str]] = None,
+                       profile: bool = False, history_path: Optional[str] = None,
+                       superseded: Optional[np.ndarray] = None) -> Dict:
+    """
+    Worker: run the pipeline on one partition file and write the result
+    next to it. `superseded` marks the partition's rows that rows of other
+    partitions supersede. Returns the output path and the partition's reports.
+    """
+    data_profiler = DataProfiler() if profile else None
+    preprocessor = HealthcarePreprocessor(config, data_profiler=data_profiler).set_state(state)
+    if history_path is not None:
+        with open(history_path, 'rb') as f:
+            preprocessor.history = pickle.load(f)
+    preprocessor._superseded = superseded
+    df = preprocessor.preprocess_data(read_ipc(in_path), inplace=True, columns=columns)
+    write_ipc(df, out_path)
+    return {
+        'out_path': out_path,
+        'date_parse_failures': preprocessor.date_parse_failures,
+        'validation_report': preprocessor.validation_report,
+        'ingestion_report': preprocessor.ingestion_report,
+        'data_profile': data_profiler.to_dict() if profile else None,
+    }
+
+
+def merge_partitions(parts: List[pd.DataFrame], df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Concatenate processed partitions in the row order and index of `df`.
+
+    Unordered categoricals get the levels the serial run would infer: the
+    input's level order where the column came in as a categorical and no
+    level was added, otherwise the sorted union (the order of a conversion
+    to category).
+    """
+    non_empty = [part for part in parts if len(part)] or parts[:1]
+    input_levels = {
+        col: df[col].cat.categories
+        for col in df.select_dtypes(include=['category']).columns
+    }
+
+    for col in non_empty[0].select_dtypes(include=['category']).columns:
+        dtypes = [part[col].dtype for part in non_empty]
+        if all(dtype == dtypes[0] for dtype in dtypes):
+            continue
+        present = set().union(*(dtype.categories for dtype in dtypes))
+        reference = input_levels.get(col)
+        if reference is not None and present.issubset(reference):
+            levels = [value for value in reference if value in present]
+        else:
+            levels = sorted(present)
+        for part in non_empty:
+            part[col] = part[col].cat.set_categories(levels)
+
+    merged = pd.concat(non_empty, copy=False)
+    positions = merged.index.to_numpy()
+    order = np.argsort(positions, kind='stable')
+    merged = merged.take(order)
+    positions = positions[order]
+    if len(positions) == len(df):
+        merged.index = df.index
+    else:
+        merged.index = df.index.take(positions)
+    return merged
+
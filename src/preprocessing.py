@@ -7,17 +7,31 @@ feature engineering. Designed for standalone CSV processing with no external
 dependencies on proprietary systems.
 
 Usage:
-    python preprocessing.py input_file.csv [output_file.csv]
+    python preprocessing.py input_file.csv [output_file.csv] [--chunksize N]
+        [--input-format csv|parquet|feather] [--output-format csv|parquet|feather]
+        [--log-level LEVEL] [--log-json] [--quiet]
+        [--workers N] [--partition-by BranchCode|month] [--incremental STORE_DIR]
+        [--cache-dir DIR] [--no-cache] [--clear-cache] [--columns COL,COL,...]
+        [--quarantine FILE.csv] [--data-profile DIR]
 """
 
+import argparse
+import json
+import os
 import pandas as pd
 import numpy as np
-import sys
-import warnings
-from typing import Dict, List, Optional
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-# Suppress warnings for cleaner output
-warnings.filterwarnings('ignore')
+from data_profile import DataProfiler
+from history import HISTORY_COLUMNS, HISTORY_FEATURES, PatientHistory, customer_keys
+from ingestion import SUPERSEDED, LatestRows, check_rows, merge_ingestion_reports
+from utils.calendar_table import CalendarJoin, CalendarTable, day_numbers, span_of
+from utils.logger import configure_logging, get_logger, run_context
+from utils.metrics import StageProfiler, jsonl_sink
+from validation import QuarantineWriter, ValidationResult, Validator, merge_reports
+
+logger = get_logger('preprocessing')
 
 # Configuration constants
 CONFIG = {
@@ -38,8 +52,170 @@ CONFIG = {
     'LEADTIME_LABELS': ['<1d', '1-7d', '8-30d', '31-90d', '>90d'],
     'COLUMNS_TO_DROP': ['PaymentMode', 'VisitType', 'doctor_Nationality', 'District', 'CustomeNumber', 'Job_Location', 'Occupation', 'company'],
     'REQUIRED_COLUMNS': ['BranchCode', 'DOB', 'Location', 'AppointmentDate', 'Status', 'DoctorName', 'Department'],
+    # Rows are deduplicated on this column at ingestion, keeping the latest
+    # row of each appointment; rows with a non-numeric ID or an unknown
+    # Status are dropped as malformed (see ingestion.py). None disables both.
+    'DEDUPE_KEY': 'AppointmentId',
+    # Row-level validation rules (see validation.py); violations are counted
+    # and logged, and invalid rows can be copied to a quarantine file. ID
+    # format, known Status and duplicate IDs are checked at ingestion
+    # (DEDUPE_KEY), which quarantines the rows it drops.
+    'VALIDATION_RULES': [
+        {'name': 'appointment_id_present', 'rule': 'required', 'column': 'AppointmentId'},
+        {'name': 'customer_number_numeric', 'rule': 'pattern', 'column': 'CustomerNumber', 'pattern': r'\d+'},
+        {'name': 'gender_known', 'rule': 'allowed', 'column': 'Gender', 'values': ['F', 'M']},
+        {'name': 'determination_flag_binary', 'rule': 'allowed', 'column': 'PeopleofDetermination_flg',
+         'values': [0, 1]},
+        {'name': 'dob_valid', 'rule': 'date', 'column': 'DOB'},
+        {'name': 'appointment_date_valid', 'rule': 'date', 'column': 'AppointmentDate'},
+        {'name': 'appointment_date_range', 'rule': 'range', 'column': 'AppointmentDate',
+         'min': '2000-01-01', 'max': '2100-12-31'},
+        {'name': 'dob_before_appointment', 'rule': 'date_order', 'earlier': 'DOB', 'later': 'AppointmentDate'},
+        {'name': 'booked_before_appointment', 'rule': 'date_order', 'earlier': 'Booked_Date_Time',
+         'later': 'AppointmentDate', 'unit': 'D'},
+        {'name': 'bill_before_appointment', 'rule': 'date_order', 'earlier': 'Previous_Bill_Date',
+         'later': 'AppointmentDate'},
+    ],
+    # Input dtypes applied when reading CSV files. Identifiers stay text so
+    # they are never coerced to float; repetitive strings, including the raw
+    # date strings, are loaded straight into categoricals.
+    'INPUT_SCHEMA': {
+        'AppointmentId': 'string',
+        'CustomerNumber': 'string',
+        'BranchCode': 'category',
+        'DoctorName': 'category',
+        'Department': 'category',
+        'Status': 'category',
+        'Gender': 'category',
+        'Marital Status': 'category',
+        'Religion': 'category',
+        'Nationality': 'category',
+        'Patient_Language': 'category',
+        'Country_Residence': 'category',
+        'Patient_State': 'category',
+        'VisaCategory': 'category',
+        'Booked_By': 'category',
+        'Previous_VisitType': 'category',
+        'Previous_Payment_Mode': 'category',
+        'LastAppointmentStatus': 'category',
+        'appointment_info': 'category',
+        'PeopleofDetermination_flg': 'Int8',
+        'DOB': 'category',
+        'AppointmentDate': 'category',
+        'Previous_Bill_Date': 'category',
+    },
+    # Rare-category grouping: output column -> (source column, number of top values kept)
+    'RARE_GROUPING': {
+        'Nationality_grouped': ('Nationality', 10),
+        'Location_grouped': ('Location_cleaned', 15),
+    },
+    'DEFAULT_CHUNKSIZE': 100_000,
+    # Known input format per date column (None lets pandas infer it)
+    'DATE_FORMATS': {
+        'DOB': '%m/%d/%y',
+        'AppointmentDate': 'ISO8601',
+        'Previous_Bill_Date': 'ISO8601',
+        'Booked_Date_Time': 'ISO8601',
+    },
+    # CSV reader: 'c' (pandas default) or 'pyarrow' (multithreaded decoding).
+    # ARROW_DTYPES keeps strings in Arrow memory instead of Python objects.
+    'CSV_ENGINE': 'c',
+    'ARROW_DTYPES': False,
+    'CSV_ON_BAD_LINES': 'skip',
+    # Run preprocess_data on the caller's frame instead of a copy: columns
+    # are added in place and row filters are deferred to a single mask
+    # applied before final_cleanup. The input frame is consumed.
+    'INPLACE': False,
+    # Calendar flags (see utils/calendar_table.py): holiday dates and Ramadan
+    # (start, end) periods as ISO dates. appt_is_holiday / appt_is_ramadan
+    # are added to the output when these are set.
+    'CALENDAR_HOLIDAYS': [],
+    'CALENDAR_RAMADAN': [],
+    # Incremental mode: appointments this many days before the latest booking,
+    # or later, are re-checked for late status updates
+    'INCREMENTAL_LOOKBACK_DAYS': 30,
+    # On-disk stage cache (see stage_cache.py); None disables it
+    'STAGE_CACHE_DIR': None,
+    'STAGE_CACHE_MAX_MB': 2048,
+    # Columnar output settings
+    'PARQUET_COMPRESSION': 'zstd',
+    'PARQUET_ROW_GROUP_SIZE': 100_000,
+}
+
+# Supported file formats by extension, and the default extension of each
+FILE_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+}
+FORMAT_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Statuses of the records the pipeline keeps (the No Show population)
+NO_SHOW_STATUSES = ['Confirmed', 'Not Answered', 'Booked', 'Visited']
+
+# Season by appointment month; index 0 holds the value for a missing month
+SEASON_BY_MONTH = np.array(
+    ['unknown', 'mild', 'mild', 'warm', 'warm', 'hot', 'hot',
+     'hot', 'hot', 'hot', 'warm', 'warm', 'mild'],
+    dtype=object,
+)
+
+# Derived output columns: column -> (stage that computes it, columns it is
+# computed from). With preprocess_data(columns=...) only the requested
+# columns and what they are computed from are produced, and feature stages
+# none of them come from are skipped.
+FEATURES = {
+    'age_at_visit': ('process_age_features', ('AppointmentDate', 'DOB')),
+    'birth_year': ('process_age_features', ('DOB',)),
+    'birth_month': ('process_age_features', ('DOB',)),
+    'birth_day': ('process_age_features', ('DOB',)),
+    'birth_dayofweek': ('process_age_features', ('DOB',)),
+    'age_band': ('process_age_features', ('age_at_visit',)),
+    'appt_year': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_month': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_day': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_quarter': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_weekofyear': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_dayofweek': ('process_appointment_features', ('AppointmentDate',)),
+    'is_weekend': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_weekofmonth': ('process_appointment_features', ('AppointmentDate',)),
+    'season': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_is_holiday': ('process_appointment_features', ('AppointmentDate',)),
+    'appt_is_ramadan': ('process_appointment_features', ('AppointmentDate',)),
+    'days_since_prev_bill': ('process_billing_features', ('AppointmentDate', 'Previous_Bill_Date')),
+    'recency_bucket': ('process_billing_features', ('days_since_prev_bill',)),
+    'book_year': ('process_booking_features', ('Booked_Date_Time',)),
+    'book_month': ('process_booking_features', ('Booked_Date_Time',)),
+    'book_dayofweek': ('process_booking_features', ('Booked_Date_Time',)),
+    'book_hour': ('process_booking_features', ('Booked_Date_Time',)),
+    'leadtime_bucket': ('process_booking_features', ('AppointmentDate', 'Booked_Date_Time')),
+    'same_day_booking': ('process_booking_features', ('AppointmentDate', 'Booked_Date_Time')),
+    'Nationality_grouped': ('process_categorical_features', ('Nationality',)),
+    'Location_cleaned': ('process_categorical_features', ('Location',)),
+    'Location_grouped': ('process_categorical_features', ('Location_cleaned',)),
+    'Target': ('process_target_variable', ()),
+    **{col: ('process_history_features', HISTORY_COLUMNS) for col in HISTORY_FEATURES},
+}
+
+# Calendar flag columns and the CONFIG key that enables each one
+CALENDAR_FLAGS = {
+    'appt_is_holiday': 'CALENDAR_HOLIDAYS',
+    'appt_is_ramadan': 'CALENDAR_RAMADAN',
 }
 
+# Columns every run computes whatever is requested: the Status filter and
+# the invalid-age filter
+FILTER_COLUMNS = ('Status', 'age_at_visit')
+
+# Input columns the rare-category counting pass reads: the Status filter,
+# the invalid-age filter and the grouped source columns
+RARE_COUNT_COLUMNS = ('Status', 'DOB', 'AppointmentDate', 'Nationality', 'Location')
+
+# Version of the serialized state written by HealthcarePreprocessor.save_state
+STATE_VERSION = 1
+
 
 class HealthcarePreprocessor:
     """
@@ -47,24 +223,217 @@ class HealthcarePreprocessor:
     Processes CSV files with feature engineering for ML models.
     """
     
-    def __init__(self, config: Dict = None):
-        """Initialize the preprocessor with configuration."""
+    def __init__(self, config: Dict = None, profiler: Optional[StageProfiler] = None,
+                 stage_cache=None, quarantine: Optional[QuarantineWriter] = None,
+                 data_profiler: Optional[DataProfiler] = None):
+        """
+        Initialize the preprocessor with configuration, an optional stage
+        profiler, stage cache, quarantine file for invalid rows and data
+        profiler for the input and output of every batch.
+        """
         self.config = config or CONFIG
+        self.profiler = profiler
+        # stage_cache.StageCache; when set, preprocess_data resumes from cached stage outputs
+        self.stage_cache = stage_cache
+        self.quarantine = quarantine
+        self.data_profiler = data_profiler
+        # Fitted state (see fit/transform). Top values per grouped column;
+        # when set, _group_rare uses these instead of recomputing them from
+        # the current batch.
+        self.rare_vocab: Dict[str, List] = {}
+        # Category levels and dtypes of the output columns learned at fit time
+        self.category_levels: Dict[str, List] = {}
+        self.output_dtypes: Dict[str, str] = {}
+        self._learning = False
+        # Rows still kept during an in-place run (None outside one)
+        self._row_mask: Optional[np.ndarray] = None
+        # Rows of the current batch superseded by rows of another chunk or
+        # partition of the same input (None outside chunked and parallel runs)
+        self._superseded: Optional[np.ndarray] = None
+        # Requested output columns of the current run and every column they
+        # need (None outside a run restricted by `columns`)
+        self._requested: Optional[List[str]] = None
+        self._wanted: Optional[frozenset] = None
+        # Calendar table shared by the date features, grown to cover new dates
+        self._calendar: Optional[CalendarTable] = None
+        # Per-column count of values that failed to parse in the last batch
+        self.date_parse_failures: Dict[str, int] = {}
+        # Validation rule violations of the last batch (see validation.py)
+        self.validation_report: Dict = {}
+        # Rows in and kept by the Status filter of the last batch
+        self.filter_report: Dict[str, int] = {}
+        # Malformed and duplicate rows dropped from the last batch (see ingestion.py)
+        self.ingestion_report: Dict = {}
+        # Appointment history the history features are looked up in (see
+        # history.py); None builds it from each batch. Set it to cover
+        # appointments outside the batch, e.g. with patient_history().
+        self.history: Optional[PatientHistory] = None
         
-    def load_data_from_csv(self, file_path: str) -> pd.DataFrame:
+    def load_data_from_csv(self, file_path: str, use_schema: bool = True) -> pd.DataFrame:
         """Load data from CSV file."""
+        engine = self.config['CSV_ENGINE']
         try:
-            print(f"Loading data from CSV file: {file_path}")
-            df = pd.read_csv(file_path)
-            print(f"Successfully loaded {len(df)} rows from CSV")
+            logger.debug("Loading data from CSV file: %s (engine=%s)", file_path, engine)
+            try:
+                df = pd.read_csv(file_path, **self.read_csv_options(file_path, use_schema))
+            except ValueError as e:
+                if engine == 'c':
+                    raise
+                # Malformed input or options the Arrow reader rejects
+                logger.warning("%s CSV engine failed (%s); falling back to the C engine", engine, e)
+                engine = 'c'
+                df = pd.read_csv(file_path, **self.read_csv_options(file_path, use_schema, engine))
+            if engine == 'pyarrow' and not self.config['ARROW_DTYPES']:
+                df = self._object_categories(df)
+            logger.info("Loaded %d rows from CSV file: %s", len(df), file_path)
             return df
         except Exception as e:
-            print(f"Error loading data from CSV: {e}")
+            logger.error("Error loading data from CSV: %s", e)
             raise
     
+    def read_csv_options(self, file_path: Optional[str] = None, use_schema: bool = True,
+                         engine: Optional[str] = None) -> Dict:
+        """
+        Keyword arguments for pd.read_csv that apply CONFIG['INPUT_SCHEMA'].
+
+        Columns listed in COLUMNS_TO_DROP are skipped by the parser so they
+        are never materialized. The pyarrow engine needs `file_path` to
+        resolve them into an explicit column list.
+        """
+        engine = engine or self.config['CSV_ENGINE']
+        options = {'engine': engine, 'on_bad_lines': self.config['CSV_ON_BAD_LINES']}
+        if self.config['ARROW_DTYPES']:
+            options['dtype_backend'] = 'pyarrow'
+        if not use_schema:
+            return options
+        
+        dtype = dict(self.config['INPUT_SCHEMA'])
+        if self.config['ARROW_DTYPES']:
+            dtype = {col: 'string[pyarrow]' if t == 'string' else t for col, t in dtype.items()}
+        options['dtype'] = dtype
+        
+        dropped = set(self.config['COLUMNS_TO_DROP'])
+        if engine == 'pyarrow':
+            if file_path is None:
+                raise ValueError("The pyarrow engine needs file_path to select columns")
+            header = pd.read_csv(file_path, nrows=0).columns
+            options['usecols'] = [col for col in header if col not in dropped]
+        else:
+            options['usecols'] = lambda col: col not in dropped
+        return options
+
+    @staticmethod
+    def _object_categories(df: pd.DataFrame) -> pd.DataFrame:
+        """Store categorical levels as Python strings, as the C engine does."""
+        for col in df.select_dtypes(include=['category']).columns:
+            categories = df[col].cat.categories
+            if categories.dtype != object:
+                df[col] = df[col].cat.rename_categories(categories.astype(object))
+        return df
+
+    def apply_input_schema(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Cast columns read from a columnar file to CONFIG['INPUT_SCHEMA']."""
+        for col, dtype in self.config['INPUT_SCHEMA'].items():
+            if col in df.columns and str(df[col].dtype) != dtype:
+                df[col] = df[col].astype(dtype)
+        return df
+
+    def measure_load_memory(self, file_path: str) -> Dict[str, Dict[str, float]]:
+        """
+        Report the memory cost of loading a CSV file with and without the input schema.
+
+        Peak is the traced allocation high-water mark during the read (MB);
+        frame is the deep memory usage of the loaded frame (MB).
+        """
+        import tracemalloc
+        
+        report = {}
+        for label, use_schema in (('without_schema', False), ('with_schema', True)):
+            tracemalloc.start()
+            df = pd.read_csv(file_path, **self.read_csv_options(file_path, use_schema))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report[label] = {
+                'peak_mb': peak / 1024**2,
+                'frame_mb': df.memory_usage(deep=True).sum() / 1024**2,
+            }
+            del df
+        
+        for label, stats in report.items():
+            logger.info("Load memory for %s %s: peak %.2f MB, frame %.2f MB",
+                        file_path, label, stats['peak_mb'], stats['frame_mb'], extra=stats)
+        return report
+
+    @staticmethod
+    def detect_format(file_path: str, fmt: Optional[str] = None) -> str:
+        """Return `fmt` if given, otherwise the file format implied by the extension."""
+        if fmt:
+            if fmt not in FORMAT_EXTENSIONS:
+                raise ValueError(f"Unsupported file format: {fmt}")
+            return fmt
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in FILE_FORMATS:
+            raise ValueError(f"Cannot infer file format from extension '{ext}'; pass a format explicitly")
+        return FILE_FORMATS[ext]
+
+    def load_data(self, file_path: str, fmt: Optional[str] = None,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Load data from a CSV, Parquet or Feather file.
+
+        `columns` restricts the read to the listed columns; for the columnar
+        formats the other columns are never read from disk.
+        """
+        fmt = self.detect_format(file_path, fmt)
+        if fmt == 'csv':
+            if columns is None:
+                return self.load_data_from_csv(file_path)
+            options = self.read_csv_options(file_path)
+            options['usecols'] = columns
+            return pd.read_csv(file_path, **options)
+        
+        if columns is None:
+            dropped = set(self.config['COLUMNS_TO_DROP'])
+            columns = [col for col in self.input_columns(file_path, fmt) if col not in dropped]
+        
+        try:
+            logger.debug("Loading data from %s file: %s", fmt, file_path)
+            if fmt == 'parquet':
+                df = pd.read_parquet(file_path, columns=columns)
+            else:
+                df = pd.read_feather(file_path, columns=columns)
+            df = self.apply_input_schema(df)
+            logger.info("Loaded %d rows from %s file: %s", len(df), fmt, file_path)
+            return df
+        except Exception as e:
+            logger.error("Error loading data from %s: %s", fmt, e)
+            raise
+
+    def save_data(self, df: pd.DataFrame, file_path: str, fmt: Optional[str] = None,
+                  compression: Optional[str] = None,
+                  row_group_size: Optional[int] = None) -> None:
+        """Save data as CSV, Parquet or Feather, preserving dtypes in the columnar formats."""
+        fmt = self.detect_format(file_path, fmt)
+        if fmt == 'csv':
+            df.to_csv(file_path, index=False)
+        elif fmt == 'parquet':
+            df.to_parquet(
+                file_path,
+                index=False,
+                compression=compression or self.config['PARQUET_COMPRESSION'],
+                row_group_size=row_group_size or self.config['PARQUET_ROW_GROUP_SIZE'],
+            )
+        else:
+            # Feather requires a default index
+            kwargs = {'compression': compression} if compression else {}
+            df.reset_index(drop=True).to_feather(file_path, **kwargs)
+
     def validate_input_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Validate input data schema and quality."""
-        print(f"Validating input data: {df.shape[0]} rows, {df.shape[1]} columns")
+        """
+        Validate input data schema and quality, and drop malformed rows and
+        superseded duplicates of an appointment.
+        """
+        logger.debug("Validating input data: %d rows, %d columns", len(df), len(df.columns))
         
         # Check required columns
         missing_cols = [col for col in self.config['REQUIRED_COLUMNS'] if col not in df.columns]
@@ -74,180 +443,428 @@ class HealthcarePreprocessor:
         if df.empty:
             raise ValueError("Input dataframe is empty")
         
-        print(f"Data validation completed")
+        # Row-level rules, evaluated as one violation mask per rule
+        self.validation_report = {}
+        quarantined: Dict[str, np.ndarray] = {}
+        rules = self.config.get('VALIDATION_RULES')
+        if rules:
+            result = Validator(rules, self._parse_input_dates).validate(df)
+            self.validation_report = result.to_dict()
+            if result.invalid_rows:
+                quarantined.update(result.masks)
+        
+        # Malformed rows and superseded duplicates, in one pass over the IDs
+        self.ingestion_report = {}
+        ingestion = None
+        key = self.config.get('DEDUPE_KEY')
+        if key in df.columns:
+            ingestion = check_rows(df, key, self.config['STATUS_MAPPING'], self._superseded)
+            self.ingestion_report = ingestion.to_dict()
+            if ingestion.malformed.invalid_rows:
+                quarantined.update(ingestion.malformed.masks)
+            if ingestion.duplicates:
+                quarantined[SUPERSEDED] = ingestion.superseded
+        self._log_validation()
+        
+        # One quarantine row per input row, listing every rule and reason it fails
+        if self.quarantine is not None and quarantined:
+            self.quarantine.write(df, ValidationResult(len(df), quarantined, []))
+        if ingestion is not None and not ingestion.keep.all():
+            df = self._filter_rows(df, ingestion.keep)
+        
+        logger.debug("Data validation completed")
         return df
 
+    def _log_validation(self) -> None:
+        """Log the validation and ingestion reports of the last batch."""
+        report = self.validation_report
+        if report.get('invalid_rows'):
+            violations = {name: n for name, n in report['violations'].items() if n}
+            logger.warning("Rows violating validation rules: %d of %d %s",
+                           report['invalid_rows'], report['rows'], violations,
+                           extra={'rate_key': 'validation.violations', 'violations': violations})
+        report = self.ingestion_report
+        if report.get('malformed'):
+            reasons = {reason: n for reason, n in report['malformed_by_reason'].items() if n}
+            logger.warning("Dropping malformed rows: %d of %d %s", report['malformed'], report['rows'], reasons,
+                           extra={'rate_key': 'ingestion.malformed', 'malformed': reasons})
+        if report.get('duplicates'):
+            logger.info("Dropping %d superseded rows of duplicate %s",
+                        report['duplicates'], self.config.get('DEDUPE_KEY'),
+                        extra={'rate_key': 'ingestion.duplicates', 'duplicates': report['duplicates']})
+
+    def _parse_input_dates(self, series: pd.Series, col: str) -> pd.Series:
+        """Parse a raw date column as parse_dates does, for the validation rules."""
+        return self._parse_date_column(series, self.config['DATE_FORMATS'].get(col))[0]
+
+    def process_history_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Process patient history features (see history.py). Runs before the
+        Status filter, so earlier appointments of every status count.
+        """
+        logger.debug("Processing history features")
+        
+        wanted = [col for col in HISTORY_FEATURES if self._wants(col)]
+        if not wanted or any(col not in df.columns for col in HISTORY_COLUMNS):
+            return df
+        customers, present, days, no_show = self._history_inputs(df)
+        history = self.history
+        if history is None:
+            # The batch's own appointments, as ingestion left them
+            kept = present if self._row_mask is None else present & self._row_mask
+            history = PatientHistory(customers[kept], days[kept], no_show[kept])
+        
+        if self._row_mask is None:
+            # Only columns are added, so a shallow copy keeps the caller's frame as it was
+            df = df.copy(deep=False)
+        for col, values in history.features(customers, days, present, wanted).items():
+            df[col] = values
+        
+        return df
+
+    def _history_inputs(self, df: pd.DataFrame):
+        """Customer hashes, a mask of present customers, appointment day numbers and a No Show mask."""
+        customers, present = customer_keys(df['CustomerNumber'])
+        dates = df['AppointmentDate']
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = self._parse_input_dates(dates, 'AppointmentDate')
+        no_show_statuses = [status for status, target in self.config['STATUS_MAPPING'].items()
+                            if target == 'No Show']
+        return customers, present, day_numbers(dates), df['Status'].isin(no_show_statuses).to_numpy()
+
+    def _history_rows(self, df: pd.DataFrame):
+        """(customer, day, no-show) arrays of the rows of a raw frame that ingestion keeps."""
+        customers, present, days, no_show = self._history_inputs(df)
+        key = self.config.get('DEDUPE_KEY')
+        if key in df.columns:
+            present &= check_rows(df, key, self.config['STATUS_MAPPING']).keep
+        return customers[present], days[present], no_show[present]
+
+    def patient_history(self, df: pd.DataFrame) -> Optional[PatientHistory]:
+        """
+        History table of the appointments of a raw frame (None without the
+        history columns). Set as `history`, it lets a run over part of the
+        data (a partition, new rows) see the appointments of the rest.
+        """
+        if any(col not in df.columns for col in HISTORY_COLUMNS):
+            return None
+        return PatientHistory(*self._history_rows(df))
+
     def clean_initial_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """Initial data cleaning and preparation."""
-        print("Starting initial data cleaning")
+        logger.debug("Starting initial data cleaning")
         
-        df = df.copy()
-        initial_rows = len(df)
+        if self._row_mask is None:
+            if self._wanted is None:
+                df = df.copy()
+            else:
+                # Copy only the columns the requested output needs
+                df = df.take([i for i, col in enumerate(df.columns) if col in self._wanted], axis=1)
+        initial_rows = self._kept_rows(df)
         
         # Filter for only No Show records
+        self.filter_report = {}
         if 'Status' in df.columns:
-            no_show_statuses = ['Confirmed','Not Answered', 'Booked', 'Visited']
-            df = df[df['Status'].isin(no_show_statuses)]
-            print(f"Filtered for records: {initial_rows} -> {len(df)} rows")
+            df = self._filter_rows(df, df['Status'].isin(NO_SHOW_STATUSES).to_numpy())
+            self.filter_report = {'rows_in': initial_rows, 'rows_out': self._kept_rows(df)}
+            self._log_filter()
+        
+        # Categoricals loaded by the input schema keep levels of filtered-out
+        # rows; drop those so levels match a conversion after filtering
+        for col in df.select_dtypes(include=['category']).columns:
+            df[col] = self._remove_unused_categories(df[col])
         
         # Drop specified columns safely
         cols_to_drop = [col for col in self.config['COLUMNS_TO_DROP'] if col in df.columns]
+        if self._wanted is not None:
+            cols_to_drop += [col for col in df.columns if col not in self._wanted and col not in cols_to_drop]
         if cols_to_drop:
-            df = df.drop(columns=cols_to_drop)
+            df = self._drop_columns(df, cols_to_drop)
         
         # Fill missing values
         if 'LastAppointmentStatus' in df.columns:
-            df['LastAppointmentStatus'] = df['LastAppointmentStatus'].fillna('No Prior Visit')
+            df['LastAppointmentStatus'] = self._fillna(df['LastAppointmentStatus'], 'No Prior Visit')
         if 'Previous_Payment_Mode' in df.columns:
-            df['Previous_Payment_Mode'] = df['Previous_Payment_Mode'].fillna('FirstTime')
+            df['Previous_Payment_Mode'] = self._fillna(df['Previous_Payment_Mode'], 'FirstTime')
+        
+        logger.debug("Initial data cleaning completed")
+        return df
+
+    def _fillna(self, series: pd.Series, value) -> pd.Series:
+        """fillna that also works on categoricals lacking `value` as a level."""
+        if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+            if not self._kept(series).isna().any():
+                return series
+            # Keep levels sorted, as a conversion to category would
+            series = series.cat.set_categories(sorted([*series.cat.categories, value]))
+        return series.fillna(value)
+
+    def parse_dates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Parse every configured date column once, using its known format."""
+        logger.debug("Parsing date columns")
         
-        print("Initial data cleaning completed")
+        self.date_parse_failures = {}
+        for col, fmt in self.config['DATE_FORMATS'].items():
+            if col not in df.columns:
+                continue
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                # Readers that infer timestamps (e.g. the pyarrow engine) may
+                # pick another resolution or an Arrow dtype
+                if df[col].dtype != 'datetime64[ns]':
+                    df[col] = df[col].astype('datetime64[ns]')
+                continue
+            df[col], failures = self._parse_date_column(df[col], fmt, self._row_mask)
+            if failures:
+                self.date_parse_failures[col] = failures
+        
+        self._log_date_parse_failures()
         return df
 
+    def _log_filter(self) -> None:
+        report = self.filter_report
+        if report:
+            logger.info("Filtered for records: %d -> %d rows", report['rows_in'], report['rows_out'],
+                        extra={'rate_key': 'rows.filter', **report})
+
+    def _log_date_parse_failures(self) -> None:
+        if self.date_parse_failures:
+            logger.warning("Rows with unparseable dates (set to missing): %s", self.date_parse_failures,
+                           extra={'rate_key': 'dates.unparseable'})
+
+    @staticmethod
+    def _parse_date_column(series: pd.Series, fmt: Optional[str],
+                           mask: Optional[np.ndarray] = None):
+        """
+        Parse a column of date strings, converting each distinct string once.
+
+        Returns the parsed series and the number of non-missing values (in
+        the rows selected by `mask`, if given) that failed to parse.
+        """
+        codes, uniques = pd.factorize(series)
+        parsed = pd.to_datetime(uniques, format=fmt, errors='coerce')
+        # Trailing NaT slot for missing input (code -1)
+        lookup = np.append(parsed.to_numpy(), np.datetime64('NaT')).astype(parsed.dtype)
+        counted = codes >= 0 if mask is None else (codes >= 0) & mask
+        failures = int(np.isnat(lookup[:-1]).take(codes[counted]).sum())
+        return pd.Series(lookup[codes], index=series.index, name=series.name), failures
+
     def process_age_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process age-related features."""
-        print("Processing age features")
-        
-        # Parse dates safely
-        df['DOB'] = pd.to_datetime(df['DOB'], errors='coerce')
-        df['AppointmentDate'] = pd.to_datetime(df['AppointmentDate'], errors='coerce')
+        logger.debug("Processing age features")
         
         # Calculate age features
         days_alive = (df['AppointmentDate'] - df['DOB']).dt.days
         df['age_at_visit'] = (days_alive // 365).astype('Int64')
         
         # Birth date features
-        df['birth_year'] = df['DOB'].dt.year.astype('Int64')
-        df['birth_month'] = df['DOB'].dt.month.astype('Int64')
-        df['birth_day'] = df['DOB'].dt.day.astype('Int64')
-        df['birth_dayofweek'] = df['DOB'].dt.dayofweek.astype('Int64')
+        birth_features = {'birth_year': 'year', 'birth_month': 'month',
+                          'birth_day': 'day', 'birth_dayofweek': 'dayofweek'}
+        wanted = [col for col in birth_features if self._wants(col)]
+        if wanted:
+            birth = self._calendar_join(df['DOB'])
+            for col in wanted:
+                df[col] = birth.integers(birth_features[col])
         
         # Age bands
-        df['age_band'] = pd.cut(
-            df['age_at_visit'],
-            bins=self.config['AGE_BINS'],
-            labels=self.config['AGE_LABELS'],
-            right=False
-        )
+        if self._wants('age_band'):
+            df['age_band'] = pd.cut(
+                df['age_at_visit'],
+                bins=self.config['AGE_BINS'],
+                labels=self.config['AGE_LABELS'],
+                right=False
+            )
         
         # Clean invalid ages
-        df = df.dropna(subset=['age_at_visit'])
+        df = self._filter_rows(df, df['age_at_visit'].notna().to_numpy())
         
         return df
 
     def process_appointment_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process appointment date and time features."""
-        print("Processing appointment features")
+        logger.debug("Processing appointment features")
         
-        # Ensure appointment date is parsed
-        df['AppointmentDate'] = pd.to_datetime(df['AppointmentDate'], errors='coerce')
-        
-        # Calendar features
-        df['appt_year'] = df['AppointmentDate'].dt.year.astype('Int64')
-        df['appt_month'] = df['AppointmentDate'].dt.month.astype('Int64')
-        df['appt_day'] = df['AppointmentDate'].dt.day.astype('Int64')
-        df['appt_quarter'] = df['AppointmentDate'].dt.quarter.astype('Int64')
-        df['appt_weekofyear'] = df['AppointmentDate'].dt.isocalendar().week.astype('Int64')
-        df['appt_dayofweek'] = df['AppointmentDate'].dt.dayofweek.astype('Int64')
+        # Calendar features, gathered from the calendar table
+        appt = self._calendar_join(df['AppointmentDate'])
+        if self._wants('appt_year'):
+            df['appt_year'] = appt.integers('year')
+        if self._wants('appt_month'):
+            df['appt_month'] = appt.integers('month')
+        if self._wants('appt_day'):
+            df['appt_day'] = appt.integers('day')
+        if self._wants('appt_quarter'):
+            df['appt_quarter'] = appt.integers('quarter')
+        if self._wants('appt_weekofyear'):
+            df['appt_weekofyear'] = appt.integers('weekofyear')
+        if self._wants('appt_dayofweek'):
+            df['appt_dayofweek'] = appt.integers('dayofweek')
         
         # Weekend flag (Friday, Saturday)
-        df['is_weekend'] = df['appt_dayofweek'].isin([4, 5]).astype('Int8')
+        if self._wants('is_weekend'):
+            df['is_weekend'] = appt.flags('is_weekend')
         
         # Week of month
-        df['appt_weekofmonth'] = ((df['AppointmentDate'].dt.day - 1) // 7 + 1).astype('Int64')
+        if self._wants('appt_weekofmonth'):
+            df['appt_weekofmonth'] = appt.integers('weekofmonth')
+        
+        # Seasonal features ('unknown' for a missing date)
+        if self._wants('season'):
+            season = appt.values('season', SEASON_BY_MONTH[0])
+            df['season'] = pd.Categorical(season, categories=self._kept_levels(season))
         
-        # Seasonal features
-        df['season'] = df['appt_month'].apply(self._get_season).astype('category')
+        # Holiday and Ramadan flags, when configured
+        if self.config.get('CALENDAR_HOLIDAYS') and self._wants('appt_is_holiday'):
+            df['appt_is_holiday'] = appt.flags('is_holiday')
+        if self.config.get('CALENDAR_RAMADAN') and self._wants('appt_is_ramadan'):
+            df['appt_is_ramadan'] = appt.flags('is_ramadan')
         
         return df
     
+    def _calendar_join(self, series: pd.Series) -> CalendarJoin:
+        """Join a datetime column to the calendar table, growing the table to cover it."""
+        days = day_numbers(series)
+        holidays = self.config.get('CALENDAR_HOLIDAYS', [])
+        ramadan = self.config.get('CALENDAR_RAMADAN', [])
+        first, last = span_of(days) or (0, 0)
+        table = self._calendar
+        if table is None or not table.covers(first, last, holidays, ramadan):
+            if table is not None:
+                first, last = min(first, table.first_day), max(last, table.last_day)
+            table = self._calendar = CalendarTable(first, last, SEASON_BY_MONTH, holidays, ramadan)
+        return table.join(days)
+    
     def _get_season(self, m):
         """Determine season from month."""
         if pd.isna(m):
             return 'unknown'
-        if m in [5, 6, 7, 8, 9]:
-            return 'hot'
-        elif m in [10, 11, 3, 4]:
-            return 'warm'
-        else:
-            return 'mild'
+        return SEASON_BY_MONTH[int(m)]
 
     def process_billing_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process billing-related features."""
-        print("Processing billing features")
+        logger.debug("Processing billing features")
         
         if 'Previous_Bill_Date' in df.columns:
-            # Parse billing date
-            df['Previous_Bill_Date'] = pd.to_datetime(df['Previous_Bill_Date'], errors='coerce')
-            
             # Time since last bill
             days_diff = (df['AppointmentDate'] - df['Previous_Bill_Date']).dt.days
+            if self._row_mask is not None and days_diff.dtype == float \
+                    and not self._kept(days_diff).isna().any():
+                # Missing only in deferred rows; keep the integer dtype the
+                # filtered frame would give
+                days_diff = days_diff.fillna(0).astype(np.int64)
             df['days_since_prev_bill'] = days_diff
             
             # Recency buckets
-            df['recency_bucket'] = pd.cut(
-                days_diff,
-                bins=self.config['RECENCY_BINS'],
-                labels=self.config['RECENCY_LABELS']
-            )
+            if self._wants('recency_bucket'):
+                df['recency_bucket'] = pd.cut(
+                    days_diff,
+                    bins=self.config['RECENCY_BINS'],
+                    labels=self.config['RECENCY_LABELS']
+                )
         
         return df
 
     def process_booking_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process booking-related features."""
-        print("Processing booking features")
+        logger.debug("Processing booking features")
         
         if 'Booked_Date_Time' in df.columns:
-            # Parse booking datetime
-            df['Booked_Date_Time'] = pd.to_datetime(df['Booked_Date_Time'], errors='coerce')
-            
             # Calendar features
-            df['book_year'] = df['Booked_Date_Time'].dt.year.astype('Int64')
-            df['book_month'] = df['Booked_Date_Time'].dt.month.astype('Int64')
-            df['book_dayofweek'] = df['Booked_Date_Time'].dt.dayofweek.astype('Int64')
-            df['book_hour'] = df['Booked_Date_Time'].dt.hour.astype('Int64')
-            
-            # Lead time features
-            lead_timedelta = df['AppointmentDate'] - df['Booked_Date_Time']
-            lead_days = (lead_timedelta.dt.total_seconds() / 86400).round(1)
+            booked = self._calendar_join(df['Booked_Date_Time'])
+            if self._wants('book_year'):
+                df['book_year'] = booked.integers('year')
+            if self._wants('book_month'):
+                df['book_month'] = booked.integers('month')
+            if self._wants('book_dayofweek'):
+                df['book_dayofweek'] = booked.integers('dayofweek')
+            if self._wants('book_hour'):
+                df['book_hour'] = df['Booked_Date_Time'].dt.hour.astype('Int64')
             
-            # Lead time buckets
-            df['leadtime_bucket'] = pd.cut(
-                lead_days,
-                bins=self.config['LEADTIME_BINS'],
-                labels=self.config['LEADTIME_LABELS']
-            )
-            
-            # Same day booking
-            df['same_day_booking'] = (lead_days <= 0.0).astype('Int8')
+            if self._wants('leadtime_bucket') or self._wants('same_day_booking'):
+                # Lead time features
+                lead_timedelta = df['AppointmentDate'] - df['Booked_Date_Time']
+                lead_days = (lead_timedelta.dt.total_seconds() / 86400).round(1)
+                
+                # Lead time buckets
+                if self._wants('leadtime_bucket'):
+                    df['leadtime_bucket'] = pd.cut(
+                        lead_days,
+                        bins=self.config['LEADTIME_BINS'],
+                        labels=self.config['LEADTIME_LABELS']
+                    )
+                
+                # Same day booking
+                if self._wants('same_day_booking'):
+                    df['same_day_booking'] = (lead_days <= 0.0).astype('Int8')
         
         return df
 
     def process_categorical_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process categorical features."""
-        print("Processing categorical features")
+        logger.debug("Processing categorical features")
         
         # Group rare categories
-        if 'Nationality' in df.columns:
-            df['Nationality_grouped'] = self._group_rare(df['Nationality'], top_n=10)
+        if 'Nationality' in df.columns and self._wants('Nationality_grouped'):
+            df['Nationality_grouped'] = self._group_rare_column(df, 'Nationality_grouped')
         
-        if 'Location' in df.columns:
-            df['Location_cleaned'] = df['Location'].str.lower().str.strip()
-            df['Location_grouped'] = self._group_rare(df['Location_cleaned'], top_n=15)
+        if 'Location' in df.columns and self._wants('Location_cleaned'):
+            df['Location_cleaned'] = self._clean_location(df['Location'])
+            if self._wants('Location_grouped'):
+                df['Location_grouped'] = self._group_rare_column(df, 'Location_grouped')
         
         return df
     
-    def _group_rare(self, series: pd.Series, top_n: int = 10) -> pd.Series:
+    @staticmethod
+    def _clean_location(series: pd.Series) -> pd.Series:
+        """Lower-case and strip each distinct location once; equal values share one string."""
+        codes, uniques = pd.factorize(series)
+        cleaned = pd.Series(uniques, dtype=object).str.lower().str.strip()
+        lookup = np.append(cleaned.to_numpy(dtype=object), np.nan)
+        return pd.Series(lookup[codes], index=series.index, name=series.name, dtype=object)
+    
+    def _group_rare_column(self, df: pd.DataFrame, out_col: str) -> pd.Series:
+        """Group rare values of the source column configured for `out_col`."""
+        src_col, top_n = self.config['RARE_GROUPING'][out_col]
+        top_values = self.rare_vocab.get(out_col)
+        if top_values is None:
+            top_values = self._top_values(self._value_counts(self._kept(df[src_col])), top_n)
+            if self._learning:
+                self.rare_vocab[out_col] = top_values
+        return self._group_rare(df[src_col], top_n=top_n, top_values=top_values)
+    
+    def _group_rare(self, series: pd.Series, top_n: int = 10,
+                    top_values: Optional[List] = None) -> pd.Series:
         """Group rare categories into 'Other'."""
         try:
-            top_values = series.value_counts().nlargest(top_n).index
-            return series.apply(lambda x: x if x in top_values else 'Other')
+            if top_values is None:
+                top_values = self._top_values(self._value_counts(series), top_n)
+            # Map each distinct value once, then broadcast through the codes;
+            # the trailing 'Other' slot catches missing values (code -1).
+            codes, uniques = pd.factorize(series)
+            labels = np.append(np.where(uniques.isin(top_values), uniques, 'Other'), 'Other')
+            return pd.Series(labels[codes], index=series.index, name=series.name, dtype=object)
         except:
             return series
 
+    @staticmethod
+    def _value_counts(series: pd.Series) -> pd.Series:
+        """Counts of non-missing values in order of first appearance."""
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            return series.value_counts(sort=False)
+        # value_counts on a categorical follows level order; rebuild
+        # first-appearance order from the codes instead
+        codes = series.cat.codes.to_numpy()
+        codes = codes[codes >= 0]
+        order = pd.unique(codes)
+        counts = np.bincount(codes, minlength=len(series.cat.categories))[order]
+        return pd.Series(counts, index=series.cat.categories[order].astype(object))
+
+    @staticmethod
+    def _top_values(counts: pd.Series, top_n: int) -> List:
+        """Return the top_n most frequent values, ties broken by first appearance."""
+        return counts.sort_values(ascending=False, kind='stable').head(top_n).index.tolist()
+
     def process_target_variable(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process target variable."""
-        print("Processing target variable")
+        logger.debug("Processing target variable")
         
         # Since we're filtering for only No Show records, all targets are 'No Show'
         df['Target'] = 'No Show'
@@ -256,85 +873,839 @@ class HealthcarePreprocessor:
 
     def final_cleanup(self, df: pd.DataFrame) -> pd.DataFrame:
         """Final cleanup and data type optimization."""
-        print("Performing final cleanup")
+        logger.debug("Performing final cleanup")
         
-        # Drop intermediate columns
+        # Drop intermediate columns, and columns computed only as inputs of
+        # the requested ones
         columns_to_drop = ['Status']
-        existing_cols_to_drop = [col for col in columns_to_drop if col in df.columns]
+        if self._requested is not None:
+            columns_to_drop += [col for col in df.columns if col not in self._requested]
+        existing_cols_to_drop = [col for col in dict.fromkeys(columns_to_drop) if col in df.columns]
         
         if existing_cols_to_drop:
-            df = df.drop(columns=existing_cols_to_drop)
+            df = self._drop_columns(df, existing_cols_to_drop)
+        
+        # Apply row filters deferred by an in-place run before any level is
+        # inferred from the data
+        if self._row_mask is not None:
+            df = self._apply_row_mask(df)
         
-        # Convert object columns to category for memory efficiency
-        object_cols = df.select_dtypes(include=['object']).columns
+        # Convert object columns (and Arrow-backed strings) to category for
+        # memory efficiency; identifier columns keep their string dtype
+        object_cols = [
+            col for col, dtype in df.dtypes.items()
+            if dtype == object or (isinstance(dtype, pd.ArrowDtype)
+                                   and dtype.kind in 'OU')
+        ]
         for col in object_cols:
             df[col] = df[col].astype('category')
         
+        # Pin fitted levels and dtypes so every batch matches the training output
+        if self.is_fitted:
+            df = self._apply_fitted_schema(df)
+        
+        if self._requested is not None and list(df.columns) != self._requested:
+            df = df.reindex(columns=self._requested)
+        
+        return df
+
+    def _apply_fitted_schema(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Cast output columns to the category levels and dtypes learned at fit time."""
+        unseen = {}
+        for col, dtype in self.output_dtypes.items():
+            if col not in df.columns:
+                continue
+            if dtype == 'category':
+                before = df[col].notna().sum()
+                df[col] = df[col].cat.set_categories(self.category_levels.get(col, []))
+                n_unseen = before - df[col].notna().sum()
+                if n_unseen:
+                    unseen[col] = int(n_unseen)
+            elif str(df[col].dtype) != dtype:
+                try:
+                    df[col] = df[col].astype(dtype)
+                except (TypeError, ValueError) as e:
+                    logger.warning("Could not cast %s to fitted dtype %s: %s", col, dtype, e)
+        
+        if unseen:
+            logger.warning("Values not seen at fit time (set to missing): %s", unseen,
+                           extra={'rate_key': 'schema.unseen'})
+        
+        extra_cols = [col for col in df.columns if col not in self.output_dtypes]
+        if extra_cols:
+            logger.warning("Columns not seen at fit time: %s", extra_cols,
+                           extra={'rate_key': 'schema.extra_columns'})
+        
+        return df
+
+    def preprocess_data(self, df: pd.DataFrame, inplace: Optional[bool] = None,
+                        columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Main preprocessing pipeline.
+
+        With `inplace` (default CONFIG['INPLACE']) the stages work on `df`
+        itself and `df` must not be used afterwards. With `columns` the
+        output holds only those columns, in that order, and only the
+        features they are computed from are computed (see FEATURES); rows
+        are filtered as in a full run.
+        """
+        if inplace is None:
+            inplace = self.config.get('INPLACE', False)
+        if columns is not None:
+            requested = list(dict.fromkeys(columns))
+            self._wanted = self.required_columns(requested, df.columns)
+            self._requested = requested
+        try:
+            if self.data_profiler is not None:
+                self.data_profiler.observe('input', df)
+            # Memory is traced while the stages run only, not while the
+            # caller loads or saves data
+            with self.profiler.tracing() if self.profiler is not None else nullcontext():
+                if self.stage_cache is not None:
+                    # Cached stages run on copies; an in-place stage output is not self-contained
+                    df = self.stage_cache.run(self, df)
+                else:
+                    df = self._run_stages(df, inplace)
+            if self.data_profiler is not None:
+                self.data_profiler.observe('output', df)
+            return df
+        finally:
+            self._requested = self._wanted = None
+    
+    def _run_stages(self, df: pd.DataFrame, inplace: bool) -> pd.DataFrame:
+        """Run pipeline_stages() on `df`, profiling each stage if a profiler is set."""
+        with run_context():
+            logger.debug("Starting preprocessing pipeline")
+            rows_in = len(df)
+            
+            if inplace:
+                self._row_mask = np.ones(rows_in, dtype=bool)
+            # An in-place run owns `df`, so assigning to a frame that was
+            # sliced from another one is intended, not chained assignment
+            chained_assignment = None if inplace else pd.get_option('mode.chained_assignment')
+            try:
+                with pd.option_context('mode.chained_assignment', chained_assignment):
+                    for name, stage in self.pipeline_stages():
+                        if self.profiler is None:
+                            df = stage(df)
+                        else:
+                            df = self.profiler.run(name, stage, df)
+            finally:
+                self._row_mask = None
+            
+            self._log_completed(rows_in, df)
         return df
 
-    def preprocess_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Main preprocessing pipeline."""
-        print("Starting preprocessing pipeline")
+    @staticmethod
+    def _log_completed(rows_in: int, df: pd.DataFrame) -> None:
+        logger.info("Preprocessing pipeline completed: %d -> %d rows, %d columns",
+                    rows_in, len(df), len(df.columns),
+                    extra={'rate_key': 'rows.pipeline', 'rows_in': rows_in, 'rows_out': len(df)})
+    
+    def required_columns(self, columns: List[str], input_columns) -> frozenset:
+        """
+        Columns a run producing `columns` from `input_columns` must keep or
+        compute: the requested ones, the columns they are computed from, and
+        the inputs of the row filters.
+        """
+        dropped = set(self.config['COLUMNS_TO_DROP']) | {'Status'}
+        dropped |= {col for col, key in CALENDAR_FLAGS.items() if not self.config.get(key)}
+        outputs = (set(FEATURES) | set(input_columns)) - dropped
+        unknown = [col for col in columns if col not in outputs]
+        if unknown:
+            raise ValueError(f"Unknown output columns: {unknown}")
         
-        # Validate input
-        df = self.validate_input_data(df)
+        needed, pending = set(), list(columns) + list(FILTER_COLUMNS)
+        while pending:
+            col = pending.pop()
+            if col not in needed:
+                needed.add(col)
+                pending.extend(FEATURES[col][1] if col in FEATURES else ())
+        return frozenset(needed)
+    
+    def _wants(self, col: str) -> bool:
+        """Whether the current run computes `col`."""
+        return self._wanted is None or col in self._wanted
+
+    def _filter_rows(self, df: pd.DataFrame, keep: np.ndarray) -> pd.DataFrame:
+        """Keep the rows where `keep` is True; in an in-place run, only narrow the row mask."""
+        if self._row_mask is None:
+            return df[keep]
+        self._row_mask &= keep
+        return df
+
+    def _kept_rows(self, df: pd.DataFrame) -> int:
+        """Number of rows still kept."""
+        return len(df) if self._row_mask is None else int(self._row_mask.sum())
+
+    def _kept(self, series: pd.Series) -> pd.Series:
+        """`series` restricted to the rows still kept."""
+        return series if self._row_mask is None else series[self._row_mask]
+
+    def _kept_levels(self, values: np.ndarray) -> Optional[np.ndarray]:
+        """Sorted distinct kept values, as pd.Categorical infers them (None outside an in-place run)."""
+        return None if self._row_mask is None else np.unique(values[self._row_mask])
+
+    def _remove_unused_categories(self, series: pd.Series) -> pd.Series:
+        """Drop category levels that no kept row uses."""
+        if self._row_mask is None:
+            return series.cat.remove_unused_categories()
+        codes = series.cat.codes.to_numpy()[self._row_mask]
+        used = np.zeros(len(series.cat.categories), dtype=bool)
+        used[codes[codes >= 0]] = True
+        if used.all():
+            return series
+        return series.cat.remove_categories(series.cat.categories[~used])
+
+    def _drop_columns(self, df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        """drop(columns=...), removing the columns from `df` itself in an in-place run."""
+        if self._row_mask is None:
+            return df.drop(columns=columns)
+        for col in columns:
+            del df[col]
+        return df
+
+    def _apply_row_mask(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Assemble the kept rows of an in-place run into the output frame.
+
+        Columns are moved one at a time, so the deferred rows of a column are
+        freed before the next one is copied.
+        """
+        keep, self._row_mask = self._row_mask, None
+        if keep.all():
+            return df
+        take = np.flatnonzero(keep)
+        index = df.index[take]
+        columns = {}
+        for col in list(df.columns):
+            columns[col] = df.pop(col).array.take(take)
+        return pd.DataFrame(columns, index=index, copy=False)
+
+    def pipeline_stages(self) -> List[Tuple[str, Callable[[pd.DataFrame], pd.DataFrame]]]:
+        """
+        Ordered (name, method) pairs run by preprocess_data.
+
+        In a run restricted by `columns`, feature stages that compute none
+        of the needed columns are left out.
+        """
+        stages = [
+            # Validate input
+            ('validate_input_data', self.validate_input_data),
+            # History needs the appointments the Status filter drops
+            ('process_history_features', self.process_history_features),
+            # Process all feature groups
+            ('clean_initial_data', self.clean_initial_data),
+            ('parse_dates', self.parse_dates),
+            ('process_age_features', self.process_age_features),
+            ('process_appointment_features', self.process_appointment_features),
+            ('process_billing_features', self.process_billing_features),
+            ('process_booking_features', self.process_booking_features),
+            ('process_categorical_features', self.process_categorical_features),
+            ('process_target_variable', self.process_target_variable),
+            ('final_cleanup', self.final_cleanup),
+        ]
+        if self._wanted is None:
+            return stages
+        needed_stages = {FEATURES[col][0] for col in self._wanted if col in FEATURES}
+        feature_stages = {stage for stage, _ in FEATURES.values()}
+        return [(name, stage) for name, stage in stages
+                if name not in feature_stages or name in needed_stages]
+
+    @property
+    def is_fitted(self) -> bool:
+        """Whether fit() has learned the output schema."""
+        return bool(self.output_dtypes)
+
+    def fit(self, df: pd.DataFrame) -> 'HealthcarePreprocessor':
+        """Learn rare-category vocabularies, category levels and output dtypes."""
+        self.fit_transform(df)
+        return self
+
+    def fit_transform(self, df: pd.DataFrame, inplace: Optional[bool] = None,
+                      columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Fit the preprocessor on `df` and return the processed frame."""
+        logger.info("Fitting preprocessor state")
+        
+        self.rare_vocab, self.category_levels, self.output_dtypes = {}, {}, {}
+        self._learning = True
+        try:
+            df = self.preprocess_data(df, inplace, columns)
+        finally:
+            self._learning = False
+        
+        self._learn_output_schema(df)
+        logger.info("Fitted state for %d output columns", len(self.output_dtypes))
+        return df
+
+    def transform(self, df: pd.DataFrame, inplace: Optional[bool] = None,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Process `df` with the fitted state, without learning anything from it."""
+        if not self.is_fitted:
+            raise ValueError("Preprocessor is not fitted; call fit() or load_state() first")
+        return self.preprocess_data(df, inplace, columns)
+
+    def _learn_output_schema(self, df: pd.DataFrame,
+                             category_levels: Optional[Dict[str, List]] = None) -> None:
+        """Record output dtypes and category levels of a processed frame."""
+        self.output_dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
+        self.category_levels = category_levels or {
+            col: df[col].cat.categories.tolist()
+            for col in df.select_dtypes(include=['category']).columns
+        }
+
+    def save_state(self, path: str) -> None:
+        """Serialize the fitted state to a compact JSON artifact."""
+        if not self.is_fitted:
+            raise ValueError("Preprocessor is not fitted; nothing to save")
+        
+        with open(path, 'w') as f:
+            json.dump(self.get_state(), f, separators=(',', ':'), default=str)
+        logger.info("Preprocessor state saved: %s", path)
+
+    def load_state(self, path: str) -> 'HealthcarePreprocessor':
+        """Load a fitted state written by save_state."""
+        with open(path) as f:
+            self.set_state(json.load(f))
+        logger.info("Preprocessor state loaded: %s", path)
+        return self
+
+    def get_state(self) -> Dict:
+        """The learned state as a JSON-serializable dict."""
+        return {
+            'version': STATE_VERSION,
+            'rare_vocab': self.rare_vocab,
+            'category_levels': self.category_levels,
+            'output_dtypes': self.output_dtypes,
+        }
+
+    def set_state(self, state: Dict) -> 'HealthcarePreprocessor':
+        """Restore a state returned by get_state."""
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(
+                f"Unsupported state version {state.get('version')} (expected {STATE_VERSION})"
+            )
         
-        # Process all feature groups
+        self.rare_vocab = state['rare_vocab']
+        self.category_levels = state['category_levels']
+        self.output_dtypes = state['output_dtypes']
+        return self
+
+    def iter_chunks(self, file_path: str, chunksize: int,
+                    usecols: Optional[List[str]] = None,
+                    fmt: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """Yield a CSV, Parquet or Feather file in chunks of at most `chunksize` rows."""
+        fmt = self.detect_format(file_path, fmt)
+        if fmt == 'csv':
+            yield from self.iter_csv_chunks(file_path, chunksize, usecols=usecols)
+            return
+        
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        if fmt == 'parquet':
+            batches = pq.ParquetFile(file_path).iter_batches(batch_size=chunksize, columns=usecols)
+            for batch in batches:
+                yield self.apply_input_schema(batch.to_pandas())
+            return
+        
+        with pa.memory_map(file_path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if usecols is not None:
+                    batch = batch.select(usecols)
+                for offset in range(0, batch.num_rows, chunksize):
+                    yield self.apply_input_schema(batch.slice(offset, chunksize).to_pandas())
+
+    def iter_csv_chunks(self, file_path: str, chunksize: int,
+                        usecols: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """Yield the CSV file in chunks of at most `chunksize` rows."""
+        # The pyarrow engine cannot read in chunks
+        options = self.read_csv_options(file_path, engine='c')
+        if usecols is not None:
+            options['usecols'] = usecols
+        with pd.read_csv(file_path, chunksize=chunksize, **options) as reader:
+            for chunk in reader:
+                yield chunk
+
+    def input_columns(self, file_path: str, fmt: Optional[str] = None) -> List[str]:
+        """Column names of a CSV, Parquet or Feather file, read from its header only."""
+        fmt = self.detect_format(file_path, fmt)
+        if fmt == 'csv':
+            return pd.read_csv(file_path, nrows=0).columns.tolist()
+        
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        if fmt == 'parquet':
+            return pq.read_schema(file_path).names
+        with pa.memory_map(file_path) as source:
+            return pa.ipc.open_file(source).schema.names
+
+    def count_rare_categories(self, file_path: str, chunksize: int,
+                              fmt: Optional[str] = None,
+                              latest: Optional[LatestRows] = None) -> Dict[str, List]:
+        """
+        Counting pass over a CSV file that learns the rare-grouping vocabulary.
+
+        Only the columns the filtering and grouping steps need are read, and
+        the same stages that run before `process_categorical_features` are
+        applied, so the counts match what the batch pipeline would see.
+        `latest` (see latest_rows) drops duplicates superseded in later chunks.
+        """
+        logger.info("Counting categories in %s (chunksize=%d)", file_path, chunksize)
+        
+        header = self.input_columns(file_path, fmt)
+        key = self.config.get('DEDUPE_KEY')
+        usecols = [col for col in header if col in RARE_COUNT_COLUMNS or col == key]
+        
+        counts: Dict[str, pd.Series] = {}
+        offset = 0
+        for chunk in self.iter_chunks(file_path, chunksize, usecols=usecols, fmt=fmt):
+            offset += len(chunk)
+            if latest is not None:
+                chunk = latest.select(chunk, offset - len(chunk))
+            for out_col, chunk_counts in self.rare_category_counts(chunk).items():
+                if out_col in counts:
+                    # groupby(sort=False) keeps first-appearance order across chunks
+                    chunk_counts = pd.concat([counts[out_col], chunk_counts])
+                    chunk_counts = chunk_counts.groupby(level=0, sort=False).sum()
+                counts[out_col] = chunk_counts
+        
+        vocab = self._vocab_from_counts(counts)
+        logger.info("Category counting completed for %s", list(vocab))
+        return vocab
+
+    def rare_category_counts(self, df: pd.DataFrame) -> Dict[str, pd.Series]:
+        """
+        Value counts, in order of first appearance, of each rare-grouping
+        source column over the rows the pipeline keeps.
+
+        Runs only the stages that precede process_categorical_features on
+        the columns they need.
+        """
+        key = self.config.get('DEDUPE_KEY')
+        df = df[[col for col in df.columns if col in RARE_COUNT_COLUMNS or col == key]]
+        if key in df.columns:
+            df = df[check_rows(df, key, self.config['STATUS_MAPPING']).keep]
         df = self.clean_initial_data(df)
+        df = self.parse_dates(df)
         df = self.process_age_features(df)
-        df = self.process_appointment_features(df)
-        df = self.process_billing_features(df)
-        df = self.process_booking_features(df)
-        df = self.process_categorical_features(df)
-        df = self.process_target_variable(df)
-        df = self.final_cleanup(df)
-        
-        print(f"Preprocessing pipeline completed. Final shape: {df.shape}")
-        return df
+        if 'Location' in df.columns:
+            df['Location_cleaned'] = self._clean_location(df['Location'])
+        
+        return {
+            out_col: self._value_counts(df[src_col])
+            for out_col, (src_col, _) in self.config['RARE_GROUPING'].items()
+            if src_col in df.columns
+        }
+
+    def latest_rows(self, file_path: str, chunksize: int,
+                    fmt: Optional[str] = None) -> Optional[LatestRows]:
+        """
+        Pass over the ID and Status columns of a file that finds the rows a
+        later row of the same appointment supersedes, so chunked runs
+        deduplicate as a batch run would. None without a DEDUPE_KEY column.
+        """
+        key = self.config.get('DEDUPE_KEY')
+        header = self.input_columns(file_path, fmt)
+        if key not in header:
+            return None
+        latest = LatestRows(key, self.config['STATUS_MAPPING'])
+        usecols = [col for col in header if col in (key, 'Status')]
+        for chunk in self.iter_chunks(file_path, chunksize, usecols=usecols, fmt=fmt):
+            latest.add(chunk)
+        latest.finish()
+        logger.info("Duplicate scan: %d of %d rows superseded by a later row of the same %s",
+                    len(latest.superseded), latest.rows, key)
+        return latest
+
+    def scan_patient_history(self, file_path: str, chunksize: int, fmt: Optional[str] = None,
+                             latest: Optional[LatestRows] = None) -> Optional[PatientHistory]:
+        """
+        Pass over the history columns of a file that builds its patient
+        history, so each chunk's history features see the whole file. None
+        without the history columns.
+        """
+        header = self.input_columns(file_path, fmt)
+        if any(col not in header for col in HISTORY_COLUMNS):
+            return None
+        key = self.config.get('DEDUPE_KEY')
+        usecols = [col for col in header if col in HISTORY_COLUMNS or col == key]
+        parts = []
+        offset = 0
+        for chunk in self.iter_chunks(file_path, chunksize, usecols=usecols, fmt=fmt):
+            offset += len(chunk)
+            if latest is not None:
+                chunk = latest.select(chunk, offset - len(chunk))
+            parts.append(self._history_rows(chunk))
+        if not parts:
+            parts = [(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool))]
+        history = PatientHistory(*(np.concatenate(arrays) for arrays in zip(*parts)))
+        logger.info("History scan: %d appointments in %s", history.rows, file_path)
+        return history
+
+    def _vocab_from_counts(self, counts: Dict[str, pd.Series]) -> Dict[str, List]:
+        """Top values per grouped column from rare_category_counts output."""
+        return {
+            out_col: self._top_values(counts[out_col], top_n)
+            for out_col, (_, top_n) in self.config['RARE_GROUPING'].items()
+            if out_col in counts
+        }
+
+    def preprocess_stream(self, file_path: str, output_path: str,
+                          chunksize: Optional[int] = None, fit: bool = False,
+                          input_format: Optional[str] = None,
+                          output_format: Optional[str] = None,
+                          compression: Optional[str] = None,
+                          row_group_size: Optional[int] = None,
+                          columns: Optional[List[str]] = None) -> int:
+        """
+        Chunked preprocessing pipeline for files too large to hold in memory.
+
+        Scans the ID column for duplicates superseded in later chunks, runs a
+        counting pass to fix the rare-category vocabulary (unless the
+        preprocessor is already fitted) and a pass that builds the patient
+        history (unless `history` is set), then reads, transforms and appends
+        each chunk to `output_path`. Peak memory is bounded by the chunk size
+        and the history table (about 20 bytes per appointment).
+        With `fit=True` the state is learned from the stream and kept, as
+        fit_transform would on the whole file. `columns` restricts the output
+        as in preprocess_data. Returns the number of rows written.
+        """
+        with run_context():
+            chunksize = chunksize or self.config['DEFAULT_CHUNKSIZE']
+            logger.info("Starting streaming pipeline (chunksize=%d)", chunksize)
+            
+            fitted_vocab = self.rare_vocab
+            if fit:
+                self.category_levels, self.output_dtypes = {}, {}
+            latest = self.latest_rows(file_path, chunksize, input_format)
+            if fit or not fitted_vocab:
+                self.rare_vocab = self.count_rare_categories(file_path, chunksize, input_format, latest)
+            
+            writer = _ChunkWriter(
+                output_path,
+                self.detect_format(output_path, output_format),
+                compression=compression or self.config['PARQUET_COMPRESSION'],
+                row_group_size=row_group_size or self.config['PARQUET_ROW_GROUP_SIZE'],
+            )
+            # Each chunk looks its history features up in the whole file's
+            history = self.history
+            if history is None and (columns is None or any(col in HISTORY_FEATURES for col in columns)):
+                self.history = self.scan_patient_history(file_path, chunksize, input_format, latest)
+            rows_in = rows_out = 0
+            first_chunk = None
+            levels: Dict[str, set] = {}
+            validation_reports, ingestion_reports = [], []
+            try:
+                chunks = self.iter_chunks(file_path, chunksize, fmt=input_format)
+                for i, chunk in enumerate(chunks):
+                    rows_in += len(chunk)
+                    # Rows superseded in later chunks are dropped (and
+                    # reported) by validation, as in a batch run
+                    if latest is not None:
+                        self._superseded = latest.mask(rows_in - len(chunk), len(chunk))
+                    try:
+                        processed = self.preprocess_data(chunk, inplace=True, columns=columns)
+                    finally:
+                        self._superseded = None
+                    validation_reports.append(self.validation_report)
+                    ingestion_reports.append(self.ingestion_report)
+                    writer.write(processed)
+                    rows_out += len(processed)
+                    logger.info("Chunk %d: %d rows read, %d rows written", i + 1, rows_in, rows_out,
+                                extra={'rate_key': 'rows.chunk', 'rows_in': rows_in, 'rows_out': rows_out})
+                    
+                    if fit:
+                        # Batch categories are the sorted uniques, so the sorted
+                        # union of per-chunk categories gives the same levels
+                        first_chunk = processed.head(0) if first_chunk is None else first_chunk
+                        for col in processed.select_dtypes(include=['category']).columns:
+                            levels.setdefault(col, set()).update(processed[col].cat.categories)
+            finally:
+                writer.close()
+                self.history = history
+                if not fit:
+                    self.rare_vocab = fitted_vocab
+            self.validation_report = merge_reports(validation_reports)
+            self.ingestion_report = merge_ingestion_reports(ingestion_reports)
+            
+            if fit and first_chunk is not None:
+                self._learn_output_schema(first_chunk, {
+                    col: (first_chunk[col].cat.categories.tolist() if first_chunk[col].cat.ordered
+                          else sorted(values))
+                    for col, values in levels.items()
+                })
+            
+            logger.info("Streaming pipeline completed. %d rows in, %d rows out", rows_in, rows_out,
+                        extra={'rows_in': rows_in, 'rows_out': rows_out})
+        return rows_out
+
+
+class _ChunkWriter:
+    """Append processed chunks to a single CSV or Parquet file."""
+    
+    def __init__(self, path: str, fmt: str, compression: Optional[str] = None,
+                 row_group_size: Optional[int] = None):
+        if fmt == 'feather':
+            # The Arrow IPC file format cannot replace dictionaries between
+            # batches, and each chunk carries its own category levels
+            raise ValueError("Streaming output does not support feather; use parquet or csv")
+        self.path = path
+        self.fmt = fmt
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self._parquet_writer = None
+        self._chunks_written = 0
+    
+    def write(self, df: pd.DataFrame) -> None:
+        """Append one processed chunk."""
+        if self.fmt == 'csv':
+            first = self._chunks_written == 0
+            df.to_csv(self.path, mode='w' if first else 'a', header=first, index=False)
+        else:
+            self._write_parquet(df)
+        self._chunks_written += 1
+    
+    def _write_parquet(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._parquet_writer is None:
+            # Categorical code width depends on each chunk's level count, so
+            # fix dictionary indices at int32 for every row group
+            fields = [
+                pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type, f.type.ordered))
+                if pa.types.is_dictionary(f.type) else f
+                for f in table.schema
+            ]
+            schema = pa.schema(fields, metadata=table.schema.metadata)
+            self._parquet_writer = pq.ParquetWriter(self.path, schema, compression=self.compression)
+        table = table.cast(self._parquet_writer.schema)
+        self._parquet_writer.write_table(table, row_group_size=self.row_group_size)
+    
+    def close(self) -> None:
+        """Finish the output file."""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Healthcare appointment no-show feature engineering pipeline"
+    )
+    parser.add_argument('input_path', help="Input CSV, Parquet or Feather file")
+    parser.add_argument('output_path', nargs='?', default=None,
+                        help="Output file (default: processed_<input> next to the input)")
+    parser.add_argument('--input-format', choices=sorted(FORMAT_EXTENSIONS), default=None,
+                        help="Input file format (default: inferred from the extension)")
+    parser.add_argument('--output-format', choices=sorted(FORMAT_EXTENSIONS), default=None,
+                        help="Output file format (default: inferred from the extension, else csv)")
+    parser.add_argument('--compression', default=None,
+                        help="Parquet/Feather compression codec (e.g. zstd, snappy, lz4)")
+    parser.add_argument('--row-group-size', type=int, default=None,
+                        help="Rows per Parquet row group")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Process the input in chunks of N rows to bound memory usage")
+    parser.add_argument('--incremental', metavar='STORE_DIR', default=None,
+                        help="Apply only new or changed appointments to a partitioned output store")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Process partitions of the input in N worker processes")
+    parser.add_argument('--partition-by', choices=['BranchCode', 'month'], default='BranchCode',
+                        help="Partition key for --workers (AppointmentDate month or BranchCode)")
+    parser.add_argument('--columns', type=lambda value: [col.strip() for col in value.split(',') if col.strip()],
+                        default=None, metavar='COL,COL,...',
+                        help="Output only these columns, computing only the features they need")
+    parser.add_argument('--quarantine', default=None, metavar='FILE.csv',
+                        help="Write input rows violating CONFIG['VALIDATION_RULES'] to this CSV file")
+    parser.add_argument('--data-profile', default=None, metavar='DIR',
+                        help="Profile the input and output with mergeable sketches and save the "
+                             "JSON artifact in this directory (or to this .json file)")
+    parser.add_argument('--engine', choices=['c', 'pyarrow'], default=None,
+                        help="CSV parser engine (pyarrow decodes with multiple threads)")
+    parser.add_argument('--arrow-dtypes', action='store_true',
+                        help="Keep strings in Arrow-backed dtypes instead of Python objects")
+    parser.add_argument('--memory-report', action='store_true',
+                        help="Report CSV load memory with and without the input schema")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print per-stage time, row and memory statistics")
+    parser.add_argument('--profile-json', default=None,
+                        help="Write the per-stage profile report as JSON to this path")
+    parser.add_argument('--metrics-jsonl', default=None,
+                        help="Append one JSON line per stage run to this path")
+    parser.add_argument('--state', default=None,
+                        help="Transform with a fitted state saved by --save-state")
+    parser.add_argument('--save-state', default=None,
+                        help="Fit on this input and save the learned state to this path")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Cache stage outputs in this directory (default: CONFIG['STAGE_CACHE_DIR'])")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Bypass the stage cache for this run")
+    parser.add_argument('--clear-cache', action='store_true',
+                        help="Remove every stage cache entry before running")
+    parser.add_argument('--log-level', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Minimum level of log messages (DEBUG shows every stage)")
+    parser.add_argument('--log-json', action='store_true',
+                        help="Write log records as JSON lines")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Only log warnings and errors")
+    parser.add_argument('--run-id', default=None,
+                        help="Correlation ID attached to every log record (default: random)")
+    args = parser.parse_args(argv)
+    # Workers run without the profiler or the quarantine file, and
+    # --chunksize and --incremental take precedence over --workers
+    if args.workers and args.workers > 1 and not (args.chunksize or args.incremental):
+        unsupported = [flag for flag, value in (('--quarantine', args.quarantine), ('--profile', args.profile),
+                                                ('--profile-json', args.profile_json),
+                                                ('--metrics-jsonl', args.metrics_jsonl)) if value]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be combined with --workers")
+    return args
 
 
-def main():
-    """Main execution function for CSV processing."""
-    if len(sys.argv) < 2:
-        print("Usage: python preprocessing.py <input_file.csv> [output_file.csv]")
-        sys.exit(1)
+def report_profile(preprocessor: HealthcarePreprocessor, args: argparse.Namespace) -> None:
+    """Print and/or save the stage and data profiles requested on the command line."""
+    if preprocessor.data_profiler is not None:
+        preprocessor.data_profiler.save(args.data_profile)
+    profiler = preprocessor.profiler
+    if profiler is None:
+        return
+    profiler.close()
+    if args.profile:
+        print(profiler.format_table())
+    if args.profile_json:
+        profiler.to_json(args.profile_json)
+        logger.info("Profile saved: %s", args.profile_json)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main execution function for file processing."""
+    args = parse_args(argv)
+    configure_logging(args.log_level, json_output=args.log_json, quiet=args.quiet)
     
+    with run_context(args.run_id):
+        _run(args)
+
+
+def _run(args: argparse.Namespace) -> None:
+    """Run the pipeline for parsed command line arguments."""
     try:
-        input_path = sys.argv[1]
+        input_path = args.input_path
+        input_format = HealthcarePreprocessor.detect_format(input_path, args.input_format)
         
         # Generate output path if not provided
-        if len(sys.argv) > 2:
-            output_path = sys.argv[2]
+        if args.output_path:
+            output_path = args.output_path
+            output_format = args.output_format or FILE_FORMATS.get(
+                os.path.splitext(output_path)[1].lower(), 'csv')
         else:
             # Extract filename and create processed version in same directory
-            import os
+            output_format = args.output_format or input_format
             input_dir = os.path.dirname(input_path)
             input_filename = os.path.basename(input_path)
             name, ext = os.path.splitext(input_filename)
+            if output_format != input_format:
+                ext = FORMAT_EXTENSIONS[output_format]
             output_path = os.path.join(input_dir, f"processed_{name}{ext}")
         
         # Initialize preprocessor
-        preprocessor = HealthcarePreprocessor()
+        config = dict(CONFIG)
+        if args.engine:
+            config['CSV_ENGINE'] = args.engine
+        if args.arrow_dtypes:
+            config['ARROW_DTYPES'] = True
+        profiler = None
+        if args.profile or args.profile_json or args.metrics_jsonl:
+            sink = jsonl_sink(args.metrics_jsonl) if args.metrics_jsonl else None
+            profiler = StageProfiler(sink=sink)
+        cache_dir = args.cache_dir or config['STAGE_CACHE_DIR']
+        stage_cache = None
+        if cache_dir:
+            from stage_cache import StageCache
+            if args.clear_cache:
+                StageCache(cache_dir).clear()
+            if not args.no_cache:
+                stage_cache = StageCache(cache_dir, max_bytes=config['STAGE_CACHE_MAX_MB'] * 1024**2)
+        quarantine = QuarantineWriter(args.quarantine) if args.quarantine else None
+        data_profiler = DataProfiler() if args.data_profile else None
+        preprocessor = HealthcarePreprocessor(config, profiler=profiler, stage_cache=stage_cache,
+                                              quarantine=quarantine, data_profiler=data_profiler)
+        if args.state:
+            preprocessor.load_state(args.state)
+        fit = bool(args.save_state)
+        
+        if args.incremental:
+            from incremental import IncrementalStore
+            logger.info("Processing: %s -> %s (incremental)", input_path, args.incremental)
+            IncrementalStore(args.incremental, preprocessor).update(
+                preprocessor.load_data(input_path, input_format))
+            report_profile(preprocessor, args)
+            return
+        
+        logger.info("Processing: %s -> %s", input_path, output_path)
         
-        print(f"Processing: {input_path} -> {output_path}")
+        if args.memory_report and input_format == 'csv':
+            preprocessor.measure_load_memory(input_path)
         
-        # Load data from CSV
-        df = preprocessor.load_data_from_csv(input_path)
+        if args.chunksize:
+            rows_out = preprocessor.preprocess_stream(
+                input_path, output_path, args.chunksize, fit=fit,
+                input_format=input_format, output_format=output_format,
+                compression=args.compression, row_group_size=args.row_group_size,
+                columns=args.columns,
+            )
+            if fit:
+                preprocessor.save_state(args.save_state)
+            logger.info("Feature engineering complete: %d rows saved to %s", rows_out, output_path,
+                        extra={'rows_out': rows_out, 'output_path': output_path})
+            report_profile(preprocessor, args)
+            return
+        
+        # Load input data
+        if stage_cache is not None:
+            df, _ = stage_cache.load(preprocessor, input_path, input_format)
+        else:
+            df = preprocessor.load_data(input_path, input_format)
         initial_shape = df.shape
         
-        # Process data
-        df_processed = preprocessor.preprocess_data(df)
+        # Process data; the loaded frame is not needed afterwards, so the
+        # stages may consume it instead of working on a copy
+        if args.workers and args.workers > 1:
+            from parallel import preprocess_parallel
+            df_processed = preprocess_parallel(preprocessor, df, args.partition_by,
+                                               args.workers, fit=fit, columns=args.columns)
+            if fit:
+                preprocessor.save_state(args.save_state)
+        elif fit:
+            df_processed = preprocessor.fit_transform(df, inplace=True, columns=args.columns)
+            preprocessor.save_state(args.save_state)
+        elif preprocessor.is_fitted:
+            df_processed = preprocessor.transform(df, inplace=True, columns=args.columns)
+        else:
+            df_processed = preprocessor.preprocess_data(df, inplace=True, columns=args.columns)
+        del df
         
-        # Save to CSV
-        df_processed.to_csv(output_path, index=False)
+        # Save output
+        preprocessor.save_data(df_processed, output_path, output_format,
+                               compression=args.compression,
+                               row_group_size=args.row_group_size)
         
-        print(f"✅ Feature engineering complete!")
-        print(f"   Input: {initial_shape[0]:,} rows × {initial_shape[1]} columns")
-        print(f"   Output: {df_processed.shape[0]:,} rows × {df_processed.shape[1]} columns")
-        print(f"   File saved: {output_path}")
+        logger.info(
+            "Feature engineering complete: %d rows x %d columns -> %d rows x %d columns saved to %s",
+            initial_shape[0], initial_shape[1], df_processed.shape[0], df_processed.shape[1], output_path,
+            extra={'rows_in': initial_shape[0], 'rows_out': df_processed.shape[0],
+                   'output_path': output_path},
+        )
+        report_profile(preprocessor, args)
         
     except Exception as e:
-        print(f"Error during preprocessing: {e}")
+        logger.error("Error during preprocessing: %s", e)
         raise
 
 
@@ -0,0 +1,333 @@
+"""
+Content-addressed on-disk cache of preprocessing stage outputs.
+
+Every stage output is stored under a key that chains:
+
+- the key of the stage before it (the first stage chains from the input
+  fingerprint: a hash of the frame, or of the file and its load settings);
+- the stage name and a code version: the source of the stage method, of the
+  helper methods it calls, of the module constants it reads and of the
+  modules defining helper classes it uses, plus the pandas and NumPy versions;
+- the CONFIG keys that code reads, and the fitted state it depends on.
+
+Changing one setting, e.g. LEADTIME_BINS, changes the keys of
+process_booking_features and every stage after it, so a rerun loads the
+output of the last unaffected stage and recomputes only the rest. Entries
+are Arrow IPC files evicted least-recently-used beyond a size limit.
+
+Stages run on copies while caching (the in-place mode is disabled), since
+an in-place stage output is not self-contained.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import HealthcarePreprocessor
+from utils.ipc import read_ipc, write_ipc
+from utils.logger import get_logger, run_context
+
+logger = get_logger('stage_cache')
+
+# Bump to invalidate every existing entry, e.g. when the entry format changes
+CACHE_VERSION = 1
+
+# Preprocessor attributes that stages read as inputs (hashed into the key
+# when the stage code references them) or update as side effects (stored
+# with the entry and restored on a hit)
+STATE_INPUTS = ('rare_vocab', 'category_levels', 'output_dtypes', '_learning',
+                '_requested', '_wanted', 'history', '_superseded')
+STATE_OUTPUTS = ('rare_vocab', 'date_parse_failures', 'validation_report', 'ingestion_report',
+                 'filter_report')
+
+_CONFIG_KEY = re.compile(r"self\.config(?:\.get\(|\[)'(\w+)'")
+_SELF_ATTR = re.compile(r"\bself\.(\w+)")
+_CLASS_ATTR = re.compile(r"\bHealthcarePreprocessor\.(\w+)")
+_CONSTANT = re.compile(r"\b([A-Z][A-Z0-9_]{2,})\b")
+_CLASS_NAME = re.compile(r"\b([A-Z][a-z]\w*)\b")
+
+
+class StageCache:
+    """Stage outputs on disk, keyed by input, code, config and state."""
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._code_cache: Dict[Tuple[type, str], Tuple[str, List[str], List[str]]] = {}
+
+    # ------------------------------------------------------------------
+    # Pipeline integration
+    # ------------------------------------------------------------------
+
+    def load(self, preprocessor: HealthcarePreprocessor, file_path: str,
+             fmt: Optional[str] = None) -> Tuple[pd.DataFrame, str]:
+        """
+        preprocessor.load_data through the cache.
+
+        Returns the frame and its fingerprint, derived from the file's path,
+        size and modification time and the loader's code and config.
+        """
+        fmt = preprocessor.detect_format(file_path, fmt)
+        stat = os.stat(file_path)
+        file_key = _digest(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, fmt)
+        key = self.stage_key(preprocessor, 'load_data', file_key)
+        df = self._read(key)
+        if df is None:
+            df = preprocessor.load_data(file_path, fmt)
+            self._write(key, 'load_data', df, {})
+            self.evict()
+        else:
+            logger.info("Stage cache hit: load_data (%s)", file_path)
+        return df, key
+
+    def run(self, preprocessor: HealthcarePreprocessor, df: pd.DataFrame,
+            fingerprint: Optional[str] = None) -> pd.DataFrame:
+        """
+        Run the preprocess_data stages, resuming after the last cached one.
+
+        `fingerprint` identifies `df` (e.g. from load); by default it is a
+        hash of the frame's values, index and dtypes.
+        """
+        with run_context():
+            rows_in = len(df)
+            key = fingerprint or frame_fingerprint(df)
+            stages = preprocessor.pipeline_stages()
+
+            # Walk the cached prefix: keys depend on the state left by earlier
+            # stages, so replay their side effects while walking
+            resume_at, resume_key = 0, None
+            for name, _ in stages:
+                key = self.stage_key(preprocessor, name, key)
+                meta = self._read_meta(key)
+                if meta is None:
+                    break
+                for attr, value in meta['side_effects'].items():
+                    setattr(preprocessor, attr, value)
+                resume_at, resume_key = resume_at + 1, key
+
+            # Quarantined rows are written by validation, not replayed: rerun
+            # it on the input when a hit skips it
+            cached = [name for name, _ in stages[:resume_at]]
+            if preprocessor.quarantine is not None and 'validate_input_data' in cached:
+                preprocessor.validate_input_data(df)
+            elif 'validate_input_data' in cached:
+                # Log the restored reports as a fresh run would
+                preprocessor._log_validation()
+            if 'clean_initial_data' in cached:
+                preprocessor._log_filter()
+            if 'parse_dates' in cached:
+                preprocessor._log_date_parse_failures()
+
+            if resume_key is not None:
+                df = self._read(resume_key)
+                logger.info("Stage cache hit: resuming after %s (%d of %d stages cached)",
+                            stages[resume_at - 1][0], resume_at, len(stages))
+
+            key = resume_key or fingerprint or frame_fingerprint(df)
+            for name, stage in stages[resume_at:]:
+                key = self.stage_key(preprocessor, name, key)
+                before = _state_snapshot(preprocessor)
+                if preprocessor.profiler is None:
+                    df = stage(df)
+                else:
+                    df = preprocessor.profiler.run(name, stage, df)
+                after = _state_snapshot(preprocessor)
+                side_effects = {
+                    attr: getattr(preprocessor, attr)
+                    for attr in STATE_OUTPUTS if before[attr] != after[attr]
+                }
+                self._write(key, name, df, side_effects)
+            self.evict()
+            preprocessor._log_completed(rows_in, df)
+        return df
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+
+    def stage_key(self, preprocessor: HealthcarePreprocessor, name: str, parent_key: str) -> str:
+        """Key of stage `name`'s output given the key of its input."""
+        code, config_keys, state_attrs = self._code_fingerprint(type(preprocessor), name)
+        config = {key: preprocessor.config.get(key) for key in config_keys}
+        state = {attr: getattr(preprocessor, attr) for attr in state_attrs}
+        return _digest(CACHE_VERSION, parent_key, name, code, config, state)
+
+    def _code_fingerprint(self, cls: type, name: str) -> Tuple[str, List[str], List[str]]:
+        """
+        Hash of the source of `cls.name` and everything it references, with
+        the config keys and state attributes that code reads.
+        """
+        cache_key = (cls, name)
+        if cache_key in self._code_cache:
+            return self._code_cache[cache_key]
+
+        sources, config_keys, state_attrs = [], set(), set()
+        seen, pending = set(), [name]
+        while pending:
+            attr_name = pending.pop()
+            if attr_name in seen:
+                continue
+            seen.add(attr_name)
+            attr = inspect.getattr_static(cls, attr_name, None)
+            func = getattr(attr, 'fget', None) or getattr(attr, '__func__', None) or attr
+            if not callable(func):
+                if attr_name in STATE_INPUTS:
+                    state_attrs.add(attr_name)
+                continue
+            try:
+                source = inspect.getsource(func)
+            except (OSError, TypeError):
+                continue
+            sources.append(source)
+            config_keys.update(_CONFIG_KEY.findall(source))
+            referenced = _SELF_ATTR.findall(source) + _CLASS_ATTR.findall(source)
+            state_attrs.update(attr for attr in referenced if attr in STATE_INPUTS)
+            pending.extend(referenced)
+            # Module-level tables such as SEASON_BY_MONTH
+            module = sys.modules[func.__module__]
+            for constant in sorted(set(_CONSTANT.findall(source))):
+                value = getattr(module, constant, None)
+                if value is not None and not callable(value) and constant != 'CONFIG':
+                    sources.append(f'{constant}={value!r}')
+            # Helper classes from other modules, e.g. utils.calendar_table.CalendarTable
+            for class_name in sorted(set(_CLASS_NAME.findall(source))):
+                value = getattr(module, class_name, None)
+                if inspect.isclass(value) and value.__module__ not in (func.__module__, 'builtins') \
+                        and not value.__module__.startswith(('pandas', 'numpy')):
+                    sources.append(inspect.getsource(sys.modules[value.__module__]))
+
+        code = _digest(sorted(sources), pd.__version__, np.__version__)
+        result = (code, sorted(config_keys), sorted(state_attrs))
+        self._code_cache[cache_key] = result
+        return result
+
+    # ------------------------------------------------------------------
+    # Entries
+    # ------------------------------------------------------------------
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return (os.path.join(self.cache_dir, f'{key}.arrow'),
+                os.path.join(self.cache_dir, f'{key}.meta'))
+
+    def _read_meta(self, key: str) -> Optional[Dict]:
+        data_path, meta_path = self._paths(key)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, 'rb') as f:
+            return pickle.load(f)
+
+    def _read(self, key: str) -> Optional[pd.DataFrame]:
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        data_path, meta_path = self._paths(key)
+        df = read_ipc(data_path)
+        # Arrow does not record every pandas dtype detail (e.g. string storage)
+        for col, dtype in meta['dtypes'].items():
+            if df[col].dtype != dtype:
+                df[col] = df[col].astype(dtype)
+        for path in (data_path, meta_path):
+            os.utime(path)
+        return df
+
+    def _write(self, key: str, name: str, df: pd.DataFrame, side_effects: Dict) -> None:
+        data_path, meta_path = self._paths(key)
+        meta = {'stage': name, 'dtypes': df.dtypes.to_dict(), 'side_effects': side_effects}
+        try:
+            write_ipc(df, data_path + '.tmp')
+        except Exception as e:
+            # e.g. object columns mixing types Arrow cannot store
+            logger.warning("Not caching %s output: %s", name, e)
+            if os.path.exists(data_path + '.tmp'):
+                os.remove(data_path + '.tmp')
+            return
+        with open(meta_path + '.tmp', 'wb') as f:
+            pickle.dump(meta, f)
+        os.replace(data_path + '.tmp', data_path)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """(key, bytes, last access time) of each entry, least recently used first."""
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.arrow'):
+                continue
+            key = file_name[:-len('.arrow')]
+            data_path, meta_path = self._paths(key)
+            try:
+                stat = os.stat(data_path)
+                size = stat.st_size + os.path.getsize(meta_path)
+            except OSError:
+                continue
+            entries.append((key, size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self) -> int:
+        """Remove least recently used entries beyond max_bytes; returns entries removed."""
+        if self.max_bytes is None:
+            return 0
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info("Stage cache evicted %d entries", removed)
+        return removed
+
+    def clear(self) -> int:
+        """Remove every entry; returns the number removed."""
+        entries = self.entries()
+        for key, _, _ in entries:
+            self._remove(key)
+        logger.info("Stage cache cleared: %d entries", len(entries))
+        return len(entries)
+
+    def _remove(self, key: str) -> None:
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash of a frame's values, index, column names, dtypes and category levels."""
+    schema = [
+        [str(col), str(dtype), dtype.categories.tolist() if isinstance(dtype, pd.CategoricalDtype) else None]
+        for col, dtype in df.dtypes.items()
+    ]
+    row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return _digest(schema, hashlib.sha256(row_hashes.tobytes()).hexdigest())
+
+
+def _state_snapshot(preprocessor: HealthcarePreprocessor) -> Dict[str, str]:
+    return {attr: json.dumps(getattr(preprocessor, attr), sort_keys=True, default=str)
+            for attr in STATE_OUTPUTS}
+
+
+def _digest(*parts) -> str:
+    """sha256 over the JSON form of `parts`."""
+    payload = json.dumps(parts, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _json_default(value):
+    # Sets hash in a stable order; anything else by its string form
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    # Arrays by their contents; str() elides the middle of long ones
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    return str(value)
@@ -0,0 +1,228 @@
+"""
+Out-of-fold target encoding of categorical columns.
+
+Notebook 03's prepare_modeling_data keeps only int64/float64 columns, so
+every categorical of the preprocessed output is dropped. A TargetEncoder
+replaces each one with a single float column: the smoothed mean target of
+the value,
+
+    (sum of targets + smoothing * prior) / (count + smoothing),
+
+which shrinks rare values towards the prior mean.
+
+On the training rows the encodings are out of fold: the rows are split
+into stratified folds and each row is encoded with statistics of the other
+folds only, so a row's own target never leaks into its feature. All folds
+come from one grouped aggregation per column: a bincount over (fold, code)
+pairs gives every fold's counts and target sums, and each fold's
+out-of-fold statistics are the column totals minus its own row. No Python
+loop runs per category or per row.
+
+For serving the encoder keeps, per column, the sorted 64-bit hashes of the
+values (see frequency.value_keys) next to their encodings on all training
+rows. Unseen and missing values get the prior.
+"""
+
+import io
+import json
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from frequency import value_keys
+from utils.logger import get_logger
+
+logger = get_logger('target_encoding')
+
+# Version of the state written by TargetEncoder.get_state and save
+STATE_VERSION = 1
+
+# Per-row identifiers, left out of the default columns: one table entry per
+# training row and no signal
+ID_COLUMNS = ('AppointmentId', 'CustomerNumber')
+
+
+class TargetEncoder:
+    """Smoothed mean-target encodings, out of fold for the training rows."""
+
+    def __init__(self, columns: Optional[Iterable[str]] = None, n_splits: int = 5,
+                 smoothing: float = 20.0, random_state: int = 42, suffix: str = '_te'):
+        if smoothing <= 0:
+            raise ValueError(f"smoothing must be positive, got {smoothing}")
+        # None encodes every categorical and text column of the training
+        # frame except the target and the identifiers
+        self.columns = None if columns is None else list(columns)
+        self.n_splits = n_splits
+        self.smoothing = smoothing
+        self.random_state = random_state
+        self.suffix = suffix
+        self.prior: Optional[float] = None
+        self._keys: Dict[str, np.ndarray] = {}
+        self._values: Dict[str, np.ndarray] = {}
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.prior is not None
+
+    def fit(self, df: pd.DataFrame, target: Union[str, pd.Series, np.ndarray],
+            positive=None) -> 'TargetEncoder':
+        """Learn the serving tables from all rows of `df`."""
+        self._fit(df, self._target(df, target, positive), folds=None, target=target)
+        return self
+
+    def fit_transform(self, df: pd.DataFrame, target: Union[str, pd.Series, np.ndarray],
+                      positive=None) -> pd.DataFrame:
+        """
+        Learn the serving tables and add out-of-fold encodings of the
+        training rows to `df` in place. `target` is a column name or the
+        values; with `positive` it is the indicator of that value.
+        """
+        y = self._target(df, target, positive)
+        for col, values in self._fit(df, y, folds=self.folds(y), target=target).items():
+            df[col + self.suffix] = values
+        return df
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add the encodings of the serving tables to `df` in place."""
+        if not self.is_fitted:
+            raise ValueError("TargetEncoder is not fitted; call fit() or load() first")
+        for col in self.columns:
+            if col in df.columns:
+                df[col + self.suffix] = self.encode(df[col], col)
+        return df
+
+    def encode(self, series: pd.Series, col: Optional[str] = None) -> np.ndarray:
+        """Serving encodings of one column's values (the prior for unseen or missing ones)."""
+        col = series.name if col is None else col
+        codes, keys = value_keys(series)
+        positions = pd.Index(self._keys[col]).get_indexer(keys)
+        table = np.where(positions >= 0, np.append(self._values[col], self.prior)[positions], self.prior)
+        return np.append(table, self.prior)[codes]
+
+    def folds(self, y: np.ndarray) -> np.ndarray:
+        """Fold of each row: shuffled, then dealt out in target order so folds are stratified."""
+        rng = np.random.default_rng(self.random_state)
+        order = np.lexsort((rng.random(len(y)), y))
+        folds = np.empty(len(y), dtype=np.int64)
+        folds[order] = np.arange(len(y)) % self.n_splits
+        return folds
+
+    @staticmethod
+    def _target(df: pd.DataFrame, target, positive) -> np.ndarray:
+        """Target values as floats."""
+        values = df[target] if isinstance(target, str) else pd.Series(np.asarray(target))
+        if len(values) != len(df):
+            raise ValueError(f"Target has {len(values)} values for {len(df)} rows")
+        if positive is not None:
+            return (values == positive).to_numpy(dtype=float)
+        y = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        if np.isnan(y).any():
+            raise ValueError("Target has missing or non-numeric values; pass `positive` for a label target")
+        return y
+
+    def _fit(self, df: pd.DataFrame, y: np.ndarray, folds: Optional[np.ndarray],
+             target=None) -> Dict[str, np.ndarray]:
+        """
+        Build the serving tables; with `folds`, also return the out-of-fold
+        encodings of every column.
+        """
+        if self.columns is None:
+            excluded = set(ID_COLUMNS) | ({target} if isinstance(target, str) else set())
+            self.columns = [col for col in df.select_dtypes(include=['category', 'object', 'string']).columns
+                            if col not in excluded]
+        self.prior = float(y.mean()) if len(y) else 0.0
+        m = self.smoothing
+        if folds is not None:
+            fold_counts = np.bincount(folds, minlength=self.n_splits)
+            fold_sums = np.bincount(folds, weights=y, minlength=self.n_splits)
+            # Prior of each fold from the other folds' rows
+            rest = np.maximum(len(y) - fold_counts, 1)
+            fold_priors = (y.sum() - fold_sums) / rest
+
+        encodings = {}
+        for col in self.columns:
+            codes, keys = value_keys(df[col])
+            n_codes = len(keys)
+            present = codes >= 0
+            counts = np.bincount(codes[present], minlength=n_codes)
+            sums = np.bincount(codes[present], weights=y[present], minlength=n_codes)
+            self._store(col, keys, counts, sums)
+
+            if folds is None:
+                continue
+            # Counts and sums of every (fold, value) pair in one pass
+            cells = folds[present] * n_codes + codes[present]
+            cell_counts = np.bincount(cells, minlength=self.n_splits * n_codes).reshape(self.n_splits, n_codes)
+            cell_sums = np.bincount(cells, weights=y[present],
+                                    minlength=self.n_splits * n_codes).reshape(self.n_splits, n_codes)
+            table = (sums - cell_sums + m * fold_priors[:, None]) / (counts - cell_counts + m)
+            values = fold_priors[folds]
+            values[present] = table[folds[present], codes[present]]
+            encodings[col] = values
+
+        logger.info("Target encoder fitted on %d rows: %d columns, prior %.4f",
+                    len(y), len(self.columns), self.prior)
+        return encodings
+
+    def _store(self, col: str, keys: np.ndarray, counts: np.ndarray, sums: np.ndarray) -> None:
+        """Serving table of one column: value hashes and encodings on all rows."""
+        # Values with the same text share a key
+        seen = counts > 0
+        merged, inverse = np.unique(keys[seen], return_inverse=True)
+        counts = np.bincount(inverse, weights=counts[seen], minlength=len(merged))
+        sums = np.bincount(inverse, weights=sums[seen], minlength=len(merged))
+        self._keys[col] = merged
+        self._values[col] = (sums + self.smoothing * self.prior) / (counts + self.smoothing)
+
+    def get_state(self) -> Dict:
+        """The tables as a JSON-serializable dict."""
+        return {
+            'version': STATE_VERSION,
+            'columns': self.columns,
+            'n_splits': self.n_splits,
+            'smoothing': self.smoothing,
+            'random_state': self.random_state,
+            'suffix': self.suffix,
+            'prior': self.prior,
+            'tables': {col: [self._keys[col].tolist(), self._values[col].tolist()] for col in self.columns},
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'TargetEncoder':
+        """Rebuild an encoder from get_state output."""
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(
+                f"Unsupported state version {state.get('version')} (expected {STATE_VERSION})"
+            )
+        encoder = cls(state['columns'], state['n_splits'], state['smoothing'],
+                      state['random_state'], state['suffix'])
+        encoder.prior = state['prior']
+        for col, (keys, values) in state['tables'].items():
+            encoder._keys[col] = np.asarray(keys, dtype=np.uint64)
+            encoder._values[col] = np.asarray(values, dtype=float)
+        return encoder
+
+    def save(self, path: str) -> None:
+        """Write the tables as a compressed NumPy archive: key and encoding arrays per column."""
+        meta = {key: value for key, value in self.get_state().items() if key != 'tables'}
+        arrays = {'meta': np.array(json.dumps(meta))}
+        for i, col in enumerate(self.columns):
+            arrays[f'keys_{i}'] = self._keys[col]
+            arrays[f'values_{i}'] = self._values[col]
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        logger.info("Target encoder saved: %s", path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TargetEncoder':
+        """Read tables written by save."""
+        with open(path, 'rb') as f:
+            archive = np.load(io.BytesIO(f.read()), allow_pickle=False)
+        state = json.loads(str(archive['meta']))
+        state['tables'] = {
+            col: [archive[f'keys_{i}'], archive[f'values_{i}']] for i, col in enumerate(state['columns'])
+        }
+        encoder = cls.from_state(state)
+        logger.info("Target encoder loaded: %s", path)
+        return encoder
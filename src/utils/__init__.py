@@ -0,0 +1 @@
+"""Shared utilities for the preprocessing pipeline (metrics, logging, encoders)."""
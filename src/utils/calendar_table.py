@@ -0,0 +1,123 @@
+"""
+Calendar dimension table for date features.
+
+Calendar features are properties of the day, and a batch of appointments
+spans only a few thousand distinct days. A CalendarTable holds every
+attribute for each day of a contiguous span, indexed by day number (days
+since 1970-01-01), so a date column is joined to all of them with one
+subtraction and one integer gather per attribute instead of a `.dt`
+accessor pass each. Holiday and Ramadan flags are extra columns of the same
+table.
+"""
+
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Weekend days (Friday, Saturday) as pandas dayofweek values
+WEEKEND_DAYS = (4, 5)
+
+# Day number of a missing date
+MISSING_DAY = np.iinfo(np.int64).min
+
+
+def day_numbers(series: pd.Series) -> np.ndarray:
+    """Days since 1970-01-01 of a datetime column (MISSING_DAY where missing)."""
+    values = series.to_numpy(dtype='datetime64[ns]')
+    return values.astype('datetime64[D]').astype(np.int64)
+
+
+class CalendarTable:
+    """Calendar attributes of every day from `first_day` to `last_day` (day numbers)."""
+
+    def __init__(self, first_day: int, last_day: int,
+                 season_by_month: Optional[np.ndarray] = None,
+                 holidays: Iterable[str] = (),
+                 ramadan_periods: Iterable[Sequence[str]] = ()):
+        self.first_day = int(first_day)
+        self.last_day = int(last_day)
+        self.settings = _settings(holidays, ramadan_periods)
+        day_range = np.arange(self.first_day, self.last_day + 1)
+        days = pd.DatetimeIndex(day_range.astype('datetime64[D]').astype('datetime64[ns]'))
+
+        dayofweek = days.dayofweek.to_numpy()
+        day = days.day.to_numpy()
+        self.attributes = {
+            'year': days.year.to_numpy(dtype=np.int16),
+            'month': days.month.to_numpy(dtype=np.int8),
+            'day': day.astype(np.int8),
+            'quarter': days.quarter.to_numpy(dtype=np.int8),
+            'weekofyear': days.isocalendar().week.to_numpy(dtype=np.int8),
+            'dayofweek': dayofweek.astype(np.int8),
+            'weekofmonth': ((day - 1) // 7 + 1).astype(np.int8),
+            'is_weekend': np.isin(dayofweek, WEEKEND_DAYS).astype(np.int8),
+        }
+        if season_by_month is not None:
+            self.attributes['season'] = season_by_month[self.attributes['month']]
+
+        holiday_days, ramadan_ranges = self.settings
+        self.attributes['is_holiday'] = np.isin(day_range, holiday_days).astype(np.int8)
+        is_ramadan = np.zeros(len(day_range), dtype=np.int8)
+        for start, end in ramadan_ranges:
+            is_ramadan[(day_range >= start) & (day_range <= end)] = 1
+        self.attributes['is_ramadan'] = is_ramadan
+
+    def __len__(self) -> int:
+        return self.last_day - self.first_day + 1
+
+    def covers(self, first_day: int, last_day: int, holidays: Iterable[str] = (),
+               ramadan_periods: Iterable[Sequence[str]] = ()) -> bool:
+        """Whether the table spans the given days and was built with the same flags."""
+        return (self.first_day <= first_day and last_day <= self.last_day
+                and self.settings == _settings(holidays, ramadan_periods))
+
+    def join(self, days: np.ndarray) -> 'CalendarJoin':
+        """Rows of the table for each day number in `days` (all covered or missing)."""
+        return CalendarJoin(self, days)
+
+
+class CalendarJoin:
+    """A date column joined to a CalendarTable; attributes are gathered on request."""
+
+    def __init__(self, table: CalendarTable, days: np.ndarray):
+        self.table = table
+        self.missing = days == MISSING_DAY
+        self.positions = np.where(self.missing, 0, days - table.first_day)
+
+    def integers(self, attr: str) -> pd.arrays.IntegerArray:
+        """Attribute as a nullable Int64 array, missing for missing dates."""
+        values = self.table.attributes[attr].take(self.positions).astype(np.int64)
+        return pd.arrays.IntegerArray(values, self.missing.copy())
+
+    def values(self, attr: str, fill) -> np.ndarray:
+        """Attribute as a NumPy array, with `fill` for missing dates."""
+        values = self.table.attributes[attr].take(self.positions)
+        if self.missing.any():
+            values = np.where(self.missing, fill, values)
+        return values
+
+    def flags(self, attr: str) -> pd.arrays.IntegerArray:
+        """0/1 attribute as a nullable Int8 array, 0 for missing dates."""
+        values = self.values(attr, 0).astype(np.int8)
+        return pd.arrays.IntegerArray(values, np.zeros(len(values), dtype=bool))
+
+
+def span_of(days: np.ndarray) -> Optional[Tuple[int, int]]:
+    """First and last non-missing day number, or None if every day is missing."""
+    present = days[days != MISSING_DAY]
+    if not len(present):
+        return None
+    return int(present.min()), int(present.max())
+
+
+def _settings(holidays: Iterable[str], ramadan_periods: Iterable[Sequence[str]]):
+    """Holiday day numbers and Ramadan (start, end) day numbers, in a comparable form."""
+    holiday_days = tuple(sorted(_day_number(day) for day in holidays))
+    ramadan_ranges = tuple(sorted((_day_number(start), _day_number(end))
+                                  for start, end in ramadan_periods))
+    return holiday_days, ramadan_ranges
+
+
+def _day_number(value) -> int:
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
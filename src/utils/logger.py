@@ -0,0 +1,157 @@
+"""
+Structured logging for the preprocessing pipeline.
+
+All pipeline modules log through children of the 'predictml' logger. The
+library installs no handlers; entry points call configure_logging to choose
+the level, text or JSON lines output, and quiet mode. Every record carries
+the correlation ID of the run it belongs to (see run_context), and records
+logged with a `rate_key` extra are throttled to one per key per interval so
+per-batch row-count summaries cannot flood the log.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import sys
+import time
+import uuid
+from typing import Dict, IO, Iterator, Optional
+
+LOGGER_NAME = 'predictml'
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'run_id', 'rate_key'}
+
+_run_id: contextvars.ContextVar = contextvars.ContextVar('run_id', default=None)
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    """Return the pipeline logger, or its child `name`."""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}' if name else LOGGER_NAME)
+
+
+def current_run_id() -> Optional[str]:
+    """Correlation ID of the active run, if any."""
+    return _run_id.get()
+
+
+@contextlib.contextmanager
+def run_context(run_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Tag records logged inside the block with a correlation ID.
+
+    Without `run_id`, a nested block reuses the active ID so a run that
+    calls other runs (e.g. a stream of preprocess_data calls) logs under one ID.
+    """
+    active = _run_id.get()
+    if run_id is None and active is not None:
+        yield active
+        return
+    token = _run_id.set(run_id or uuid.uuid4().hex[:12])
+    try:
+        yield _run_id.get()
+    finally:
+        _run_id.reset(token)
+
+
+class RunIdFilter(logging.Filter):
+    """Attach the active correlation ID to each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id.get() or '-'
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most one record per `rate_key` every `interval_s` seconds.
+
+    Records without a rate_key always pass. The next record emitted for a
+    key reports how many were dropped since the last one in `suppressed`.
+    """
+
+    def __init__(self, interval_s: float = 5.0):
+        super().__init__()
+        self.interval_s = interval_s
+        self._last: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'rate_key', None)
+        if key is None or self.interval_s <= 0:
+            return True
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval_s:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines: time, level, run ID and message."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s [%(run_id)s] %(message)s', '%H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f" (+{suppressed} similar suppressed)"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any fields passed via `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'run_id': getattr(record, 'run_id', None),
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level: str = 'INFO', json_output: bool = False, quiet: bool = False,
+                      stream: Optional[IO] = None, rate_limit_s: float = 5.0) -> logging.Logger:
+    """
+    Install a single handler on the pipeline logger.
+
+    Quiet mode raises the level to WARNING, so the pipeline's info and debug
+    calls return before formatting anything. Python warnings are routed to
+    the same handler. Calling this again replaces the previous handler.
+    """
+    logger = get_logger()
+    warnings_logger = logging.getLogger('py.warnings')
+    for target in (logger, warnings_logger):
+        for handler in [h for h in target.handlers if getattr(h, '_predictml', False)]:
+            target.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler._predictml = True
+    handler.addFilter(RunIdFilter())
+    handler.addFilter(RateLimitFilter(rate_limit_s))
+    handler.setFormatter(JsonFormatter() if json_output else TextFormatter())
+
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING if quiet else level.upper())
+    logger.propagate = False
+
+    logging.captureWarnings(True)
+    warnings_logger.addHandler(handler)
+    warnings_logger.propagate = False
+    return logger
@@ -0,0 +1,156 @@
+"""
+Per-stage instrumentation for the preprocessing pipeline.
+
+A StageProfiler wraps each stage call and records wall time, CPU time, rows
+in and out, and traced memory (delta and peak). Records can be emitted to a
+metrics sink as they are produced and summarized as JSON or a text table.
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+MB = 1024 ** 2
+
+
+class StageProfiler:
+    """
+    Records timing, row counts and memory for each pipeline stage.
+
+    Memory is measured with tracemalloc, which slows allocation-heavy code;
+    pass track_memory=False to record only times and row counts. Tracing is
+    on only while stages run: for one stage call, or for a whole pipeline
+    run inside tracing().
+    """
+
+    def __init__(self, track_memory: bool = True,
+                 sink: Optional[Callable[[Dict], None]] = None):
+        self.track_memory = track_memory
+        self.sink = sink
+        self.records: List[Dict] = []
+        self._started_tracing = False
+
+    def run(self, name: str, stage: Callable[[pd.DataFrame], pd.DataFrame],
+            df: pd.DataFrame) -> pd.DataFrame:
+        """Run `stage` on `df` and record its cost."""
+        with self.tracing():
+            return self._run(name, stage, df)
+
+    def _run(self, name: str, stage: Callable[[pd.DataFrame], pd.DataFrame],
+             df: pd.DataFrame) -> pd.DataFrame:
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            mem_before = tracemalloc.get_traced_memory()[0]
+
+        rows_in = len(df)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = stage(df)
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+        record = {
+            'stage': name,
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'rows_in': rows_in,
+            'rows_out': len(result),
+        }
+        if self.track_memory:
+            mem_after, mem_peak = tracemalloc.get_traced_memory()
+            record['mem_delta_mb'] = (mem_after - mem_before) / MB
+            record['mem_peak_mb'] = (mem_peak - mem_before) / MB
+
+        self.records.append(record)
+        if self.sink is not None:
+            self.sink(record)
+        return result
+
+    @contextmanager
+    def tracing(self) -> Iterator[None]:
+        """
+        Trace memory for the duration of the block, so allocations of one
+        stage freed by a later one are accounted for. Tracing started here
+        stops on exit; nested blocks reuse the outer one.
+        """
+        if not self.track_memory or tracemalloc.is_tracing():
+            yield
+            return
+        tracemalloc.start()
+        self._started_tracing = True
+        try:
+            yield
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop tracemalloc if this profiler started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def summary(self) -> List[Dict]:
+        """
+        Aggregate records by stage, in first-run order.
+
+        Times, rows and memory deltas are summed over calls (e.g. one per
+        chunk in streaming mode); peak memory is the maximum.
+        """
+        stages: Dict[str, Dict] = {}
+        for record in self.records:
+            agg = stages.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0})
+            agg['calls'] += 1
+            for key, value in record.items():
+                if key == 'stage':
+                    continue
+                if key == 'mem_peak_mb':
+                    agg[key] = max(agg.get(key, value), value)
+                else:
+                    agg[key] = agg.get(key, 0) + value
+        return list(stages.values())
+
+    def report(self) -> Dict:
+        """Structured report: per-stage summary plus pipeline totals."""
+        summary = self.summary()
+        return {
+            'stages': summary,
+            'total': {
+                'wall_s': sum(s['wall_s'] for s in summary),
+                'cpu_s': sum(s['cpu_s'] for s in summary),
+            },
+        }
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        """Serialize the report as JSON, optionally writing it to `path`."""
+        text = json.dumps(self.report(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def format_table(self) -> str:
+        """Render the per-stage summary as a fixed-width text table."""
+        header = f"{'stage':<30} {'calls':>5} {'wall s':>9} {'cpu s':>9} {'rows in':>10} {'rows out':>10}"
+        if self.track_memory:
+            header += f" {'Δ MB':>9} {'peak MB':>9}"
+        lines = [header, '-' * len(header)]
+        for s in self.summary():
+            line = (f"{s['stage']:<30} {s['calls']:>5} {s['wall_s']:>9.4f} {s['cpu_s']:>9.4f} "
+                    f"{s['rows_in']:>10,} {s['rows_out']:>10,}")
+            if self.track_memory:
+                line += f" {s['mem_delta_mb']:>9.2f} {s['mem_peak_mb']:>9.2f}"
+            lines.append(line)
+        total = self.report()['total']
+        lines.append('-' * len(header))
+        lines.append(f"{'total':<30} {'':>5} {total['wall_s']:>9.4f} {total['cpu_s']:>9.4f}")
+        return '\n'.join(lines)
+
+
+def jsonl_sink(path: str) -> Callable[[Dict], None]:
+    """Metrics sink that appends each stage record as one JSON line to `path`."""
+    def emit(record: Dict) -> None:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    return emit
@@ -0,0 +1,279 @@
+"""
+Declarative, vectorized validation of input rows.
+
+Rules are plain dicts (see CONFIG['VALIDATION_RULES']) with a `name`, a
+`rule` type and its parameters:
+
+    required    column                  value is missing
+    allowed     column, values          value not in `values`
+    pattern     column, pattern         value does not fully match the regex
+    range       column, min and/or max  value outside [min, max] (numbers or dates)
+    date        column                  value present but not a parseable date
+    date_order  earlier, later, [unit]  `earlier` is after `later` (compared at
+                                        `unit` resolution, e.g. 'D' for days)
+    unique      columns                 repeats an earlier row's key
+
+Each rule evaluates to one boolean violation mask over all rows. Checks on
+text and categorical columns run once per distinct value and are broadcast
+through the codes, and dates are parsed once per column and shared between
+rules, so validation stays linear in the number of rows. Missing values only
+violate `required`. Rules on columns the input lacks are skipped.
+"""
+
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Rule type -> check(context, rule) -> violation mask (True where violated)
+RULE_TYPES: Dict[str, Callable] = {}
+
+# Parameters each rule type needs besides name and rule
+RULE_PARAMETERS = {
+    'required': ('column',),
+    'allowed': ('column', 'values'),
+    'pattern': ('column', 'pattern'),
+    'range': ('column',),
+    'date': ('column',),
+    'date_order': ('earlier', 'later'),
+    'unique': ('columns',),
+}
+
+# Column of the quarantine file listing the rules a row violates
+VIOLATIONS_COLUMN = '_violations'
+
+
+def rule_type(name: str):
+    """Register a check for rule type `name`."""
+    def register(fn):
+        RULE_TYPES[name] = fn
+        return fn
+    return register
+
+
+class ValidationResult:
+    """Violation masks of one validated frame."""
+
+    def __init__(self, rows: int, masks: Dict[str, np.ndarray], skipped: List[str]):
+        self.rows = rows
+        self.masks = masks
+        self.skipped = skipped
+        self.invalid = np.zeros(rows, dtype=bool)
+        for mask in masks.values():
+            self.invalid |= mask
+
+    @property
+    def violations(self) -> Dict[str, int]:
+        """Violating rows per rule."""
+        return {name: int(mask.sum()) for name, mask in self.masks.items()}
+
+    @property
+    def invalid_rows(self) -> int:
+        """Rows violating at least one rule."""
+        return int(self.invalid.sum())
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable report."""
+        return {
+            'rows': self.rows,
+            'invalid_rows': self.invalid_rows,
+            'violations': self.violations,
+            'skipped': self.skipped,
+        }
+
+    def violation_labels(self) -> np.ndarray:
+        """';'-separated names of the rules each invalid row violates."""
+        positions = np.flatnonzero(self.invalid)
+        labels = np.full(len(positions), '', dtype=object)
+        for name, mask in self.masks.items():
+            hit = mask[positions]
+            labels[hit] = labels[hit] + np.where(labels[hit] == '', '', ';') + name
+        return labels
+
+
+class Validator:
+    """Evaluates a list of rule specs against DataFrames."""
+
+    def __init__(self, rules: List[Dict],
+                 parse_date: Optional[Callable[[pd.Series, str], pd.Series]] = None):
+        """
+        `parse_date(series, column)` parses a raw date column (default:
+        pd.to_datetime with errors='coerce' on each distinct value).
+        """
+        names = set()
+        for spec in rules:
+            name, kind = spec.get('name'), spec.get('rule')
+            if not name or name in names:
+                raise ValueError(f"Validation rules need unique names: {spec}")
+            if kind not in RULE_TYPES:
+                raise ValueError(f"Unknown validation rule type {kind!r} in rule {name!r}")
+            missing = [param for param in RULE_PARAMETERS[kind] if param not in spec]
+            if missing:
+                raise ValueError(f"Validation rule {name!r} is missing {missing}")
+            names.add(name)
+        self.rules = rules
+        self.parse_date = parse_date or _parse_date
+
+    def validate(self, df: pd.DataFrame) -> ValidationResult:
+        """Evaluate every rule on `df`."""
+        context = _Context(df, self.parse_date)
+        masks, skipped = {}, []
+        for spec in self.rules:
+            columns = _rule_columns(spec)
+            if any(col not in df.columns for col in columns):
+                skipped.append(spec['name'])
+                continue
+            masks[spec['name']] = RULE_TYPES[spec['rule']](context, spec)
+        return ValidationResult(len(df), masks, skipped)
+
+
+class QuarantineWriter:
+    """
+    Appends invalid rows, with the rules they violate, to a CSV file.
+
+    The file is replaced by the first write of a writer, so one writer
+    collects the rows of every chunk of a run.
+    """
+
+    def __init__(self, path: str):
+        if os.path.splitext(path)[1].lower() != '.csv':
+            raise ValueError(f"Quarantine files are CSV: {path}")
+        self.path = path
+        self.rows_written = 0
+        self._started = False
+
+    def write(self, df: pd.DataFrame, result: ValidationResult) -> int:
+        """Append the invalid rows of `df`; returns the number written."""
+        if not result.invalid_rows:
+            return 0
+        rows = df[result.invalid].assign(**{VIOLATIONS_COLUMN: result.violation_labels()})
+        rows.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+        self.rows_written += len(rows)
+        return len(rows)
+
+
+def merge_reports(reports: List[Dict]) -> Dict:
+    """Combine the reports of the chunks or partitions of one input."""
+    merged = {'rows': 0, 'invalid_rows': 0, 'violations': {}, 'skipped': []}
+    for report in reports:
+        if not report:
+            continue
+        merged['rows'] += report['rows']
+        merged['invalid_rows'] += report['invalid_rows']
+        for name, count in report['violations'].items():
+            merged['violations'][name] = merged['violations'].get(name, 0) + count
+        merged['skipped'] += [name for name in report['skipped'] if name not in merged['skipped']]
+    return merged
+
+
+# ---------------------------------------------------------------------------
+# Rule types
+# ---------------------------------------------------------------------------
+
+class _Context:
+    """The validated frame, with parsed dates shared between rules."""
+
+    def __init__(self, df: pd.DataFrame, parse_date: Callable[[pd.Series, str], pd.Series]):
+        self.df = df
+        self._parse_date = parse_date
+        self._dates: Dict[str, pd.Series] = {}
+
+    def dates(self, col: str) -> pd.Series:
+        if col not in self._dates:
+            series = self.df[col]
+            if not pd.api.types.is_datetime64_any_dtype(series):
+                series = self._parse_date(series, col)
+            self._dates[col] = series
+        return self._dates[col]
+
+
+def _rule_columns(spec: Dict) -> List[str]:
+    if 'columns' in spec:
+        return list(spec['columns'])
+    if spec['rule'] == 'date_order':
+        return [spec['earlier'], spec['later']]
+    return [spec['column']]
+
+
+def _by_value(series: pd.Series, check: Callable[[pd.Index], np.ndarray]) -> np.ndarray:
+    """Evaluate `check` once per distinct value and broadcast it to the rows (missing -> False)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+        uniques = pd.Index(uniques)
+    lookup = np.append(np.asarray(check(uniques), dtype=bool), False)
+    return lookup[codes]
+
+
+@rule_type('required')
+def _check_required(context: _Context, spec: Dict) -> np.ndarray:
+    return context.df[spec['column']].isna().to_numpy()
+
+
+@rule_type('allowed')
+def _check_allowed(context: _Context, spec: Dict) -> np.ndarray:
+    allowed = list(spec['values'])
+    return _by_value(context.df[spec['column']], lambda values: ~values.isin(allowed))
+
+
+@rule_type('pattern')
+def _check_pattern(context: _Context, spec: Dict) -> np.ndarray:
+    pattern = spec['pattern']
+    return _by_value(
+        context.df[spec['column']],
+        lambda values: ~pd.Series(values.astype(str)).str.fullmatch(pattern).to_numpy(dtype=bool),
+    )
+
+
+@rule_type('range')
+def _check_range(context: _Context, spec: Dict) -> np.ndarray:
+    col = spec['column']
+    series = context.df[col]
+    is_date = pd.api.types.is_datetime64_any_dtype(series) or not pd.api.types.is_numeric_dtype(series)
+    if is_date:
+        series = context.dates(col)
+    low, high = spec.get('min'), spec.get('max')
+    convert = pd.Timestamp if is_date else float
+    mask = np.zeros(len(series), dtype=bool)
+    if low is not None:
+        mask |= (series < convert(low)).to_numpy(dtype=bool, na_value=False)
+    if high is not None:
+        mask |= (series > convert(high)).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+
+@rule_type('date')
+def _check_date(context: _Context, spec: Dict) -> np.ndarray:
+    col = spec['column']
+    return (context.df[col].notna() & context.dates(col).isna()).to_numpy()
+
+
+@rule_type('date_order')
+def _check_date_order(context: _Context, spec: Dict) -> np.ndarray:
+    earlier, later = context.dates(spec['earlier']), context.dates(spec['later'])
+    unit = spec.get('unit')
+    if unit:
+        earlier, later = earlier.dt.floor(unit), later.dt.floor(unit)
+    # NaT compares False, so rows missing either date pass
+    return (earlier > later).to_numpy()
+
+
+@rule_type('unique')
+def _check_unique(context: _Context, spec: Dict) -> np.ndarray:
+    keys = context.df[list(spec['columns'])]
+    # Rows missing part of the key are not duplicates of anything
+    complete = keys.notna().all(axis=1).to_numpy()
+    mask = np.zeros(len(keys), dtype=bool)
+    # The last row of a key is the one ingestion keeps; earlier rows are flagged
+    mask[complete] = keys[complete].duplicated(keep='last').to_numpy()
+    return mask
+
+
+def _parse_date(series: pd.Series, col: str) -> pd.Series:
+    codes, uniques = pd.factorize(series)
+    parsed = pd.to_datetime(pd.Series(uniques), errors='coerce').to_numpy()
+    lookup = np.append(parsed, np.datetime64('NaT'))
+    return pd.Series(lookup[codes], index=series.index)
@@ -0,0 +1,42 @@
+"""sync() must keep the fitted order of ordered categoricals."""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from category_registry import CategoryRegistry  # noqa: E402
+from preprocessing import HealthcarePreprocessor  # noqa: E402
+
+DATA = os.path.join(ROOT, 'data', 'synthetic_data.csv')
+
+
+def _extract() -> pd.DataFrame:
+    """The synthetic extract with booking times 0-120 days before each appointment."""
+    df = HealthcarePreprocessor().load_data(DATA)
+    lead = pd.to_timedelta(np.random.default_rng(0).integers(0, 120 * 24, len(df)), unit='h')
+    df['Booked_Date_Time'] = (pd.to_datetime(df['AppointmentDate'].astype(str)) - lead).dt.strftime('%Y-%m-%dT%H:%M:%S')
+    return df
+
+
+def test_sync_keeps_ordered_levels():
+    preprocessor = HealthcarePreprocessor()
+    preprocessor.fit(_extract())
+    ordered = ('age_band', 'leadtime_bucket')
+    levels = {col: list(preprocessor.category_levels[col]) for col in ordered}
+    before = preprocessor.transform(_extract())
+
+    CategoryRegistry().sync(preprocessor)
+    after = preprocessor.transform(_extract())
+
+    for col in ordered:
+        assert preprocessor.category_levels[col] == levels[col]
+        assert after[col].cat.ordered
+        assert after[col].cat.categories.tolist() == before[col].cat.categories.tolist()
+        for level in levels[col]:
+            assert ((after[col] < level) == (before[col] < level)).all()
+        assert (after[col].cat.codes == before[col].cat.codes).all()